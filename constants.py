@@ -47,5 +47,6 @@ DIAGONAL_DIRECTIONS = ["UP_LEFT","UP_RIGHT","DOWN_LEFT","DOWN_RIGHT"]
 TERMINATION_CODE = {
     "IDLE": 0,
     "BATTERY_DEAD": 1,
-    "GOAL_COMPLETE": 2
+    "GOAL_COMPLETE": 2,
+    "STEP_LIMIT": 3
 }
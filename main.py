@@ -1,7 +1,73 @@
 """
 Entry Point
+
+Usage: python main.py                 one run, plots shown in windows
+       python main.py --headless [--runs N] [--workers W] [--seed S] [--policy P] [--gif] [--report FOLDER]
+       python main.py --headless --agents N [--seed S]    one fleet run of N agents
+       python main.py --headless --map FILE [--seed S] [--policy P]    one run on an ASCII or image map
 """
-from src.runner import exec_runner
+import os
+import argparse
+
+def __run_headless__(args):
+    # no display: matplotlib (only loaded for --gif or --report) draws off screen
+    os.environ["MPLBACKEND"] = "Agg"
+
+    if args.agents > 1:
+        from src.fleet import run_fleet_simulation
+
+        sim_name, performance, meta_data = run_fleet_simulation(args.agents, seed=args.seed)
+        print(f"""Fleet {sim_name} of {meta_data["n_agents"]} agents completed in {meta_data["time_elapsed"]}s""")
+        for elem in performance["performance_metrics"]:
+            print(f"""{elem}:{performance["performance_metrics"][elem]}""")
+        return
+
+    if args.runs > 1:
+        from src.runner import exec_parallel_runner
+
+        records = exec_parallel_runner(n_runs=args.runs,
+                                       max_workers=args.workers,
+                                       seed=args.seed,
+                                       export_gif=args.gif,
+                                       policy=args.policy,
+                                       as_frame=args.report is not None)
+        if args.report is not None:
+            os.makedirs(args.report, exist_ok=True)
+            records.to_csv(os.path.join(args.report, "runs.csv"), index=False)
+        return
+
+    from src.simulation import run_simulation
+
+    sim_name, performance, meta_data = run_simulation(export_gif=args.gif, seed=args.seed, policy=args.policy, map_file=args.map)
+
+    print(f"""Simulation {sim_name} completed in {meta_data["time_elapsed"]}s""")
+    for elem in performance["performance_metrics"]:
+        print(f"""{elem}:{performance["performance_metrics"][elem]}""")
+
+    if args.report is not None:
+        from src.runner import plot_report
+        plot_report(meta_data, report_folder=args.report)
 
 if __name__ == "__main__":
-    exec_runner(export_gif=False)
+    parser = argparse.ArgumentParser(description="Run the vacuum cleaner simulation")
+    parser.add_argument("--headless", action="store_true", help="never open a window, plots only go to --report")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--policy", choices=["reflex", "goal"], default="reflex")
+    parser.add_argument("--gif", action="store_true", help="export the animation of every run")
+    parser.add_argument("--report", default=None, help="folder for the plots (one run) or runs.csv (several runs)")
+    parser.add_argument("--agents", type=int, default=1, help="agents cleaning together, with --headless")
+    parser.add_argument("--map", default=None, help="ASCII or image map file to run on, with --headless")
+    args = parser.parse_args()
+
+    if args.headless:
+        __run_headless__(args)
+    else:
+        from src.runner import exec_runner
+        exec_runner(export_gif=args.gif,
+                    n_runs=args.runs,
+                    max_workers=args.workers,
+                    seed=args.seed,
+                    policy=args.policy,
+                    report_folder=args.report)
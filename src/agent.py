@@ -3,152 +3,384 @@ Module for Agent programs
 """
 import random
 from collections import deque
+import numpy as np
 from src.common import euclidean_distance
-from src.environment import Environment
+from src.buffers import GrowableArray, CellSetView, NULL_POOL
+from src.recorder import StepRecorder
+from src.profiling import NULL_TIMER
+from src.planner import DistanceField
+from src.environment import Environment, DIRECTION_NAMES, NO_DIRECTION, get_direction_name
 from constants import (LOCATION_MARKERS,
                            DIRECTIONS,
                            STRAIGHT_DIRECTIONS,
                            DIAGONAL_DIRECTIONS,
                            ENERGY_CONSUMPTION)
 
+# a sensed neighbour is looked up as (marker | visited flag) in SENSE_TABLE
+VISITED_FLAG = 0x10
+SENSE_OBSTACLE = -1
+
+def __build_sense_table__():
+    # dirt > explored dirt > unexplored clean > explored clean > not a move
+    table = np.zeros(256, dtype=np.int8)
+    for visited in (0, VISITED_FLAG):
+        unexplored = 0 if visited else 1
+        table[LOCATION_MARKERS["DIRT"] | visited] = 3 + unexplored
+        table[LOCATION_MARKERS["CLEAN"] | visited] = 1 + unexplored
+        table[LOCATION_MARKERS["OBSTACLE"] | visited] = SENSE_OBSTACLE
+    return table
+
+SENSE_TABLE = __build_sense_table__()
+SENSE_DIRT = 3
+
 class Agent:
+    """
+    Reflex cleaning agent.
+
+    State is kept compact for long runs: integer position, one byte per grid
+    cell for the visited, detected-obstacle and cleaned maps, and typed
+    growable arrays for the per-step series. The old attributes
+    (current_position, path_followed, visited_locations, ...) are read-only
+    properties over that state. With a StepRecorder the path is read from
+    its x/y columns (which spill to disk) instead of being kept twice. With
+    `track_path` off only the step count is kept, for runs that only need
+    the final metrics.
+    """
+    __slots__ = ("environment",
+                 "rng",
+                 "grid_height",
+                 "initial_x",
+                 "initial_y",
+                 "x",
+                 "y",
+                 "target_location",
+                 "visited_map",
+                 "obstacle_map",
+                 "cleaned_map",
+                 "path",
+                 "track_path",
+                 "steps_taken",
+                 "move_directions",
+                 "step_energy",
+                 "battery",
+                 "clean_steps",
+                 "recorder",
+                 "timer",
+                 "energy_consumption",
+                 "initial_energy",
+                 "current_energy",
+                 "current_steps_to_clean",
+                 "last_direction",
+                 "last_step_energy",
+                 "last_steps_to_clean")
+
     def __init__(self,
                  environment: Environment,
                  initial_position: dict = {"x":0,"y":0},
-                 initial_energy: int =  1000):
+                 initial_energy: int =  1000,
+                 rng: random.Random = None,
+                 recorder: StepRecorder = None,
+                 timer = None,
+                 energy_consumption: dict = None,
+                 track_path: bool = True,
+                 buffers = NULL_POOL):
         # environment
         self.environment = environment
+        self.grid_height = environment.grid_size["y"]
+        grid_cells = environment.grid_size["x"]*environment.grid_size["y"]
+
+        # random.Random for seeded runs, the global random state otherwise
+        self.rng = rng if rng is not None else random
 
-        # initial position of agent
-        self.initial_position = {
-            "x": initial_position["x"],
-            "y": initial_position["y"]
-        }
-        
-        # current position of agent
-        self.current_position = {}
-        self.current_position["x"]= initial_position["x"]
-        self.current_position["y"]= initial_position["y"]
+        # initial and current position of agent
+        self.initial_x = initial_position["x"]
+        self.initial_y = initial_position["y"]
+        self.x = self.initial_x
+        self.y = self.initial_y
 
         # next target tile
         self.target_location = {"x":None,"y":None}
 
-        # visited locations
-        self.visited_locations = set()
-        self.obstacles_detected = set()
-        self.path_followed = []
+        # visited cells hold VISITED_FLAG so they can be OR-ed into the sensed markers
+        self.visited_map = buffers.__take__("agent.visited", (grid_cells,), np.uint8)
+        self.obstacle_map = buffers.__take__("agent.obstacles", (grid_cells,), bool)
+        self.cleaned_map = buffers.__take__("agent.cleaned", (grid_cells,), bool)
 
-        self.visited_locations.add((self.current_position["x"],self.current_position["y"]))
-        self.path_followed.append((self.current_position["x"],self.current_position["y"]))
+        # per step series, the telemetry goes to `recorder` instead when one is given
+        self.recorder = recorder
+        self.path = GrowableArray(np.int32, row_shape=(2,))
+        self.move_directions = GrowableArray(np.int8)
+        self.step_energy = GrowableArray(np.float64)
+        self.battery = GrowableArray(np.float64)
+        self.clean_steps = GrowableArray(np.int64)
+
+        # src.profiling timer charged with the sense, decide and move phases of every step
+        self.timer = timer if timer is not None else NULL_TIMER
+
+        self.visited_map[self.x*self.grid_height + self.y] = VISITED_FLAG
+        # a StepRecorder has the path in its x/y columns already
+        self.track_path = track_path and not isinstance(recorder, StepRecorder)
+        self.steps_taken = 0
+        if self.track_path:
+            self.path.__append__((self.x, self.y))
 
         #energy
+        self.energy_consumption = energy_consumption if energy_consumption is not None else ENERGY_CONSUMPTION
         self.initial_energy = initial_energy
         self.current_energy = initial_energy
 
-        self.moves_made = []
-        self.step_energy_expense = []
-        self.battery_left = []
-
         # track steps until dirt cleaned
-        self.steps_to_clean = []
         self.current_steps_to_clean = 0
 
-        self.cleaned_dirt_spots = set()
+        # what the last step did, read by the event stream of src.simulation
+        self.last_direction = None
+        self.last_step_energy = 0.0
+        self.last_steps_to_clean = 0
+
+    @property
+    def initial_position(self)->dict:
+        return {"x": self.initial_x, "y": self.initial_y}
+
+    @property
+    def current_position(self)->dict:
+        return {"x": self.x, "y": self.y}
+
+    @property
+    def visited_locations(self)->CellSetView:
+        return CellSetView(self.visited_map, self.grid_height)
+
+    @property
+    def obstacles_detected(self)->CellSetView:
+        # each obstacle cell once, however many directions it was seen from
+        return CellSetView(self.obstacle_map, self.grid_height)
+
+    @property
+    def cleaned_dirt_spots(self)->CellSetView:
+        return CellSetView(self.cleaned_map, self.grid_height)
+
+    @property
+    def path_followed(self)->np.ndarray:
+        # (steps + 1, 2) array of (x, y)
+        if isinstance(self.recorder, StepRecorder):
+            return self.recorder.__path__((self.initial_x, self.initial_y))
+        return self.path.__view__()
+
+    @property
+    def moves_made(self):
+        # (x, y, direction) per step, rebuilt from the path and direction codes
+        if self.recorder is not None:
+            return self.recorder.__moves__()
+        return [(x, y, get_direction_name(d))
+                for (x, y), d in zip(self.path.__view__()[1:].tolist(), self.move_directions.__view__().tolist())]
+
+    @property
+    def step_energy_expense(self):
+        if self.recorder is not None:
+            return self.recorder.step_energy
+        return self.step_energy.__view__()
+
+    @property
+    def battery_left(self):
+        if self.recorder is not None:
+            return self.recorder.battery
+        return self.battery.__view__()
+
+    @property
+    def steps_to_clean(self):
+        if self.recorder is not None:
+            return self.recorder.steps_to_clean
+        return self.clean_steps.__view__()
 
     def __step__(self, verbose=False):
-        temp_current = (self.current_position["x"],self.current_position["y"])
-
-        dirty_tiles = []
-        clean_tiles = []
-        obstacle_tiles = []
-        for direction,(dx,dy) in DIRECTIONS.items():
-            if dx>0:
-                nx = min(self.environment.grid_size["x"]-1,temp_current[0]+dx)
-            else:
-                nx = max(0, temp_current[0]+dx)
-            if dy>0:
-                ny = min(self.environment.grid_size["y"]-1,temp_current[1]+dy)
-            else:
-                ny = max(0, temp_current[1]+dy)
-
-            if self.environment.grid_descriptor.grid[nx][ny] == LOCATION_MARKERS["DIRT"]:
-                dirty_tiles.append((nx,ny, direction))
-            elif self.environment.grid_descriptor.grid[nx][ny] == LOCATION_MARKERS["CLEAN"]:
-                clean_tiles.append((nx,ny, direction))
-            elif self.environment.grid_descriptor.grid[nx][ny] == LOCATION_MARKERS["OBSTACLE"]:
-                obstacle_tiles.append((nx,ny, direction))
-                self.obstacles_detected.add((nx,ny, direction))
-
-        # Prioritize unexplored tiles over explored ones
-        unexplored_dirty_tiles = [tile for tile in dirty_tiles if (tile[0], tile[1]) not in self.visited_locations]
-        unexplored_clean_tiles = [tile for tile in clean_tiles if (tile[0], tile[1]) not in self.visited_locations]
-
-        dirt_found = False
-
-        if unexplored_dirty_tiles:
-            # Choose a random unexplored dirty location
-            dest = random.choice(unexplored_dirty_tiles)
-            dirt_found = True
-        elif dirty_tiles:
-            # Fallback to explored dirty tiles
-            dest = random.choice(dirty_tiles)
-            dirt_found = True
-        elif unexplored_clean_tiles:
-            # Choose a random unexplored clean location
-            dest = random.choice(unexplored_clean_tiles)
-        elif clean_tiles:
-            # Fallback to explored clean tiles
-            dest = random.choice(clean_tiles)
-        else:
-            # No valid move, remain in place (you can adjust this logic)
-            dest = temp_current
+        neighbors, scores = self.__sense_neighbors__()
+        self.timer.__lap__("sense")
+        dest, direction, dirt_found = self.__decide__(neighbors, scores)
+        self.timer.__lap__("decide")
+        dirt_found = self.__move__(dest, direction, dirt_found, verbose)
+        self.timer.__lap__("move")
+        return dirt_found
 
-        # remove agent from prev location
-        self.environment.grid_descriptor.grid[self.current_position["x"]][self.current_position["y"]] = LOCATION_MARKERS["CLEAN"]
+    def __checkpoint__(self)->dict:
+        # position, energy, maps and series; the rng is checkpointed by its owner
+        return {"position": np.array([self.x, self.y]),
+                "current_energy": np.float64(self.current_energy),
+                "current_steps_to_clean": np.int64(self.current_steps_to_clean),
+                "steps_taken": np.int64(self.steps_taken),
+                "visited_map": self.visited_map,
+                "obstacle_map": self.obstacle_map,
+                "cleaned_map": self.cleaned_map,
+                "path": self.path.__view__(),
+                "move_directions": self.move_directions.__view__(),
+                "step_energy": self.step_energy.__view__(),
+                "battery": self.battery.__view__(),
+                "clean_steps": self.clean_steps.__view__()}
+
+    def __restore__(self, state:dict):
+        self.x, self.y = state["position"].tolist()
+        self.current_energy = float(state["current_energy"])
+        self.current_steps_to_clean = int(state["current_steps_to_clean"])
+        self.steps_taken = int(state["steps_taken"])
+        self.visited_map[:] = state["visited_map"]
+        self.obstacle_map[:] = state["obstacle_map"]
+        self.cleaned_map[:] = state["cleaned_map"]
+        self.path.__load__(state["path"])
+        self.move_directions.__load__(state["move_directions"])
+        self.step_energy.__load__(state["step_energy"])
+        self.battery.__load__(state["battery"])
+        self.clean_steps.__load__(state["clean_steps"])
+
+    def __has_goal__(self)->bool:
+        # whether the last step headed for dirt the agent knows about, the reflex agent never does
+        return False
+
+    def __sense_neighbors__(self):
+        # one gather for the whole neighbourhood, classified by table lookup;
+        # obstacles in sight are recorded on the way
+        neighbors, markers = self.environment.__sense__(self.x, self.y)
+        scores = SENSE_TABLE[markers | self.visited_map[neighbors]].tolist()
+        for d, score in enumerate(scores):
+            if score == SENSE_OBSTACLE:
+                self.obstacle_map[neighbors[d]] = True
+        return neighbors, scores
+
+    def __decide__(self, neighbors, scores):
+        return self.__choose_reflex__(neighbors, scores)
+
+    def __choose_reflex__(self, neighbors, scores):
+        best = 0
+        candidates = []
+        for d, score in enumerate(scores):
+            if score > best:
+                best = score
+                candidates = [d]
+            elif score == best and score > 0:
+                candidates.append(d)
+
+        if candidates:
+            # Prioritize dirt over clean and unexplored over explored, then pick randomly
+            d = self.rng.choice(candidates)
+            nx, ny = divmod(int(neighbors[d]), self.grid_height)
+            return (nx, ny, DIRECTION_NAMES[d]), d, best >= SENSE_DIRT
+
+        # No valid move, remain in place
+        return (self.x, self.y, None), None, False
+
+    def __move__(self, dest, direction, dirt_found, verbose=False):
+        grid_height = self.grid_height
 
-        # move to the destination
         if verbose:
             print("moving to:", dest)
-        self.current_position["x"] = dest[0]
-        self.current_position["y"] = dest[1]
-        self.moves_made.append(dest)
-        self.visited_locations.add((self.current_position["x"],self.current_position["y"]))
-        self.path_followed.append((self.current_position["x"],self.current_position["y"]))
 
-        # move to new location
-        self.environment.grid_descriptor.grid[self.current_position["x"]][self.current_position["y"]] = LOCATION_MARKERS["AGENT"]
+        if direction is not None:
+            # remove agent from prev location
+            self.environment.__set_cell__(self.x, self.y, LOCATION_MARKERS["CLEAN"])
+
+            # move to the destination
+            self.x = dest[0]
+            self.y = dest[1]
+            self.visited_map[self.x*grid_height + self.y] = VISITED_FLAG
 
-        # Energy consumption calculations: Movement
-        if dest[2] in STRAIGHT_DIRECTIONS:
-            movement_energy = ENERGY_CONSUMPTION["MOVE_STRAIGHT"]
-        elif dest[2] in DIAGONAL_DIRECTIONS:
-            movement_energy = ENERGY_CONSUMPTION["MOVE_DIAGONAL"]
+            # move to new location
+            self.environment.__set_cell__(self.x, self.y, LOCATION_MARKERS["AGENT"])
+
+        self.steps_taken += 1
+        if self.track_path:
+            self.path.__append__((self.x, self.y))
 
         # Energy consumption calculations: Standard scanning cost
-        scan_energy = ENERGY_CONSUMPTION["SCAN"]
+        scan_energy = self.energy_consumption["SCAN"]
 
-        # Energy consumption calculations: Cleaning cost
-        # Generating random number for spot cleaning efforts
-        cleaning_energy = round(ENERGY_CONSUMPTION["CLEAN"]*round(random.uniform(1,3),2),2)
+        if direction is None:
+            # boxed in: the agent stays put and pays the scan only, as a waiting agent of src.fleet does
+            step_energy = scan_energy
+        else:
+            # Energy consumption calculations: Movement
+            if dest[2] in STRAIGHT_DIRECTIONS:
+                movement_energy = self.energy_consumption["MOVE_STRAIGHT"]
+            elif dest[2] in DIAGONAL_DIRECTIONS:
+                movement_energy = self.energy_consumption["MOVE_DIAGONAL"]
 
-        step_energy = movement_energy + scan_energy + cleaning_energy
+            # Energy consumption calculations: Cleaning cost
+            # Generating random number for spot cleaning efforts
+            cleaning_energy = round(self.energy_consumption["CLEAN"]*round(self.rng.uniform(1,3),2),2)
 
-        self.step_energy_expense.append(round(step_energy,2))
+            step_energy = movement_energy + scan_energy + cleaning_energy
 
         if self.current_energy - step_energy <= 0:
             self.current_energy = 0
         else:
             self.current_energy -= step_energy
 
-        self.battery_left.append(round(self.current_energy,2))
+        self.last_direction = direction
+        self.last_step_energy = round(step_energy,2)
+        direction_code = direction if direction is not None else NO_DIRECTION
+        if self.recorder is not None:
+            self.recorder.__record_step__(self.x, self.y, direction_code, self.last_step_energy, round(self.current_energy,2))
+        else:
+            self.move_directions.__append__(direction_code)
+            self.step_energy.__append__(self.last_step_energy)
+            self.battery.__append__(round(self.current_energy,2))
 
         # Track the steps taken until dirt is cleaned
         if dirt_found:
-            cleaned_location = (self.current_position["x"], self.current_position["y"])
-            self.cleaned_dirt_spots.add(cleaned_location)
-            self.steps_to_clean.append(self.current_steps_to_clean)
+            self.cleaned_map[self.x*grid_height + self.y] = True
+            self.last_steps_to_clean = self.current_steps_to_clean
+            if self.recorder is not None:
+                self.recorder.__record_clean__(self.current_steps_to_clean)
+            else:
+                self.clean_steps.__append__(self.current_steps_to_clean)
             self.current_steps_to_clean = 0
         else:
             self.current_steps_to_clean +=1
 
         return dirt_found
+
+class GoalDirectedAgent(Agent):
+    """
+    Agent that heads for the nearest reachable dirt.
+
+    Every step it takes the cheapest move down a DistanceField (move cost
+    plus the cost from there to dirt, ties broken at random), so it never
+    wanders while dirt is reachable. With no reachable dirt left it falls
+    back to the reflex policy of Agent.
+    """
+    __slots__ = ("distance_field", "following_field")
+
+    def __init__(self,
+                 environment: Environment,
+                 initial_position: dict = {"x":0,"y":0},
+                 initial_energy: int =  1000,
+                 rng: random.Random = None,
+                 recorder: StepRecorder = None,
+                 timer = None,
+                 energy_consumption: dict = None,
+                 track_path: bool = True,
+                 buffers = NULL_POOL,
+                 distance_field: DistanceField = None):
+        super().__init__(environment=environment,
+                         initial_position=initial_position,
+                         initial_energy=initial_energy,
+                         rng=rng,
+                         recorder=recorder,
+                         timer=timer,
+                         energy_consumption=energy_consumption,
+                         track_path=track_path,
+                         buffers=buffers)
+        self.distance_field = (distance_field if distance_field is not None
+                               else DistanceField(environment, energy_consumption=self.energy_consumption, buffers=buffers))
+        self.following_field = False
+
+    def __has_goal__(self)->bool:
+        return self.following_field
+
+    def __decide__(self, neighbors, scores):
+        moves = self.distance_field.__get_moves__(self.x, self.y)
+        best = min((cost for _, _, cost in moves), default=float("inf"))
+        self.following_field = best != float("inf")
+        if not self.following_field:
+            return self.__choose_reflex__(neighbors, scores)
+
+        d, cell, _ = self.rng.choice([move for move in moves if move[2] == best])
+        nx, ny = divmod(cell, self.grid_height)
+        dirt_found = self.environment.flat_grid[cell] == LOCATION_MARKERS["DIRT"]
+        return (nx, ny, DIRECTION_NAMES[d]), d, bool(dirt_found)
@@ -0,0 +1,219 @@
+"""
+Module for running many independent simulations in lockstep with NumPy
+"""
+import numpy as np
+from src.metrics import compute_metrics
+from src.environment import (DIRECTION_NAMES,
+                             DIRECTION_DX,
+                             DIRECTION_DY,
+                             DIRECTION_MOVE_ENERGY)
+from constants import (LOCATION_MARKERS,
+                       ENERGY_CONSUMPTION,
+                       POPULATION_DENSITY,
+                       INITIAL_ENERGY,
+                       IDLE_LIMIT,
+                       TERMINATION_CODE,
+                       GRID_WIDTH,
+                       GRID_HEIGHT)
+
+# cells hold the location marker in the low bits and a visited flag on top
+MARKER_MASK = 0x0F
+VISITED_BIT = 0x10
+
+def __build_score_table__():
+    # dirt > explored dirt > unexplored clean > explored clean > not a move
+    table = np.zeros(256, dtype=np.uint8)
+    for value in range(256):
+        marker = value & MARKER_MASK
+        unexplored = 0 if value & VISITED_BIT else 1
+        if marker == LOCATION_MARKERS["DIRT"]:
+            table[value] = 3 + unexplored
+        elif marker == LOCATION_MARKERS["CLEAN"]:
+            table[value] = 1 + unexplored
+    return table
+
+SCORE_TABLE = __build_score_table__()
+
+class BatchSimulation:
+    """
+    Steps N independent episodes at once.
+
+    The grids are stacked in one (N, W, H) array (stored flat) and the agent state
+    (position, energy, idle counter, visited cells) is held as vectors,
+    so every step is a fixed number of NumPy operations regardless of N.
+    Sensing, the dirt > unexplored > clean priority, the energy model and
+    the termination codes follow Agent.__step__ and run_simulation.
+    """
+    def __init__(self,
+                 n_episodes:int,
+                 grid_size:dict = {"x":GRID_WIDTH,"y":GRID_HEIGHT},
+                 population_density:dict = POPULATION_DENSITY,
+                 initial_energy:float = INITIAL_ENERGY,
+                 idle_limit:int = IDLE_LIMIT,
+                 seed:int = None):
+        self.n_episodes = n_episodes
+        self.grid_size = {"x":grid_size["x"],"y":grid_size["y"]}
+        self.population_density = population_density
+        self.initial_energy = initial_energy
+        self.idle_limit = idle_limit
+        self.rng = np.random.default_rng(seed)
+
+        n, w, h = n_episodes, grid_size["x"], grid_size["y"]
+        self.cells_per_grid = w*h
+        # all grids are flat, cell (n, x, y) lives at n*W*H + x*H + y
+        self.grids = np.zeros(n*w*h, dtype=np.uint8)
+        # cells the agent has scanned its neighbourhood from
+        self.sensed = np.zeros(n*w*h, dtype=bool)
+
+        # clamped neighbour of every cell in every direction, as in Agent.__step__
+        xs, ys = np.meshgrid(np.arange(w), np.arange(h), indexing="ij")
+        nx = np.clip(xs.reshape(-1, 1) + DIRECTION_DX, 0, w-1)
+        ny = np.clip(ys.reshape(-1, 1) + DIRECTION_DY, 0, h-1)
+        self.neighbor_table = np.ascontiguousarray(nx*h + ny)
+
+        self.offset = np.arange(n, dtype=np.int64) * self.cells_per_grid
+        self.position = np.zeros(n, dtype=np.int64)
+        self.energy = np.full(n, float(initial_energy))
+        self.idle_count = np.zeros(n, dtype=np.int64)
+        self.steps = np.zeros(n, dtype=np.int64)
+        self.dirt_count = np.zeros(n, dtype=np.int64)
+        self.termination_code = np.full(n, -1, dtype=np.int64)
+
+        self.initial_dirt_count = 0
+        self.initial_obstacle_count = 0
+        self.start_on_obstacle = np.zeros(n, dtype=bool)
+
+    def __populate_grids__(self):
+        n, total_locations = self.n_episodes, self.cells_per_grid
+        max_obstacles = int(total_locations * self.population_density["OBSTACLES"])
+        max_dirt = int(total_locations * self.population_density["DIRT"])
+
+        # an independent shuffle of every grid, obstacles first then dirt
+        order = self.rng.random((n, total_locations)).argsort(axis=1)
+        order += self.offset[:, None]
+        self.grids[order[:, :max_obstacles]] = LOCATION_MARKERS["OBSTACLE"]
+        self.grids[order[:, max_obstacles:max_obstacles+max_dirt]] = LOCATION_MARKERS["DIRT"]
+
+        self.initial_obstacle_count = max_obstacles
+        self.initial_dirt_count = max_dirt
+        self.dirt_count[:] = max_dirt
+        self.start_on_obstacle = self.grids[self.offset] == LOCATION_MARKERS["OBSTACLE"]
+        self.grids[self.offset] |= VISITED_BIT
+
+    def __check_termination__(self):
+        active = self.termination_code == -1
+        goal = active & (self.dirt_count == 0)
+        self.termination_code[goal] = TERMINATION_CODE["GOAL_COMPLETE"]
+        active &= ~goal
+        idle = active & (self.idle_count >= self.idle_limit)
+        self.termination_code[idle] = TERMINATION_CODE["IDLE"]
+        active &= ~idle
+        dead = active & (self.energy <= 0)
+        self.termination_code[dead] = TERMINATION_CODE["BATTERY_DEAD"]
+        active &= ~dead
+        return np.flatnonzero(active)
+
+    def __step__(self, active:np.ndarray):
+        offset = self.offset[active]
+        current = offset + self.position[active]
+        rows = np.arange(len(active))
+
+        # sense all 8 neighbours in one gather
+        neighbors = np.take(self.neighbor_table, self.position[active], axis=0)
+        neighbors += offset[:, None]
+        score = np.take(SCORE_TABLE, np.take(self.grids, neighbors))
+        self.sensed[current] = True
+
+        # highest priority class wins, random jitter picks uniformly inside it
+        direction = (score + self.rng.random(score.shape, dtype=np.float32) * np.float32(0.5)).argmax(axis=1)
+        best = score[rows, direction]
+        can_move = best > 0
+        dirt_found = best >= 3
+
+        # remove agent from prev location, then place it on the destination
+        # (an agent boxed in by obstacles stays put and leaves its cell as it is, as Agent.__move__ does)
+        movers = active[can_move]
+        current = current[can_move]
+        dest = neighbors[rows, direction][can_move]
+        self.dirt_count[movers] -= (self.grids[current] & MARKER_MASK) == LOCATION_MARKERS["DIRT"]
+        self.grids[current] = LOCATION_MARKERS["CLEAN"] | VISITED_BIT
+        self.dirt_count[movers] -= (self.grids[dest] & MARKER_MASK) == LOCATION_MARKERS["DIRT"]
+        self.grids[dest] = LOCATION_MARKERS["AGENT"] | VISITED_BIT
+        self.position[movers] = dest - offset[can_move]
+        self.steps[active] += 1
+
+        # energy model: movement + scan + randomised cleaning effort,
+        # a boxed-in agent only pays the scan
+        movement_energy = np.where(can_move, np.take(DIRECTION_MOVE_ENERGY, direction), 0)
+        cleaning_energy = np.round(ENERGY_CONSUMPTION["CLEAN"] * np.round(self.rng.uniform(1, 3, len(active)), 2), 2)
+        cleaning_energy[~can_move] = 0
+        step_energy = movement_energy + ENERGY_CONSUMPTION["SCAN"] + cleaning_energy
+        remaining = self.energy[active] - step_energy
+        self.energy[active] = np.where(remaining <= 0, 0, remaining)
+
+        self.idle_count[active] = np.where(dirt_found, 0, self.idle_count[active] + 1)
+
+    def __run__(self):
+        self.__populate_grids__()
+        while True:
+            active = self.__check_termination__()
+            if len(active) == 0:
+                break
+            self.__step__(active)
+
+    def __count_obstacles_detected__(self):
+        """
+        Rebuilds len(Agent.obstacles_detected) for every episode.
+
+        Obstacles never move, so the detected obstacles are exactly the
+        obstacle neighbours of every cell the agent sensed from. The only
+        exception is a start cell that began as an obstacle: it is seen from
+        itself on the first step and cleared once the agent leaves it.
+        """
+        n = self.n_episodes
+        sensed = np.flatnonzero(self.sensed)
+        sensed_offset = sensed - sensed % self.cells_per_grid
+        sensed_neighbors = np.take(self.neighbor_table, sensed - sensed_offset, axis=0)
+        sensed_neighbors += sensed_offset[:, None]
+
+        looked_at = np.zeros(len(self.grids), dtype=bool)
+        looked_at[sensed_neighbors.reshape(-1)] = True
+        looked_at &= (self.grids & MARKER_MASK) == LOCATION_MARKERS["OBSTACLE"]
+        detected = looked_at.reshape(n, -1).sum(axis=1, dtype=np.int64)
+
+        # still an obstacle when the agent never left it, then it was counted above
+        start_cleared = (self.grids[self.offset] & MARKER_MASK) != LOCATION_MARKERS["OBSTACLE"]
+        detected += self.start_on_obstacle & start_cleared & (self.steps > 0)
+        return detected
+
+    def __evaluate__(self)->list:
+        unique_visited = ((self.grids & VISITED_BIT) != 0).reshape(self.n_episodes, -1).sum(axis=1)
+        obstacles_detected = self.__count_obstacles_detected__()
+
+        performance = []
+        for i in range(self.n_episodes):
+            # an episode that cleaned nothing gets None for the per-spot energy, as evaluate_simulation does
+            performance.append(compute_metrics(initial_dirt_count=self.initial_dirt_count,
+                                               final_dirt_count=int(self.dirt_count[i]),
+                                               total_steps_taken=int(self.steps[i]) + 1,
+                                               unique_locations_visited=int(unique_visited[i]),
+                                               total_obstacles=self.initial_obstacle_count,
+                                               total_obstacles_detected=int(obstacles_detected[i]),
+                                               initial_energy=self.initial_energy,
+                                               current_energy=float(self.energy[i])))
+        return performance
+
+def run_batch_simulation(n_episodes:int,
+                         grid_size:dict = {"x":GRID_WIDTH,"y":GRID_HEIGHT},
+                         population_density:dict = POPULATION_DENSITY,
+                         initial_energy:float = INITIAL_ENERGY,
+                         idle_limit:int = IDLE_LIMIT,
+                         seed:int = None):
+    batch = BatchSimulation(n_episodes=n_episodes,
+                            grid_size=grid_size,
+                            population_density=population_density,
+                            initial_energy=initial_energy,
+                            idle_limit=idle_limit,
+                            seed=seed)
+    batch.__run__()
+    return batch.__evaluate__(), batch.termination_code.tolist()
@@ -0,0 +1,198 @@
+"""
+Module for benchmarking simulation throughput
+
+Usage: python -m src.benchmark run <output.json> [--sizes N ...] [--policies P ...] [--seeds S ...]
+       python -m src.benchmark compare <baseline.json> <current.json> [--tolerance T]
+"""
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import multiprocessing
+import numpy as np
+from src.simulation import run_simulation
+from src.environment import Environment
+from constants import POPULATION_DENSITY
+
+BENCHMARK_GRID_SIZES = (10, 30, 100, 300, 1000, 2000)
+BENCHMARK_DENSITIES = {
+    "default": POPULATION_DENSITY,
+    "sparse": {"OBSTACLES": 0.05, "DIRT": 0.01}
+}
+BENCHMARK_POLICIES = ("reflex", "goal")
+BENCHMARK_SEEDS = (0, 1, 2)
+
+# frames are only rendered up to this grid side, GridRenderer draws one patch per dirt cell
+RENDER_MAX_SIZE = 100
+RENDER_FRAMES = 50
+
+# whether a larger value of a metric is better, compare flags moves the other way
+BENCHMARK_METRICS = {
+    "steps_per_sec": True,
+    "setup_time": False,
+    "peak_rss_mb": False,
+    "render_fps": True
+}
+
+def run_benchmarks(grid_sizes:tuple = BENCHMARK_GRID_SIZES,
+                   densities:dict = BENCHMARK_DENSITIES,
+                   policies:tuple = BENCHMARK_POLICIES,
+                   seeds:tuple = BENCHMARK_SEEDS,
+                   output_file:str = None)->dict:
+    """
+    Runs every grid size x density x policy case once per seed and keeps
+    the median of every metric over the seeds.
+
+    Every run gets a fresh process, so peak RSS belongs to that run alone,
+    and runs go one at a time so they do not compete for the CPU.
+    """
+    cases = [{"grid_size": size, "density": density, "policy": policy}
+             for size in grid_sizes for density in densities for policy in policies]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        for case in cases:
+            runs = [pool.apply(__benchmark_run__, (case["grid_size"], densities[case["density"]], case["policy"], seed))
+                    for seed in seeds]
+            result = dict(case, name=f"""{case["grid_size"]}x{case["grid_size"]}/{case["density"]}/{case["policy"]}""")
+            for metric in BENCHMARK_METRICS:
+                values = [run[metric] for run in runs if run[metric] is not None]
+                result[metric] = float(np.median(values)) if values else None
+            result["steps"] = int(np.median([run["steps"] for run in runs]))
+            results.append(result)
+            print(__format_result__(result))
+
+    benchmark = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "platform": platform.platform(),
+                    "processor": platform.processor()},
+        "seeds": list(seeds),
+        "densities": densities,
+        "results": results
+    }
+    if output_file is not None:
+        with open(output_file, "w") as f:
+            json.dump(benchmark, f, indent=2)
+    return benchmark
+
+def __benchmark_run__(size:int, population_density:dict, policy:str, seed:int)->dict:
+    # one seeded run in a worker process, the simulation's own prints are swallowed
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, _, meta_data = run_simulation(seed=seed,
+                                         policy=policy,
+                                         grid_size={"x": size, "y": size},
+                                         population_density=population_density)
+
+    steps = meta_data["iterations"]
+    run = {
+        "steps": steps,
+        "steps_per_sec": steps / meta_data["loop_time"] if meta_data["loop_time"] > 0 else None,
+        "setup_time": meta_data["setup_time"],
+        "render_fps": None,
+        # read before rendering, matplotlib and the frames would count as the simulation's memory
+        "peak_rss_mb": __peak_rss_mb__()
+    }
+
+    if size <= RENDER_MAX_SIZE and steps > 0:
+        run["render_fps"] = __render_fps__(size, population_density, seed, meta_data["moves_made"])
+    return run
+
+def __render_fps__(size:int, population_density:dict, seed:int, moves_made)->float:
+    # same seed, same layout: rebuild the initial grid and render the first frames of the path
+    from src.visualization import GridRenderer
+
+    environ = Environment(rng=np.random.RandomState(seed))
+    environ.__generate_environment__(grid_size={"x": size, "y": size})
+    environ.__populate_grid__(population_density)
+
+    path = [(0, 0)] + [(x, y) for x, y, _ in moves_made[:RENDER_FRAMES]]
+    start_time = time.perf_counter()
+    renderer = GridRenderer(grid_shape=environ.grid_descriptor.grid.shape,
+                            obstacles=environ.obstacles,
+                            dirt=environ.dirty_locations)
+    for iteration in range(1, len(path)):
+        renderer.__update__(path[:iteration + 1])
+        renderer.__get_frame__()
+    return (len(path) - 1) / (time.perf_counter() - start_time)
+
+def __peak_rss_mb__():
+    try:
+        import resource
+    except ImportError:
+        # no getrusage on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def compare_benchmarks(baseline_file:str, current_file:str, tolerance:float = 0.1)->list:
+    """
+    Compares two benchmark files case by case and returns the regressions:
+    (case name, metric, baseline, current) for every metric that moved the
+    wrong way by more than `tolerance` (a fraction of the baseline).
+    """
+    with open(baseline_file) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    with open(current_file) as f:
+        current = {result["name"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    for name in baseline:
+        if name not in current:
+            continue
+        for metric, higher_is_better in BENCHMARK_METRICS.items():
+            before, after = baseline[name].get(metric), current[name].get(metric)
+            if before is None or after is None:
+                continue
+            if higher_is_better:
+                regressed = after < before * (1 - tolerance)
+            else:
+                regressed = after > before * (1 + tolerance)
+            if regressed:
+                regressions.append((name, metric, before, after))
+    return regressions
+
+def __format_result__(result:dict)->str:
+    cells = [f"""{result["name"]:<28}"""]
+    for metric in BENCHMARK_METRICS:
+        value = result[metric]
+        cells.append(f"""{metric}={'-' if value is None else round(value, 3)}""")
+    return "  ".join(cells)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark simulation throughput")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark suite and write a JSON baseline")
+    run_parser.add_argument("output_file")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCHMARK_GRID_SIZES))
+    run_parser.add_argument("--densities", nargs="+", choices=list(BENCHMARK_DENSITIES), default=list(BENCHMARK_DENSITIES))
+    run_parser.add_argument("--policies", nargs="+", default=list(BENCHMARK_POLICIES))
+    run_parser.add_argument("--seeds", type=int, nargs="+", default=list(BENCHMARK_SEEDS))
+
+    compare_parser = commands.add_parser("compare", help="flag regressions of a run against a baseline")
+    compare_parser.add_argument("baseline_file")
+    compare_parser.add_argument("current_file")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_benchmarks(grid_sizes=args.sizes,
+                       densities={name: BENCHMARK_DENSITIES[name] for name in args.densities},
+                       policies=args.policies,
+                       seeds=args.seeds,
+                       output_file=args.output_file)
+        print(f"""Benchmark written to {args.output_file}""")
+    else:
+        regressions = compare_benchmarks(args.baseline_file, args.current_file, tolerance=args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f"""REGRESSION {name} {metric}: {round(before, 3)} -> {round(after, 3)}""")
+        if regressions:
+            sys.exit(1)
+        print(f"""No regressions beyond {args.tolerance:.0%}""")
@@ -0,0 +1,131 @@
+"""
+Module for compact containers used to record long simulations
+"""
+import numpy as np
+
+class GrowableArray:
+    """
+    Append-only typed array, doubling its capacity when full.
+    __view__ returns the filled part without copying.
+    """
+    __slots__ = ("data", "length")
+
+    def __init__(self, dtype, row_shape:tuple = (), capacity:int = 1024):
+        self.data = np.empty((capacity,) + row_shape, dtype=dtype)
+        self.length = 0
+
+    def __append__(self, value):
+        if self.length == len(self.data):
+            self.__grow__()
+        self.data[self.length] = value
+        self.length += 1
+
+    def __grow__(self):
+        data = np.empty((2 * len(self.data),) + self.data.shape[1:], dtype=self.data.dtype)
+        data[:self.length] = self.data[:self.length]
+        self.data = data
+
+    def __view__(self)->np.ndarray:
+        return self.data[:self.length]
+
+    def __load__(self, values:np.ndarray):
+        # replaces the contents with `values`
+        values = np.asarray(values, dtype=self.data.dtype)
+        if len(values) > len(self.data):
+            self.data = np.empty((len(values),) + self.data.shape[1:], dtype=self.data.dtype)
+        self.data[:len(values)] = values
+        self.length = len(values)
+
+    def __len__(self):
+        return self.length
+
+class BufferPool:
+    """
+    Named arrays kept from one run to the next.
+
+    __take__ hands out the array kept under `name`, filled with `fill`, and
+    only allocates when the shape or dtype asked for changed. A pool serves
+    one run at a time, the next run overwrites what the last one left.
+    """
+    __slots__ = ("arrays",)
+
+    def __init__(self):
+        self.arrays = {}
+
+    def __take__(self, name:str, shape:tuple, dtype, fill=0)->np.ndarray:
+        shape = tuple(shape)
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != np.dtype(dtype):
+            array = np.empty(shape, dtype=dtype)
+            self.arrays[name] = array
+        array.fill(fill)
+        return array
+
+    def __nbytes__(self)->int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+class NullPool:
+    """
+    Stand-in for BufferPool when nothing is reused, every take allocates.
+    """
+    def __take__(self, name:str, shape:tuple, dtype, fill=0)->np.ndarray:
+        return np.full(shape, fill, dtype=dtype)
+
+NULL_POOL = NullPool()
+
+class CellSetView:
+    """
+    Read-only, set-like view of the cells flagged in a flat (x*H + y) bitmap.
+    Supports len(), `(x, y) in view` and iteration over (x, y) tuples.
+    """
+    __slots__ = ("bitmap", "grid_height")
+
+    def __init__(self, bitmap:np.ndarray, grid_height:int):
+        self.bitmap = bitmap
+        self.grid_height = grid_height
+
+    def __len__(self):
+        # tiled bitmaps (src.tiles) count tile by tile
+        if hasattr(self.bitmap, "__count_nonzero__"):
+            return self.bitmap.__count_nonzero__()
+        return int(np.count_nonzero(self.bitmap))
+
+    def __contains__(self, cell):
+        return bool(self.bitmap[cell[0] * self.grid_height + cell[1]])
+
+    def __iter__(self):
+        for index in np.flatnonzero(self.bitmap).tolist():
+            yield divmod(index, self.grid_height)
+
+    def __repr__(self):
+        return repr(set(self))
+
+class CoordinateView:
+    """
+    Read-only, list-like view of an (n, 2) coordinate array as {"x", "y"}
+    dicts, the shape obstacle and dirt locations are passed around in.
+    np.asarray() gives the coordinate array back without copying.
+    """
+    __slots__ = ("coords",)
+
+    def __init__(self, coords:np.ndarray):
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [{"x": x, "y": y} for x, y in self.coords[index].tolist()]
+        x, y = self.coords[index].tolist()
+        return {"x": x, "y": y}
+
+    def __iter__(self):
+        for x, y in self.coords.tolist():
+            yield {"x": x, "y": y}
+
+    def __array__(self, dtype=None, copy=None):
+        return self.coords if dtype is None else self.coords.astype(dtype)
+
+    def __repr__(self):
+        return repr(self[:])
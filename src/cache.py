@@ -0,0 +1,94 @@
+"""
+Module for caching simulation results on disk
+"""
+import os
+import json
+import pickle
+import hashlib
+from functools import lru_cache
+from constants import BASE_PATH
+
+@lru_cache(maxsize=None)
+def get_code_version()->str:
+    # constants.py and every module of src/, so no change to what a seeded run produces is missed
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source_files = ["constants.py"] + sorted(os.path.join("src", file_name)
+                                             for file_name in os.listdir(os.path.join(root, "src"))
+                                             if file_name.endswith(".py"))
+    digest = hashlib.sha256()
+    for file_name in source_files:
+        # the name too, so moving code between modules changes the version
+        digest.update(file_name.encode("utf-8"))
+        with open(os.path.join(root, file_name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Content-addressed store for run_simulation results.
+
+    Entries are keyed by a hash of the simulation config, the seed and the
+    code version, and hold performance_evaluation together with meta_data.
+    Once the directory grows past max_bytes the least recently used entries
+    are evicted (a hit refreshes an entry's mtime).
+    """
+    def __init__(self, cache_dir:str = None, max_bytes:int = 256*1024*1024):
+        self.cache_dir = cache_dir if cache_dir is not None else f"""{BASE_PATH}/assets/cache"""
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __key__(self, config:dict, seed:int)->str:
+        payload = json.dumps({"config": config,
+                              "seed": seed,
+                              "code_version": get_code_version()}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def __path__(self, key:str)->str:
+        return os.path.join(self.cache_dir, f"""{key}.pkl""")
+
+    def __lookup__(self, config:dict, seed:int):
+        path = self.__path__(self.__key__(config, seed))
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # mark as recently used
+        os.utime(path)
+        return entry
+
+    def __store__(self, config:dict, seed:int, entry:dict):
+        path = self.__path__(self.__key__(config, seed))
+        temp_path = f"""{path}.{os.getpid()}.tmp"""
+        with open(temp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # atomic, so concurrent workers never see a half written entry
+        os.replace(temp_path, path)
+        self.__evict__()
+
+    def __evict__(self):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def __clear__(self):
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, file_name))
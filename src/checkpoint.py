@@ -0,0 +1,104 @@
+"""
+Module for checkpointing a running simulation
+"""
+import os
+import glob
+import numpy as np
+
+def save_checkpoint(file_name:str, sections:dict):
+    """
+    Writes {section: {name: array}} to one compressed .npz as "section.name"
+    entries. The file is written next to its destination and moved over it
+    once complete, so a crash mid-write leaves the previous checkpoint intact.
+    """
+    arrays = {f"""{section}.{name}""": value
+              for section, state in sections.items()
+              for name, value in state.items()}
+    temp_file_name = f"""{file_name}.{os.getpid()}.tmp"""
+    with open(temp_file_name, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file_name, file_name)
+
+def load_checkpoint(file_name:str)->dict:
+    # back to {section: {name: array}}
+    sections = {}
+    with np.load(file_name) as data:
+        for key in data.files:
+            section, _, name = key.partition(".")
+            sections.setdefault(section, {})[name] = data[key]
+    return sections
+
+def get_rng_state(rng)->dict:
+    # np.random.RandomState (or np.random), random.Random (or random) as arrays
+    if hasattr(rng, "get_state"):
+        _, keys, pos, has_gauss, cached_gaussian = rng.get_state()
+        return {"keys": keys,
+                "pos": np.int64(pos),
+                "has_gauss": np.int64(has_gauss),
+                "cached_gaussian": np.float64(cached_gaussian)}
+    version, internal_state, gauss_next = rng.getstate()
+    return {"version": np.int64(version),
+            "internal_state": np.array(internal_state, dtype=np.uint32),
+            "gauss_next": np.float64(np.nan if gauss_next is None else gauss_next)}
+
+def set_rng_state(rng, state:dict):
+    if hasattr(rng, "set_state"):
+        rng.set_state(("MT19937",
+                       state["keys"],
+                       int(state["pos"]),
+                       int(state["has_gauss"]),
+                       float(state["cached_gaussian"])))
+        return
+    gauss_next = float(state["gauss_next"])
+    rng.setstate((int(state["version"]),
+                  tuple(state["internal_state"].tolist()),
+                  None if np.isnan(gauss_next) else gauss_next))
+
+class CheckpointHistory:
+    """
+    Append-only columns kept next to a checkpoint, one raw file per column
+    (<checkpoint>.<name>.bin).
+
+    A checkpoint appends only the rows added since the previous one and
+    records how many rows it covers, so checkpointing a long run costs
+    O(new rows) instead of O(steps). The files are written before the
+    checkpoint that counts their rows is moved in place: rows past that
+    count (a crash in between) are ignored on resume and overwritten by
+    the next checkpoint.
+    """
+    def __init__(self, file_name:str):
+        self.file_name = file_name
+        # rows of every column on disk, as far as the latest checkpoint knows
+        self.rows = {}
+
+    def __path__(self, name:str)->str:
+        return f"""{self.file_name}.{name}.bin"""
+
+    def __append__(self, name:str, column)->np.int64:
+        # the rows of `column` not on disk yet, returns the rows the checkpoint covers
+        rows = self.rows.get(name, 0)
+        length = len(column)
+        with open(self.__path__(name), "r+b" if rows > 0 else "wb") as f:
+            f.seek(rows * column.dtype.itemsize)
+            f.truncate()
+            f.write(np.ascontiguousarray(column[rows:length]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows[name] = length
+        return np.int64(length)
+
+    def __read__(self, name:str, rows:int, dtype)->np.ndarray:
+        # the first `rows` rows of a column, the ones the loaded checkpoint counts
+        self.rows[name] = rows
+        data = np.fromfile(self.__path__(name), dtype=dtype, count=rows)
+        if len(data) < rows:
+            raise ValueError(f"""{self.__path__(name)} holds {len(data)} rows, the checkpoint expects {rows}""")
+        return data
+
+    def __remove__(self):
+        # every column file of the checkpoint, also those a crashed run left behind
+        for path in glob.glob(f"""{glob.escape(self.file_name)}.*.bin"""):
+            os.remove(path)
+        self.rows = {}
@@ -1,6 +1,7 @@
 """
 Module for common functions
 """
+import numpy as np
 
 def euclidean_distance(x1,y1,x2,y2,rounded=True):
     ed = pow(pow(x2-x1,2)+pow(y2-y1,2),0.5)
@@ -11,6 +12,9 @@ def euclidean_distance(x1,y1,x2,y2,rounded=True):
 def manhatten_distance(x1,y1,x2,y2):
     return abs(x1-x2)+abs(y1-y2)
 
+def chebyshev_distance(x1,y1,x2,y2):
+    return np.maximum(abs(x1-x2),abs(y1-y2))
+
 
 def check_dirt_obstacle_overlap(dirt, obstacles):
         dirt_set = {(d["x"], d["y"]) for d in dirt}
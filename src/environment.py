@@ -2,85 +2,191 @@
 Module for simulation environment
 """
 import numpy as np
-from constants import LOCATION_MARKERS, POPULATION_DENSITY, DIRECTIONS
+from src.buffers import CoordinateView, NULL_POOL
+from src.spatial import BucketGrid
+from constants import (LOCATION_MARKERS,
+                       POPULATION_DENSITY,
+                       DIRECTIONS,
+                       DIAGONAL_DIRECTIONS,
+                       ENERGY_CONSUMPTION)
+
+# direction vectors in DIRECTIONS order, with the movement cost of each
+DIRECTION_NAMES = list(DIRECTIONS.keys())
+DIRECTION_DX = np.array([DIRECTIONS[d][0] for d in DIRECTION_NAMES])
+DIRECTION_DY = np.array([DIRECTIONS[d][1] for d in DIRECTION_NAMES])
+# direction code of a step on which the agent had no move and stayed put
+NO_DIRECTION = -1
+
+def get_direction_name(direction:int)->str:
+    # DIRECTIONS name of a direction code, None for NO_DIRECTION
+    return DIRECTION_NAMES[direction] if direction != NO_DIRECTION else None
+
+def get_direction_move_energy(energy_consumption:dict)->np.ndarray:
+    # movement cost of every direction, in DIRECTIONS order
+    return np.array([energy_consumption["MOVE_DIAGONAL"] if d in DIAGONAL_DIRECTIONS
+                     else energy_consumption["MOVE_STRAIGHT"]
+                     for d in DIRECTION_NAMES])
+
+DIRECTION_MOVE_ENERGY = get_direction_move_energy(ENERGY_CONSUMPTION)
+
+# optional one-bit-per-cell planes a Grid can carry next to its markers
+GRID_LAYERS = ("obstacle", "dirt", "visited")
+
+# the built-in 10 x 10 map of Environment.__static_environment__
+STATIC_GRID = ((0, 1, 0, 0, 1, 0, 0, 1, 1, 1),
+               (0, 1, 0, 1, 1, 0, 1, 1, 0, 0),
+               (1, 1, 0, 0, 0, 1, 1, 0, 1, 1),
+               (0, 0, 1, 8, 0, 0, 1, 2, 1, 1),
+               (1, 0, 1, 0, 0, 0, 1, 0, 2, 0),
+               (1, 0, 1, 1, 0, 0, 0, 0, 0, 1),
+               (1, 0, 1, 0, 0, 0, 2, 0, 0, 1),
+               (1, 0, 1, 1, 2, 0, 1, 0, 1, 0),
+               (2, 0, 1, 1, 2, 1, 1, 2, 0, 2),
+               (2, 1, 0, 0, 0, 1, 2, 0, 0, 1))
+
+# cells packed per pass when planes are rebuilt, keeps temporaries bounded on huge maps
+LAYER_SYNC_CHUNK = 8 * 1024 * 1024
 
 class Grid:
-    def __init__(self, x:int = 10, y:int = 10, static_grid = None):
+    """
+    Location markers stored as one uint8 per cell.
+
+    `layers` adds bit-packed boolean planes (see GRID_LAYERS) at one bit per
+    cell. The obstacle and dirt planes follow the markers, the visited plane
+    is set whenever the agent is placed on a cell. `grid` stays a plain
+    (x, y) array, so grid[x][y] reads and writes work as before. With a
+    `buffers` BufferPool the arrays are reused from the previous run.
+    """
+    def __init__(self, x:int = 10, y:int = 10, static_grid = None, layers:tuple = (), buffers = NULL_POOL):
         self.x = x
         self.y = y
 
         if static_grid is None:
-            self.grid = np.zeros((x, y), dtype=int)
+            self.grid = buffers.__take__("grid", (x, y), np.uint8)
         else:
-            self.grid = np.array(static_grid)
+            self.grid = np.asarray(static_grid, dtype=np.uint8)
+
+        for layer in layers:
+            if layer not in GRID_LAYERS:
+                raise ValueError(f"""Unknown grid layer '{layer}', expected one of {GRID_LAYERS}""")
+        self.layers = {layer: buffers.__take__(f"""layer.{layer}""", ((self.grid.size + 7) // 8,), np.uint8) for layer in layers}
 
     def __get_grid__(self):
         return self.grid
 
+    def __set_cell__(self, x, y, marker):
+        self.grid[x][y] = marker
+        if self.layers:
+            index = x * self.grid.shape[1] + y
+            if "obstacle" in self.layers:
+                self.__set_bit__("obstacle", index, marker == LOCATION_MARKERS["OBSTACLE"])
+            if "dirt" in self.layers:
+                self.__set_bit__("dirt", index, marker == LOCATION_MARKERS["DIRT"])
+            if "visited" in self.layers and marker == LOCATION_MARKERS["AGENT"]:
+                self.__set_bit__("visited", index, True)
+
+    def __set_bit__(self, layer, index, value):
+        # np.packbits order: the first cell of a byte is its most significant bit
+        byte, bit = divmod(index, 8)
+        if value:
+            self.layers[layer][byte] |= 0x80 >> bit
+        else:
+            self.layers[layer][byte] &= ~(0x80 >> bit) & 0xFF
+
+    def __get_layer__(self, layer, x, y)->bool:
+        byte, bit = divmod(x * self.grid.shape[1] + y, 8)
+        return bool(self.layers[layer][byte] & (0x80 >> bit))
+
+    def __unpack_layer__(self, layer)->np.ndarray:
+        return np.unpackbits(self.layers[layer], count=self.grid.size).reshape(self.grid.shape).astype(bool)
+
+    def __sync_layers__(self):
+        # rebuild the marker planes after bulk writes to the grid
+        flat = self.grid.reshape(-1)
+        for layer, marker in (("obstacle", LOCATION_MARKERS["OBSTACLE"]), ("dirt", LOCATION_MARKERS["DIRT"])):
+            if layer not in self.layers:
+                continue
+            plane = self.layers[layer]
+            for start in range(0, flat.size, LAYER_SYNC_CHUNK):
+                packed = np.packbits(flat[start:start + LAYER_SYNC_CHUNK] == marker)
+                plane[start // 8:start // 8 + len(packed)] = packed
+
+    def __nbytes__(self)->int:
+        return self.grid.nbytes + sum(plane.nbytes for plane in self.layers.values())
+
 class Environment:
-    def __init__(self):
+    def __init__(self, rng = None, grid_layers:tuple = (), buffers = NULL_POOL):
+        # np.random.RandomState for seeded runs, the global np.random state otherwise
+        self.rng = rng if rng is not None else np.random
+        # bit-packed planes to keep next to the grid, see GRID_LAYERS
+        self.grid_layers = tuple(grid_layers)
+        # src.buffers pool the grid arrays are taken from
+        self.buffers = buffers
+
         self.grid_descriptor = None
         self.grid_size = {
                 "x":0,
                 "y":0
             }
-        self.initial_dirty_locations = []
-        self.initial_obstacles = []
-        self.obstacles = []
-        self.dirty_locations = []
+        # obstacle and dirt locations as (n, 2) arrays of (x, y), see the properties below
+        self.initial_obstacle_coords = self.__to_coords__([])
+        self.initial_dirt_coords = self.__to_coords__([])
+        self.obstacle_coords = self.initial_obstacle_coords
+        self.dirt_coords = self.initial_dirt_coords
+
+        # live, bucketed dirt index of flat cell indices (x*H + y), kept in sync with the grid by __set_cell__
+        self.dirt_index = BucketGrid(self.grid_size)
+        self.dirt_count = 0
+
+        # callables (x, y, old_marker, new_marker) told about every __set_cell__ write
+        self.cell_listeners = []
+
+        # sensing layer, built by __build_sensing__ once the grid exists
+        self.flat_grid = None
+        self.neighbor_offsets = None
+        self.border_neighbors = {}
 
     def __generate_environment__(self,
                                  grid_size: dict = {"x":10,"y": 10},
                                  obstacles:list = [],
                                  dirty_locations:list = []):
         self.grid_descriptor = Grid(x=grid_size["x"],
-                         y=grid_size["y"])
+                         y=grid_size["y"],
+                         layers=self.grid_layers,
+                         buffers=self.buffers)
         self.grid_size["x"] = grid_size["x"]
         self.grid_size["y"] = grid_size["y"]
-        self.initial_obstacles = [x for x in obstacles]
-        self.initial_dirty_locations = [x for x in dirty_locations]
-        self.obstacles = obstacles
-        self.dirty_locations = dirty_locations
-
-    def __static_environment__(self):
-        temp_grid = [[0, 1, 0, 0, 1, 0, 0, 1, 1, 1], 
-        [0, 1, 0, 1, 1, 0, 1, 1, 0, 0],
-        [1, 1, 0, 0, 0, 1, 1, 0, 1, 1], 
-        [0, 0, 1, 8, 0, 0, 1, 2, 1, 1],
-        [1, 0, 1, 0, 0, 0, 1, 0, 2, 0],
-        [1, 0, 1, 1, 0, 0, 0, 0, 0, 1],
-        [1, 0, 1, 0, 0, 0, 2, 0, 0, 1],
-        [1, 0, 1, 1, 2, 0, 1, 0, 1, 0],
-        [2, 0, 1, 1, 2, 1, 1, 2, 0, 2],
-        [2, 1, 0, 0, 0, 1, 2, 0, 0, 1]]
-        self.grid_size={"x":10,"y":10}
-        self.grid_descriptor = Grid(static_grid=temp_grid)
-        self.initial_dirty_locations = []
-        self.initial_obstacles = []
-        self.obstacles = []
-        self.dirty_locations = []
-        for i in range(len(self.grid_descriptor.grid[0])):
-            for j in range(len(self.grid_descriptor.grid)):
-                if self.grid_descriptor.grid[i][j] == 1:
-                    self.initial_obstacles.append({"x":i,"y":j})
-                    self.obstacles.append({"x":i,"y":j})
-                elif self.grid_descriptor.grid[i][j] == 2:
-                    self.initial_dirty_locations.append({"x":i,"y":j})
-                    self.dirty_locations.append({"x":i,"y":j})
-        
-        # self.__print_obstacles__()
-        # self.__print_dirty_locations__()
-
-        self.__populate_obstacles__()
-        self.__populate_dirt__()
+        self.obstacle_coords = self.initial_obstacle_coords = self.__to_coords__(obstacles)
+        self.dirt_coords = self.initial_dirt_coords = self.__to_coords__(dirty_locations)
+        self.__build_sensing__()
+        self.__rebuild_dirt_index__()
 
-        # self.__print_grid__()
-
-    def __populate_grid__(self):
-        self.obstacles, self.dirty_locations = self.__generate_random_obstacles_and_dirt__(POPULATION_DENSITY["OBSTACLES"],
-                                                                                           POPULATION_DENSITY["DIRT"])
-        self.initial_obstacles = [x for x in self.obstacles]
-        self.initial_dirty_locations = [x for x in self.dirty_locations]
+    def __static_environment__(self, static_grid = None):
+        """
+        Sets up the environment on a given (x, y) grid of markers, e.g. the
+        "grid" of src.maps.load_map, or on STATIC_GRID. An ndarray is used
+        in place (a copy-on-write memory map stays one), anything else is
+        copied.
+        """
+        if static_grid is None:
+            static_grid = STATIC_GRID
+        self.grid_descriptor = Grid(static_grid=static_grid, layers=self.grid_layers)
+        grid = self.grid_descriptor.grid
+        self.grid_size = {"x": grid.shape[0], "y": grid.shape[1]}
+        self.__build_sensing__()
+
+        # the markers are in the grid already, only the layouts are read off it
+        self.obstacle_coords = self.initial_obstacle_coords = self.__to_coords__(np.argwhere(grid == LOCATION_MARKERS["OBSTACLE"]))
+        self.dirt_coords = self.initial_dirt_coords = self.__to_coords__(np.argwhere(grid == LOCATION_MARKERS["DIRT"]))
+        self.__rebuild_dirt_index__()
+
+    def __populate_grid__(self, population_density:dict=None):
+        if population_density is None:
+            population_density = POPULATION_DENSITY
+        self.obstacle_coords, self.dirt_coords = self.__generate_random_obstacles_and_dirt__(population_density["OBSTACLES"],
+                                                                                             population_density["DIRT"])
+        self.initial_obstacle_coords = self.obstacle_coords
+        self.initial_dirt_coords = self.dirt_coords
 
         """
             Note: Currently Obstacles populate the grid first,
@@ -91,18 +197,137 @@ class Environment:
 
         self.__populate_obstacles__()
         self.__populate_dirt__()
+        self.__rebuild_dirt_index__()
 
     def __populate_obstacles__(self):
-        for obstacle in self.obstacles:
-            self.grid_descriptor.grid[obstacle["x"]][obstacle["y"]] = LOCATION_MARKERS["OBSTACLE"]
+        self.grid_descriptor.grid[self.obstacle_coords[:, 0], self.obstacle_coords[:, 1]] = LOCATION_MARKERS["OBSTACLE"]
 
     def __populate_dirt__(self):
-        for dirt in self.dirty_locations:
-            self.grid_descriptor.grid[dirt["x"]][dirt["y"]] = LOCATION_MARKERS["DIRT"]
+        self.grid_descriptor.grid[self.dirt_coords[:, 0], self.dirt_coords[:, 1]] = LOCATION_MARKERS["DIRT"]
+
+    @staticmethod
+    def __to_coords__(locations)->np.ndarray:
+        # (n, 2) int32 array from a coordinate array or a list of {"x", "y"} dicts
+        if isinstance(locations, (np.ndarray, CoordinateView)):
+            return np.asarray(locations, dtype=np.int32).reshape(-1, 2)
+        return np.array([(l["x"], l["y"]) for l in locations], dtype=np.int32).reshape(-1, 2)
+
+    # obstacle and dirt locations in the {"x", "y"} dict form, as views over the arrays
+    @property
+    def obstacles(self)->CoordinateView:
+        return CoordinateView(self.obstacle_coords)
+
+    @obstacles.setter
+    def obstacles(self, locations):
+        self.obstacle_coords = self.__to_coords__(locations)
+
+    @property
+    def dirty_locations(self)->CoordinateView:
+        return CoordinateView(self.dirt_coords)
+
+    @dirty_locations.setter
+    def dirty_locations(self, locations):
+        self.dirt_coords = self.__to_coords__(locations)
+
+    @property
+    def initial_obstacles(self)->CoordinateView:
+        return CoordinateView(self.initial_obstacle_coords)
+
+    @property
+    def initial_dirty_locations(self)->CoordinateView:
+        return CoordinateView(self.initial_dirt_coords)
+
+    def __checkpoint__(self)->dict:
+        # the grid and the layouts, everything else is rebuilt from them
+        return {"grid": self.grid_descriptor.grid,
+                "obstacle_coords": self.obstacle_coords,
+                "dirt_coords": self.dirt_coords,
+                "initial_obstacle_coords": self.initial_obstacle_coords,
+                "initial_dirt_coords": self.initial_dirt_coords,
+                # the visited plane is the only one the markers cannot rebuild
+                **({"visited_layer": self.grid_descriptor.layers["visited"]}
+                   if "visited" in self.grid_descriptor.layers else {})}
+
+    def __restore__(self, state:dict):
+        # onto an environment generated with the same grid size
+        self.grid_descriptor.grid[:] = state["grid"]
+        self.obstacle_coords = state["obstacle_coords"]
+        self.dirt_coords = state["dirt_coords"]
+        self.initial_obstacle_coords = state["initial_obstacle_coords"]
+        self.initial_dirt_coords = state["initial_dirt_coords"]
+        if "visited" in self.grid_descriptor.layers and "visited_layer" in state:
+            self.grid_descriptor.layers["visited"][:] = state["visited_layer"]
+        self.__rebuild_dirt_index__()
+
+    def __rebuild_dirt_index__(self):
+        # one full scan (dirt index and grid planes), only needed after bulk writes to the grid
+        self.grid_descriptor.__sync_layers__()
+        dirt_cells = np.flatnonzero(self.grid_descriptor.grid == LOCATION_MARKERS["DIRT"])
+        self.dirt_index = BucketGrid(self.grid_size)
+        self.dirt_index.__build__(dirt_cells)
+        self.dirt_count = len(self.dirt_index)
+
+    def __build_sensing__(self):
+        # flat view of the grid, cell (x, y) lives at x*H + y and writes show through
+        self.flat_grid = self.grid_descriptor.grid.reshape(-1)
+        self.neighbor_offsets = DIRECTION_DX * self.grid_size["y"] + DIRECTION_DY
+        # clamped neighbours of border cells, filled in on first visit
+        self.border_neighbors = {}
+
+    def __get_neighbors__(self, x, y)->np.ndarray:
+        """
+        Flat index of the 8 neighbours of (x, y), in DIRECTIONS order.
+
+        Off-grid neighbours are clamped onto the edge, as the agent always
+        did, so a border cell can see itself or the same cell twice.
+        """
+        if 0 < x < self.grid_size["x"] - 1 and 0 < y < self.grid_size["y"] - 1:
+            return self.neighbor_offsets + (x * self.grid_size["y"] + y)
+        neighbors = self.border_neighbors.get((x, y))
+        if neighbors is None:
+            neighbors = (np.clip(DIRECTION_DX + x, 0, self.grid_size["x"] - 1) * self.grid_size["y"]
+                         + np.clip(DIRECTION_DY + y, 0, self.grid_size["y"] - 1))
+            self.border_neighbors[(x, y)] = neighbors
+        return neighbors
+
+    def __sense__(self, x, y):
+        # the whole neighbourhood in one gather: (flat indices, markers)
+        neighbors = self.__get_neighbors__(x, y)
+        return neighbors, self.flat_grid[neighbors]
+
+    def __get_cell__(self, x, y):
+        return self.grid_descriptor.grid[x][y]
+
+    def __set_cell__(self, x, y, marker):
+        # every single-cell write goes through here so the dirt index stays live
+        old_marker = self.grid_descriptor.grid[x][y]
+        if old_marker == LOCATION_MARKERS["DIRT"]:
+            self.dirt_index.__remove__(x * self.grid_size["y"] + y)
+        if marker == LOCATION_MARKERS["DIRT"]:
+            self.dirt_index.__insert__(x * self.grid_size["y"] + y)
+        self.dirt_count = len(self.dirt_index)
+        self.grid_descriptor.__set_cell__(x, y, marker)
+        for listener in self.cell_listeners:
+            listener(x, y, old_marker, marker)
+
+    def __clear_dirt__(self, cells:np.ndarray):
+        # bulk __set_cell__(x, y, CLEAN) for the dirt among `cells`: one grid write and one index update
+        cells = cells[self.flat_grid[cells] == LOCATION_MARKERS["DIRT"]]
+        self.flat_grid[cells] = LOCATION_MARKERS["CLEAN"]
+        self.dirt_index.__remove_many__(cells)
+        self.dirt_count = len(self.dirt_index)
+        if self.grid_descriptor.layers or self.cell_listeners:
+            for x, y in zip(*np.divmod(cells, self.grid_size["y"])):
+                x, y = int(x), int(y)
+                self.grid_descriptor.__set_cell__(x, y, LOCATION_MARKERS["CLEAN"])
+                for listener in self.cell_listeners:
+                    listener(x, y, LOCATION_MARKERS["DIRT"], LOCATION_MARKERS["CLEAN"])
+        return cells
 
     def __print_grid__(self):
-        for i in range(self.grid_size["x"]):
-            for j in range(self.grid_size["y"]):
+        # one line per y, as maps are written
+        for i in range(self.grid_size["y"]):
+            for j in range(self.grid_size["x"]):
                 print(self.grid_descriptor.grid[j][i], end=' ')
             print()
     
@@ -110,29 +335,19 @@ class Environment:
     def __generate_random_obstacles_and_dirt__(self, obstacle_density: float = 0.1, dirt_density: float = 0.1):
         x_max = self.grid_size["x"]
         y_max = self.grid_size["y"]
+        total_locations = x_max * y_max
 
-        # Generate all possible locations
-        all_locations = [{'x': x, 'y': y} for x in range(x_max) for y in range(y_max)]
-        
-        # Shuffle to randomize locations
-        np.random.shuffle(all_locations)
-        
-        total_locations = len(all_locations)
-        
         # Calculate counts for obstacles and dirt
         max_obstacles = int(total_locations * obstacle_density)
         max_dirt = int(total_locations * dirt_density)
-        
-        # Select locations for obstacles
-        obstacle_locations = all_locations[:max_obstacles]
-        
-        # Remove obstacle locations from all_locations
-        remaining_locations = all_locations[max_obstacles:]
-        
-        # Select locations for dirt
-        dirt_locations = remaining_locations[:max_dirt]
 
-        return obstacle_locations, dirt_locations
+        # Shuffle the flat cell indices (x*H + y). This is the same draw the
+        # shuffle of a W*H list of dicts made, so seeded layouts are unchanged.
+        order = self.rng.permutation(total_locations)[:max_obstacles + max_dirt]
+        locations = np.stack(np.divmod(order, y_max), axis=1).astype(np.int32)
+
+        # obstacles first, dirt from the remaining locations
+        return locations[:max_obstacles], locations[max_obstacles:]
 
     def __generate_random_obstacles__(self,
                                       obstacle_density: float = 0.1):
@@ -146,8 +361,8 @@ class Environment:
 
         for i in range(max_count):
             new_obstacle_loc = {
-                "x": np.random.randint(0, x_max),
-                "y": np.random.randint(0, y_max)
+                "x": self.rng.randint(0, x_max),
+                "y": self.rng.randint(0, y_max)
             }
 
             obstacle_array.append(new_obstacle_loc)
@@ -165,8 +380,8 @@ class Environment:
 
         for i in range(max_count):
             new_obstacle_loc = {
-                "x": np.random.randint(0, x_max),
-                "y": np.random.randint(0, y_max)
+                "x": self.rng.randint(0, x_max),
+                "y": self.rng.randint(0, y_max)
             }
 
             dirt_array.append(new_obstacle_loc)
@@ -201,8 +416,8 @@ class Environment:
         for _ in range(max_count):
             while True:
                 new_dirt_loc = {
-                    "x": np.random.randint(0, x_max),
-                    "y": np.random.randint(0, y_max)
+                    "x": self.rng.randint(0, x_max),
+                    "y": self.rng.randint(0, y_max)
                 }
 
                 # Ensure the dirt isn't encapsulated by obstacles
@@ -225,14 +440,22 @@ class Environment:
         print(self.dirty_locations)
     
     def __get_global_dirty_locations__(self):
-        global_dirty_locations = []
-        for i in range(self.grid_size["y"]):
-            for j in range(self.grid_size["x"]):
-                if self.grid_descriptor.grid[i][j] == LOCATION_MARKERS["DIRT"]:
-                    global_dirty_locations.append((i,j))
-        return global_dirty_locations
+        return [divmod(index, self.grid_size["y"]) for index in sorted(self.dirt_index)]
+
+    def __get_nearest_dirt__(self, x, y, k=1, metric="euclidean"):
+        # the k remaining dirt cells closest to (x, y) as (x, y, distance), closest first
+        return self.dirt_index.__nearest__(x, y, k=k, metric=metric)
+
+    def __get_dirt_count__(self):
+        return self.dirt_count
+
+    def __get_initial_dirt_count__(self)->int:
+        return len(self.initial_dirt_coords)
+
+    def __get_initial_obstacle_count__(self)->int:
+        return len(self.initial_obstacle_coords)
 
     def __is_grid_clean__(self):
-        if len(self.__get_global_dirty_locations__()) == 0:
+        if self.dirt_count == 0:
             return True
         return False
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Module for the step events a simulation run is streamed as
+"""
+import queue
+import threading
+from typing import NamedTuple
+
+# events a threaded_events producer may run ahead of its consumer
+EVENT_QUEUE_SIZE = 256
+
+class MoveEvent(NamedTuple):
+    # the agent moved to (x, y) with direction code `direction` (DIRECTIONS order, None when it stayed)
+    step: int
+    x: int
+    y: int
+    direction: int
+    dirt_found: bool
+
+class CleanEvent(NamedTuple):
+    # the dirt at (x, y) was cleaned, `steps_to_clean` steps after the previous spot
+    step: int
+    x: int
+    y: int
+    steps_to_clean: int
+
+class EnergyEvent(NamedTuple):
+    # energy spent by the step and the battery left, rounded as recorded; always the last event of a step
+    step: int
+    step_energy: float
+    battery: float
+
+class TerminationEvent(NamedTuple):
+    # the run ended after `step` steps, with a TERMINATION_CODE
+    step: int
+    termination_code: int
+
+# every event a stream can emit, in the order they come within a step
+STEP_EVENTS = (MoveEvent, CleanEvent, EnergyEvent, TerminationEvent)
+
+class StreamEnd:
+    """
+    Marks the end of a threaded stream, carrying the producer's error if it failed.
+    """
+    __slots__ = ("error",)
+
+    def __init__(self, error:BaseException = None):
+        self.error = error
+
+def threaded_events(events, maxsize:int = EVENT_QUEUE_SIZE):
+    """
+    Advances `events` in a background thread and yields what it produces.
+
+    The queue in between holds at most `maxsize` events, so the producer
+    runs ahead of a slow consumer by that much and then waits. Errors of
+    the producer are raised in the consumer. Leaving the loop early stops
+    the producer and closes `events`.
+    """
+    pending = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item)->bool:
+        # blocks while the queue is full, unless the consumer is gone
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for event in events:
+                if not put(event):
+                    break
+            else:
+                put(StreamEnd())
+        except BaseException as error:
+            put(StreamEnd(error))
+        finally:
+            if hasattr(events, "close"):
+                events.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if isinstance(item, StreamEnd):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
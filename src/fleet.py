@@ -0,0 +1,249 @@
+"""
+Module for many agents cleaning one environment together
+"""
+import time
+from datetime import datetime
+import numpy as np
+from src.agent import SENSE_TABLE, SENSE_OBSTACLE, SENSE_DIRT, VISITED_FLAG
+from src.buffers import GrowableArray
+from src.environment import Environment, DIRECTION_DX, DIRECTION_DY, get_direction_move_energy
+from src.metrics import compute_metrics
+from src.simulation import get_simulation_config
+from constants import LOCATION_MARKERS, TERMINATION_CODE, ENERGY_CONSUMPTION
+
+class Fleet:
+    """
+    Reflex cleaning agents sharing one Environment, stepped together.
+
+    Agents are rows of arrays (position, energy, counters) rather than
+    objects, so a step is a fixed number of numpy operations whatever the
+    number of agents. Agents do not write themselves into the grid: an
+    occupancy layer holds the id + 1 of the agent on every cell, and the
+    dirt and obstacle markers underneath are left alone.
+
+    Every step all agents sense their neighbourhood at once and score it as
+    Agent does, with occupied cells ruled out and the visited map shared by
+    the fleet. Each picks one of its best cells at random. When several
+    pick the same cell the lowest id gets it and the others wait, paying
+    the scan. Agents with a dead battery stay where they are.
+    """
+    def __init__(self,
+                 environment:Environment,
+                 n_agents:int,
+                 initial_energy:float = 1000,
+                 rng:np.random.RandomState = None,
+                 energy_consumption:dict = None,
+                 initial_positions:list = None):
+        self.environment = environment
+        self.width = environment.grid_size["x"]
+        self.height = environment.grid_size["y"]
+        grid_cells = self.width * self.height
+
+        # np.random.RandomState for seeded runs, the global np.random state otherwise
+        self.rng = rng if rng is not None else np.random
+        self.energy_consumption = energy_consumption if energy_consumption is not None else ENERGY_CONSUMPTION
+        self.move_energy = get_direction_move_energy(self.energy_consumption)
+
+        if initial_positions is not None:
+            cells = np.array([position["x"] * self.height + position["y"] for position in initial_positions], dtype=np.int64)
+            if len(np.unique(cells)) != len(cells):
+                raise ValueError("""Two agents cannot start on the same cell""")
+        else:
+            # distinct free cells, neither obstacle nor dirt
+            free = np.flatnonzero(environment.flat_grid == LOCATION_MARKERS["CLEAN"])
+            if len(free) < n_agents:
+                raise ValueError(f"""{n_agents} agents do not fit on the {len(free)} free cells of the grid""")
+            cells = self.rng.choice(free, n_agents, replace=False).astype(np.int64)
+        self.n_agents = len(cells)
+        self.ids = np.arange(self.n_agents)
+        self.cells = cells
+        self.initial_cells = cells.copy()
+
+        # id + 1 of the agent on every cell, 0 when free
+        self.occupancy = np.zeros(grid_cells, dtype=np.int32 if self.n_agents < 2**31 - 1 else np.int64)
+        self.occupancy[cells] = self.ids + 1
+        self.visited_map = np.zeros(grid_cells, dtype=np.uint8)
+        self.visited_map[cells] = VISITED_FLAG
+        self.obstacle_map = np.zeros(grid_cells, dtype=bool)
+
+        # per agent energy and running counters, nothing per step
+        self.initial_energy = initial_energy
+        self.energy = np.full(self.n_agents, float(initial_energy))
+        self.steps = np.zeros(self.n_agents, dtype=np.int64)
+        self.moves = np.zeros(self.n_agents, dtype=np.int64)
+        self.waits = np.zeros(self.n_agents, dtype=np.int64)
+        self.spots_cleaned = np.zeros(self.n_agents, dtype=np.int64)
+        self.current_steps_to_clean = np.zeros(self.n_agents, dtype=np.int64)
+        self.steps_to_clean_total = np.zeros(self.n_agents, dtype=np.int64)
+
+    def __active__(self)->np.ndarray:
+        return self.energy > 0
+
+    def __sense__(self, cells:np.ndarray):
+        # (n, 8) neighbour cells, clamped at the border the way Environment.__get_neighbors__ clamps
+        xs, ys = np.divmod(cells, self.height)
+        neighbor_xs = np.clip(xs[:, None] + DIRECTION_DX, 0, self.width - 1)
+        neighbor_ys = np.clip(ys[:, None] + DIRECTION_DY, 0, self.height - 1)
+        neighbors = neighbor_xs * self.height + neighbor_ys
+        scores = SENSE_TABLE[self.environment.flat_grid[neighbors] | self.visited_map[neighbors]]
+        return neighbors, scores
+
+    def __step__(self)->int:
+        """
+        Moves every agent with energy left once, returns how many dirt
+        cells the fleet cleaned.
+        """
+        active = np.flatnonzero(self.__active__())
+        if len(active) == 0:
+            return 0
+        neighbors, scores = self.__sense__(self.cells[active])
+
+        self.obstacle_map[neighbors[scores == SENSE_OBSTACLE]] = True
+        # occupied cells (the agent's own included) are not moves
+        scores[self.occupancy[neighbors] != 0] = 0
+
+        # a random one of the best scored cells: the best score wins, a random key breaks ties
+        best = scores.max(axis=1)
+        keys = self.rng.random_sample(scores.shape)
+        choices = np.argmax(np.where(scores == best[:, None], keys, -1.0), axis=1)
+
+        movers = np.flatnonzero(best > 0)
+        targets = neighbors[movers, choices[movers]]
+        # the first claim of a cell wins, and claims are in id order (a stable sort keeps it)
+        order = np.argsort(targets, kind="stable")
+        sorted_targets = targets[order]
+        first_claims = np.sort(order[np.concatenate(([True], sorted_targets[1:] != sorted_targets[:-1]))])
+        winners = movers[first_claims]
+        targets = targets[first_claims]
+        directions = choices[winners]
+        dirt_found = best[winners] >= SENSE_DIRT
+        winners = active[winners]
+
+        self.occupancy[self.cells[winners]] = 0
+        self.occupancy[targets] = winners + 1
+        self.cells[winners] = targets
+        self.visited_map[targets] = VISITED_FLAG
+
+        # every active agent scans, movers pay the move and the cleaning effort as Agent does
+        step_energy = np.full(len(active), float(self.energy_consumption["SCAN"]))
+        moved = np.zeros(self.n_agents, dtype=bool)
+        moved[winners] = True
+        cleaning_effort = np.round(self.energy_consumption["CLEAN"] * np.round(self.rng.uniform(1, 3, len(winners)), 2), 2)
+        step_energy[moved[active]] += self.move_energy[directions] + cleaning_effort
+        self.energy[active] = np.where(self.energy[active] - step_energy <= 0, 0, self.energy[active] - step_energy)
+
+        self.steps[active] += 1
+        self.moves[winners] += 1
+        self.waits[active] += ~moved[active]
+
+        cleaners = winners[dirt_found]
+        self.environment.__clear_dirt__(targets[dirt_found])
+        self.spots_cleaned[cleaners] += 1
+        self.steps_to_clean_total[cleaners] += self.current_steps_to_clean[cleaners]
+        self.current_steps_to_clean[active] += 1
+        self.current_steps_to_clean[cleaners] = 0
+        return len(cleaners)
+
+    @property
+    def positions(self)->np.ndarray:
+        # (n, 2) array of (x, y)
+        return np.stack(np.divmod(self.cells, self.height), axis=1)
+
+    def __agent_metrics__(self)->dict:
+        # one array per metric, one entry per agent
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_steps_to_clean = np.where(self.spots_cleaned > 0, self.steps_to_clean_total / self.spots_cleaned, np.nan)
+        return {"position": self.positions,
+                "steps": self.steps,
+                "moves": self.moves,
+                "waits": self.waits,
+                "spots_cleaned": self.spots_cleaned,
+                "mean_steps_to_clean": mean_steps_to_clean,
+                "energy_consumed": np.round(self.initial_energy - self.energy, 2),
+                "current_energy": np.round(self.energy, 2)}
+
+def run_fleet_simulation(n_agents:int,
+                         simulation_name:str = None,
+                         seed:int = None,
+                         max_steps:int = None,
+                         initial_positions:list = None,
+                         grid_size:dict = None,
+                         population_density:dict = None,
+                         config:dict = None):
+    """
+    run_simulation for a Fleet of `n_agents`: same settings, same return
+    shape. The performance evaluation is for the fleet as a whole (energy
+    and steps summed over the agents), meta_data["agents"] has the metrics
+    of every agent.
+
+    The run ends when all dirt is cleaned, every battery is dead, no agent
+    cleaned anything for idle_limit steps, or at max_steps.
+    """
+    now = datetime.now()
+    if not simulation_name:
+        simulation_name = f"""fleet_{now.strftime("%Y-%m-%d_%H-%M-%S")}-{now.microsecond // 1000:03d}"""
+
+    settings = get_simulation_config(grid_size, population_density, config)
+    start_time = time.time()
+
+    environ = Environment(rng=np.random.RandomState(seed) if seed is not None else None)
+    environ.__generate_environment__(grid_size=settings["grid_size"])
+    environ.__populate_grid__(settings["population_density"])
+    initial_dirt_count = environ.__get_dirt_count__()
+
+    fleet = Fleet(environ,
+                  n_agents,
+                  initial_energy=settings["initial_energy"],
+                  rng=np.random.RandomState(seed) if seed is not None else None,
+                  energy_consumption=settings["energy_consumption"],
+                  initial_positions=initial_positions)
+    dirt_left = GrowableArray(np.int64)
+
+    iteration = 0
+    idle_count = 0
+    loop_start_time = time.time()
+
+    while True:
+        dirt_left.__append__(environ.__get_dirt_count__())
+        if environ.__is_grid_clean__()==True:
+            termination_code = TERMINATION_CODE["GOAL_COMPLETE"]
+            break
+        elif idle_count >= settings["idle_limit"]:
+            termination_code = TERMINATION_CODE["IDLE"]
+            break
+        elif not fleet.__active__().any():
+            termination_code = TERMINATION_CODE["BATTERY_DEAD"]
+            break
+        elif max_steps is not None and iteration >= max_steps:
+            termination_code = TERMINATION_CODE["STEP_LIMIT"]
+            break
+
+        iteration += 1
+        idle_count = 0 if fleet.__step__() > 0 else idle_count + 1
+
+    loop_time = time.time() - loop_start_time
+
+    performance_evaluation = compute_metrics(initial_dirt_count=initial_dirt_count,
+                                             final_dirt_count=environ.__get_dirt_count__(),
+                                             # counted as path lengths, start cells included, like a single agent
+                                             total_steps_taken=int(fleet.steps.sum()) + fleet.n_agents,
+                                             unique_locations_visited=int(np.count_nonzero(fleet.visited_map)),
+                                             total_obstacles=environ.__get_initial_obstacle_count__(),
+                                             total_obstacles_detected=int(np.count_nonzero(fleet.obstacle_map)),
+                                             initial_energy=settings["initial_energy"] * fleet.n_agents,
+                                             current_energy=float(fleet.energy.sum()))
+
+    end_time = time.time()
+    meta_data = {
+        "termination_code": termination_code,
+        "start_time": start_time,
+        "end_time": end_time,
+        "time_elapsed": end_time - start_time,
+        "setup_time": loop_start_time - start_time,
+        "loop_time": loop_time,
+        "iterations": iteration,
+        "n_agents": fleet.n_agents,
+        "agents": fleet.__agent_metrics__(),
+        "dirt_spots_left": dirt_left.__view__()
+    }
+    return simulation_name, performance_evaluation, meta_data
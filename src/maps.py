@@ -0,0 +1,150 @@
+"""
+Module for loading environment maps from ASCII or image files
+"""
+import os
+import json
+import hashlib
+import numpy as np
+from constants import BASE_PATH, LOCATION_MARKERS
+
+# bumped whenever parsing changes, so maps cached by an older parser are parsed again
+MAP_FORMAT_VERSION = 1
+
+# ASCII maps: one line per y, one character per x
+MAP_SYMBOLS = {
+    ".": LOCATION_MARKERS["CLEAN"],
+    " ": LOCATION_MARKERS["CLEAN"],
+    "#": LOCATION_MARKERS["OBSTACLE"],
+    "*": LOCATION_MARKERS["DIRT"],
+    "S": LOCATION_MARKERS["AGENT"]
+}
+
+# image maps: one pixel per cell, every pixel takes the marker of the nearest colour
+MAP_COLORS = {
+    (255, 255, 255): LOCATION_MARKERS["CLEAN"],
+    (0, 0, 0): LOCATION_MARKERS["OBSTACLE"],
+    (128, 128, 128): LOCATION_MARKERS["OBSTACLE"],
+    (255, 0, 0): LOCATION_MARKERS["DIRT"],
+    (255, 255, 0): LOCATION_MARKERS["AGENT"]
+}
+
+IMAGE_EXTENSIONS = (".png", ".bmp", ".gif", ".jpg", ".jpeg", ".tif", ".tiff")
+
+# byte -> marker, 255 for characters that are not in MAP_SYMBOLS
+INVALID_SYMBOL = 255
+SYMBOL_TABLE = np.full(256, INVALID_SYMBOL, dtype=np.uint8)
+for symbol, marker in MAP_SYMBOLS.items():
+    SYMBOL_TABLE[ord(symbol)] = marker
+
+def parse_ascii_map(data:bytes)->np.ndarray:
+    """
+    (x, y) marker array of an ASCII map. Short lines are padded with clean
+    cells, trailing empty lines are dropped.
+    """
+    lines = data.decode("ascii").rstrip("\r\n").splitlines()
+    if not lines:
+        raise ValueError("""The map is empty""")
+    width = max(len(line) for line in lines)
+    text = np.frombuffer("".join(line.ljust(width, ".") for line in lines).encode("ascii"), dtype=np.uint8)
+    markers = SYMBOL_TABLE[text].reshape(len(lines), width)
+
+    invalid = np.argwhere(markers == INVALID_SYMBOL)
+    if len(invalid):
+        y, x = invalid[0]
+        raise ValueError(f"""Unknown map symbol '{lines[y][x]}' at line {y + 1}, column {x + 1}, expected one of {tuple(MAP_SYMBOLS)}""")
+    # lines are y, the grid is indexed [x][y]
+    return np.ascontiguousarray(markers.T)
+
+def parse_image_map(file_name:str)->np.ndarray:
+    # (x, y) marker array of an image map, pixel rows are y
+    from PIL import Image
+
+    with Image.open(file_name) as image:
+        pixels = np.asarray(image.convert("RGB"), dtype=np.int32)
+    palette = np.array(list(MAP_COLORS), dtype=np.int32)
+    markers = np.array(list(MAP_COLORS.values()), dtype=np.uint8)
+    # squared distance of every pixel to every palette colour, one channel at a time to keep it small
+    distances = sum((pixels[:, :, None, channel] - palette[:, channel]) ** 2 for channel in range(3))
+    return np.ascontiguousarray(markers[np.argmin(distances, axis=2)].T)
+
+def parse_map(file_name:str, data:bytes = None)->tuple:
+    """
+    Markers and start position of a map file: an image by its extension,
+    an ASCII map otherwise. The start cell is cleared, `start` is None when
+    the map has no start marker.
+    """
+    if file_name.lower().endswith(IMAGE_EXTENSIONS):
+        grid = parse_image_map(file_name)
+    else:
+        if data is None:
+            with open(file_name, "rb") as f:
+                data = f.read()
+        grid = parse_ascii_map(data)
+
+    starts = np.argwhere(grid == LOCATION_MARKERS["AGENT"])
+    if len(starts) > 1:
+        raise ValueError(f"""The map {file_name} has {len(starts)} start cells, expected at most one""")
+    start = None
+    if len(starts):
+        start = {"x": int(starts[0][0]), "y": int(starts[0][1])}
+        grid[start["x"], start["y"]] = LOCATION_MARKERS["CLEAN"]
+    return grid, start
+
+class MapCache:
+    """
+    Parsed maps on disk, one .npy of markers and one .json of the rest per
+    map. Entries are keyed by a hash of the file's content and its mtime,
+    so an edited map is parsed again, and are memory-mapped on load: only
+    the pages a run touches are read, and writes stay private to the run.
+    """
+    def __init__(self, cache_dir:str = None):
+        self.cache_dir = cache_dir if cache_dir is not None else f"""{BASE_PATH}/assets/maps"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __key__(self, data:bytes, mtime_ns:int)->str:
+        digest = hashlib.sha256(data)
+        digest.update(f"""{mtime_ns}:{MAP_FORMAT_VERSION}""".encode("utf-8"))
+        return digest.hexdigest()
+
+    def __path__(self, key:str, extension:str)->str:
+        return os.path.join(self.cache_dir, f"""{key}.{extension}""")
+
+    def __load__(self, file_name:str)->dict:
+        with open(file_name, "rb") as f:
+            data = f.read()
+        key = self.__key__(data, os.stat(file_name).st_mtime_ns)
+
+        try:
+            with open(self.__path__(key, "json"), "r") as f:
+                entry = json.load(f)
+            # copy-on-write: the run may clean cells, the cached map stays as parsed
+            grid = np.load(self.__path__(key, "npy"), mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            grid, start = parse_map(file_name, data)
+            entry = {"start": start}
+            self.__store__(key, grid, entry)
+
+        return {"key": key, "grid": grid, "start": entry["start"]}
+
+    def __store__(self, key:str, grid:np.ndarray, entry:dict):
+        # the markers first, an entry only counts once its .json is there
+        for extension, write in (("npy", lambda f: np.save(f, grid)),
+                                 ("json", lambda f: f.write(json.dumps(entry).encode("utf-8")))):
+            path = self.__path__(key, extension)
+            temp_path = f"""{path}.{os.getpid()}.tmp"""
+            with open(temp_path, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+
+    def __clear__(self):
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith((".npy", ".json")):
+                os.remove(os.path.join(self.cache_dir, file_name))
+
+def load_map(file_name:str, cache_dir:str = None)->dict:
+    """
+    {"key", "grid", "start"} of a map file, parsed once and read from the
+    MapCache afterwards. `grid` is the (x, y) uint8 marker array, `key`
+    identifies the map's content.
+    """
+    return MapCache(cache_dir).__load__(file_name)
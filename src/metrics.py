@@ -4,22 +4,37 @@ Module for performance metrics
 from src.agent import Agent
 from src.environment import Environment
 
-def evaluate_simulation(environment:Environment, agent:Agent, verbose=False)->dict:
-    initial_dirt_count = len(environment.initial_dirty_locations)
-    final_dirt_count = len(environment.__get_global_dirty_locations__())
+def evaluate_simulation(environment:Environment, agent:Agent, verbose=False, dirt_spawned:int=0)->dict:
+    # dirt that appeared during a dynamic run counts as dirt to be cleaned
+    return compute_metrics(initial_dirt_count=environment.__get_initial_dirt_count__() + dirt_spawned,
+                           final_dirt_count=environment.__get_dirt_count__(),
+                           # counted as the length of the path, start cell included
+                           total_steps_taken=agent.steps_taken + 1,
+                           unique_locations_visited=len(agent.visited_locations),
+                           total_obstacles=environment.__get_initial_obstacle_count__(),
+                           total_obstacles_detected=len(agent.obstacles_detected),
+                           initial_energy=agent.initial_energy,
+                           current_energy=agent.current_energy,
+                           verbose=verbose)
+
+def compute_metrics(initial_dirt_count:int,
+                    final_dirt_count:int,
+                    total_steps_taken:int,
+                    unique_locations_visited:int,
+                    total_obstacles:int,
+                    total_obstacles_detected:int,
+                    initial_energy:float,
+                    current_energy:float,
+                    verbose=False)->dict:
     total_dirt_cleaned = initial_dirt_count - final_dirt_count
-    total_steps_taken = len(agent.path_followed)
-    unique_locations_visited = len(agent.visited_locations)
-    percentage_dirt_cleaned = round(((initial_dirt_count-final_dirt_count)/initial_dirt_count)*100,2)
+    # a map without dirt counts as fully cleaned
+    percentage_dirt_cleaned = round(((initial_dirt_count-final_dirt_count)/initial_dirt_count)*100,2) if initial_dirt_count > 0 else 100.0
     dirt_cleaned_per_step = round((initial_dirt_count-final_dirt_count)/total_steps_taken,2)
     coverage_efficiency = round((unique_locations_visited/total_steps_taken)*100)
-    total_obstacles = len(environment.initial_obstacles)
-    total_obstacles_detected = len(agent.obstacles_detected)
-    initial_energy = agent.initial_energy
-    current_energy = agent.current_energy
     total_energy_consumed = round(initial_energy - current_energy,2)
     percentage_energy_consumed = round(((initial_energy-current_energy)/initial_energy)*100,2)
-    percentage_energy_consumed_per_dirty_spot = round((total_energy_consumed/total_dirt_cleaned)*100/initial_energy,2)
+    # undefined until a spot is cleaned (sparse maps can end without one)
+    percentage_energy_consumed_per_dirty_spot = round((total_energy_consumed/total_dirt_cleaned)*100/initial_energy,2) if total_dirt_cleaned > 0 else None
     percentage_energy_consumed_per_step = round((total_energy_consumed/total_steps_taken)*100/initial_energy,2)
 
     if verbose:
@@ -0,0 +1,185 @@
+"""
+Module for path planning on the grid
+"""
+import heapq
+import numpy as np
+from src.buffers import NULL_POOL
+from src.environment import Environment, DIRECTION_DX, DIRECTION_DY, get_direction_move_energy
+from constants import LOCATION_MARKERS, ENERGY_CONSUMPTION
+
+class DistanceField:
+    """
+    Cost of reaching the nearest dirt from every cell.
+
+    Moves go in the 8 directions (no clamping at the border) and cost what
+    they cost the agent in ENERGY_CONSUMPTION; obstacles are walls. Next to
+    the distance every cell keeps the dirt cell it leads to (`owner`).
+
+    The field is a multi-source Dijkstra run from all dirt cells at once,
+    expanding every cell of equal distance in one vectorised batch. It
+    listens to Environment.__set_cell__ and repairs itself locally: cleaning
+    a dirt cell only recomputes the cells it owned, new dirt or a removed
+    wall only spreads as far as it improves distances, and a new wall only
+    recomputes the region of the dirt behind it.
+    """
+    def __init__(self, environment:Environment, energy_consumption:dict = None, buffers = NULL_POOL):
+        self.environment = environment
+        self.width = environment.grid_size["x"]
+        self.height = environment.grid_size["y"]
+
+        self.distance = buffers.__take__("field.distance", (self.width, self.height), np.float64, np.inf)
+        self.owner = buffers.__take__("field.owner", (self.width, self.height), np.int64, -1)
+        self.flat_distance = self.distance.reshape(-1)
+        self.flat_owner = self.owner.reshape(-1)
+
+        self.offsets = (DIRECTION_DX * self.height + DIRECTION_DY).tolist()
+        move_energy = get_direction_move_energy(energy_consumption if energy_consumption is not None else ENERGY_CONSUMPTION)
+        self.directions = list(zip(DIRECTION_DX.tolist(), DIRECTION_DY.tolist(), move_energy.tolist(), self.offsets))
+
+        # bit d of a cell is set when move d from it stays on the grid
+        xs = np.arange(self.width)[:, None]
+        ys = np.arange(self.height)[None, :]
+        self.move_mask = buffers.__take__("field.move_mask", (self.width, self.height), np.uint8)
+        for d, (dx, dy) in enumerate(zip(DIRECTION_DX.tolist(), DIRECTION_DY.tolist())):
+            inside = (xs + dx >= 0) & (xs + dx < self.width) & (ys + dy >= 0) & (ys + dy < self.height)
+            self.move_mask |= inside.astype(np.uint8) << d
+        self.move_mask = self.move_mask.reshape(-1)
+
+        self.__build__()
+        environment.cell_listeners.append(self.__on_cell_changed__)
+
+    def __build__(self):
+        self.distance[:] = np.inf
+        self.owner[:] = -1
+        sources = np.flatnonzero(self.environment.flat_grid == LOCATION_MARKERS["DIRT"])
+        self.flat_distance[sources] = 0
+        self.flat_owner[sources] = sources
+        self.__propagate__(sources)
+
+    def __steps__(self, cells:np.ndarray):
+        # (cost, neighbour cells, cells they are reached from) of every in-grid, passable move off `cells`
+        moves = self.move_mask[cells]
+        grid = self.environment.flat_grid
+        for d, (_, _, cost, offset) in enumerate(self.directions):
+            origins = cells[(moves & (1 << d)) != 0]
+            targets = origins + offset
+            passable = grid[targets] != LOCATION_MARKERS["OBSTACLE"]
+            yield cost, targets[passable], origins[passable]
+
+    def __propagate__(self, cells:np.ndarray):
+        """
+        Settles the field outwards from `cells`, whose distances were just
+        lowered. Cells of equal distance are expanded together; a cell only
+        takes a neighbour's distance (and owner) when it gets strictly
+        cheaper, so the wave stops where the field is already good.
+        """
+        frontier = {}
+        heap = []
+
+        def push(distance, batch):
+            if distance not in frontier:
+                frontier[distance] = []
+                heapq.heappush(heap, distance)
+            frontier[distance].append(batch)
+
+        cells = np.asarray(cells, dtype=np.int64)
+        for distance in np.unique(self.flat_distance[cells]).tolist():
+            push(distance, cells[self.flat_distance[cells] == distance])
+
+        while heap:
+            distance = heapq.heappop(heap)
+            batch = np.unique(np.concatenate(frontier.pop(distance)))
+            # cells lowered again since they were pushed are expanded from their new batch
+            batch = batch[self.flat_distance[batch] == distance]
+            for cost, targets, origins in self.__steps__(batch):
+                candidate = distance + cost
+                better = self.flat_distance[targets] > candidate
+                if better.any():
+                    targets = targets[better]
+                    self.flat_distance[targets] = candidate
+                    self.flat_owner[targets] = self.flat_owner[origins[better]]
+                    push(candidate, targets)
+
+    def __reseed__(self, cells:np.ndarray):
+        # distance of every cell in `cells` from its neighbours, then spread from those that got one
+        for cost, targets, origins in self.__steps__(cells):
+            # targets are the neighbours, origins the cells being reseeded
+            candidate = self.flat_distance[targets] + cost
+            better = candidate < self.flat_distance[origins]
+            self.flat_distance[origins[better]] = candidate[better]
+            self.flat_owner[origins[better]] = self.flat_owner[targets[better]]
+        self.__propagate__(cells[np.isfinite(self.flat_distance[cells])])
+
+    def __region__(self, source:int)->np.ndarray:
+        """
+        Cells owned by `source`, found by flooding out from it through cells
+        it owns: every owned cell took its owner from a neighbour that had
+        it, so the region is connected and nothing else is touched. Owners
+        of the region are reset to -1 on the way.
+        """
+        if self.flat_owner[source] != source:
+            return np.empty(0, dtype=np.int64)
+        frontier = np.array([source], dtype=np.int64)
+        self.flat_owner[frontier] = -1
+        region = [frontier]
+        while len(frontier):
+            moves = self.move_mask[frontier]
+            reached = []
+            for d, (_, _, _, offset) in enumerate(self.directions):
+                targets = frontier[(moves & (1 << d)) != 0] + offset
+                targets = targets[self.flat_owner[targets] == source]
+                # reset at once, so no later direction takes a cell twice
+                self.flat_owner[targets] = -1
+                reached.append(targets)
+            frontier = np.concatenate(reached)
+            region.append(frontier)
+        return np.concatenate(region)
+
+    def __invalidate__(self, source:int):
+        # forget every cell that led to `source` and recompute them from their surroundings;
+        # everything outside the region keeps its distance, it never went through the region
+        region = self.__region__(source)
+        if len(region) == 0:
+            return
+        self.flat_distance[region] = np.inf
+
+        grid = self.environment.flat_grid
+        passable = region[grid[region] != LOCATION_MARKERS["OBSTACLE"]]
+        # the source itself stays one if it is still dirty
+        sources = passable[grid[passable] == LOCATION_MARKERS["DIRT"]]
+        self.flat_distance[sources] = 0
+        self.flat_owner[sources] = sources
+        self.__reseed__(passable)
+
+    def __on_cell_changed__(self, x:int, y:int, old_marker:int, new_marker:int):
+        if old_marker == new_marker:
+            return
+        cell = x * self.height + y
+        if new_marker == LOCATION_MARKERS["OBSTACLE"]:
+            # a new wall, recompute the region of the dirt it used to lead to
+            source = int(self.flat_owner[cell])
+            if source >= 0:
+                self.__invalidate__(source)
+            self.flat_distance[cell] = np.inf
+            self.flat_owner[cell] = -1
+        elif old_marker == LOCATION_MARKERS["DIRT"]:
+            self.__invalidate__(cell)
+        elif new_marker == LOCATION_MARKERS["DIRT"]:
+            self.flat_distance[cell] = 0
+            self.flat_owner[cell] = cell
+            self.__propagate__(np.array([cell]))
+        elif old_marker == LOCATION_MARKERS["OBSTACLE"]:
+            # a removed wall, the cell gets the best distance of its neighbours
+            self.__reseed__(np.array([cell]))
+
+    def __get_moves__(self, x:int, y:int)->list:
+        # (direction index, neighbour cell, distance through it) of every move off (x, y) onto a passable cell
+        moves = []
+        grid = self.environment.flat_grid
+        for d, (dx, dy, cost, offset) in enumerate(self.directions):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                cell = nx * self.height + ny
+                if grid[cell] != LOCATION_MARKERS["OBSTACLE"]:
+                    moves.append((d, cell, self.flat_distance[cell] + cost))
+        return moves
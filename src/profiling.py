@@ -0,0 +1,78 @@
+"""
+Module for timing the phases of a simulation
+"""
+import time
+import tracemalloc
+
+# allocation sites listed in the summary when memory is traced
+TOP_ALLOCATIONS = 10
+
+class PhaseTimer:
+    """
+    Accumulates wall time per named phase.
+
+    __lap__(phase) charges the time since the previous lap to `phase`, so a
+    run is timed by lapping at the end of every phase with no start/stop
+    pairs. With `trace_memory` tracemalloc runs as well, every phase is
+    also charged the net bytes it allocated, and the summary lists the
+    largest allocation sites of the run.
+    """
+    def __init__(self, trace_memory:bool = False):
+        self.trace_memory = trace_memory
+        self.times = {}
+        self.calls = {}
+        self.allocated = {}
+
+        # tracing someone else started is left running
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.last_traced = tracemalloc.get_traced_memory()[0]
+
+        self.start_time = time.perf_counter()
+        self.last_lap = self.start_time
+
+    def __lap__(self, phase:str):
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + (now - self.last_lap)
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.last_lap = now
+        if self.trace_memory:
+            traced = tracemalloc.get_traced_memory()[0]
+            self.allocated[phase] = self.allocated.get(phase, 0) + (traced - self.last_traced)
+            self.last_traced = traced
+
+    def __summary__(self)->dict:
+        # the `profile` section of meta_data, stops tracemalloc if this timer started it
+        total_time = self.last_lap - self.start_time
+        summary = {
+            "total_time": total_time,
+            "phases": {phase: {"time": self.times[phase],
+                               "calls": self.calls[phase],
+                               "share": self.times[phase] / total_time if total_time > 0 else 0.0}
+                       for phase in self.times}
+        }
+        if self.trace_memory:
+            for phase in self.times:
+                summary["phases"][phase]["allocated_bytes"] = self.allocated.get(phase, 0)
+            summary["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            statistics = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            summary["top_allocations"] = [{"location": str(stat.traceback), "size": stat.size, "count": stat.count}
+                                          for stat in statistics]
+            if self.started_tracing:
+                tracemalloc.stop()
+        return summary
+
+class NullTimer:
+    """
+    Stand-in for PhaseTimer when instrumentation is off, every lap is a no-op.
+    """
+    def __lap__(self, phase:str):
+        pass
+
+    def __summary__(self):
+        return None
+
+NULL_TIMER = NullTimer()
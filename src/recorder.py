@@ -0,0 +1,321 @@
+"""
+Module for recording per-step telemetry of a simulation in typed columns
+"""
+import tempfile
+import numpy as np
+from src.environment import get_direction_name
+
+# rows held per in-memory chunk, and rows held in memory before full chunks go to disk
+CHUNK_SIZE = 64 * 1024
+SPILL_THRESHOLD = 1024 * 1024
+
+class SpillColumn:
+    """
+    Append-only typed column.
+
+    Values are buffered in fixed-size chunks. Once more than
+    `spill_threshold` rows sit in memory the full chunks are appended to an
+    anonymous temporary file and read back through np.memmap, so memory use
+    stays flat however long the run is.
+
+    The column is its own lazy view: len(), integer and slice indexing,
+    iteration and np.asarray() all work without building a Python list.
+    """
+    def __init__(self,
+                 dtype,
+                 chunk_size:int = CHUNK_SIZE,
+                 spill_threshold:int = SPILL_THRESHOLD,
+                 spill_dir:str = None):
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+
+        self.chunks = []
+        self.current = np.empty(chunk_size, dtype=self.dtype)
+        self.fill = 0
+
+        # rows already written to the spill file, and the map over them
+        self.spill_file = None
+        self.spilled = 0
+        self.spilled_map = None
+
+    def __append__(self, value):
+        self.current[self.fill] = value
+        self.fill += 1
+        if self.fill == self.chunk_size:
+            self.chunks.append(self.current)
+            self.current = np.empty(self.chunk_size, dtype=self.dtype)
+            self.fill = 0
+            if len(self.chunks) * self.chunk_size >= self.spill_threshold:
+                self.__spill__()
+
+    def __spill__(self):
+        if self.spill_file is None:
+            # unlinked on creation, the data goes away with the column
+            self.spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+        for chunk in self.chunks:
+            self.spill_file.write(chunk.tobytes())
+        self.spill_file.flush()
+        self.spilled += len(self.chunks) * self.chunk_size
+        self.chunks = []
+        self.spilled_map = None
+
+    def __get_spilled__(self)->np.ndarray:
+        if self.spilled_map is None and self.spilled > 0:
+            self.spilled_map = np.memmap(self.spill_file, dtype=self.dtype, mode="r", shape=(self.spilled,))
+        return self.spilled_map
+
+    def __len__(self):
+        return self.spilled + len(self.chunks) * self.chunk_size + self.fill
+
+    def __read__(self, start:int, stop:int)->np.ndarray:
+        # rows [start, stop) as one array, gathered from disk and memory
+        pieces = []
+        if start < self.spilled:
+            pieces.append(self.__get_spilled__()[start:min(stop, self.spilled)])
+        offset = self.spilled
+        for chunk in self.chunks + [self.current[:self.fill]]:
+            if start < offset + len(chunk) and stop > offset:
+                pieces.append(chunk[max(start - offset, 0):stop - offset])
+            offset += len(chunk)
+        if not pieces:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(pieces)
+
+    def __getitem__(self, index):
+        length = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step < 0:
+                return self.__read__(0, length)[index]
+            return self.__read__(start, max(start, stop))[::step]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("column index out of range")
+        return self.__read__(index, index + 1)[0].item()
+
+    def __iter__(self):
+        if self.spilled > 0:
+            spilled = self.__get_spilled__()
+            for start in range(0, self.spilled, self.chunk_size):
+                yield from spilled[start:start + self.chunk_size].tolist()
+        for chunk in self.chunks:
+            yield from chunk.tolist()
+        yield from self.current[:self.fill].tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.__read__(0, len(self))
+        return data if dtype is None else data.astype(dtype)
+
+    def __repr__(self):
+        return f"""SpillColumn(dtype={self.dtype}, length={len(self)}, spilled={self.spilled})"""
+
+    def __getstate__(self):
+        # pickles (result cache, process pool) carry the values, not the spill file
+        return {"dtype": self.dtype,
+                "chunk_size": self.chunk_size,
+                "spill_threshold": self.spill_threshold,
+                "data": np.asarray(self)}
+
+    def __setstate__(self, state):
+        self.dtype = state["dtype"]
+        self.chunk_size = state["chunk_size"]
+        self.spill_threshold = state["spill_threshold"]
+        self.spill_dir = None
+        self.__load__(state["data"])
+
+    def __load__(self, data:np.ndarray):
+        # replaces the contents with `data`, held in memory until the next spill
+        data = np.asarray(data, dtype=self.dtype)
+        full = len(data) // self.chunk_size * self.chunk_size
+        self.chunks = [data[start:start + self.chunk_size].copy() for start in range(0, full, self.chunk_size)]
+        self.current = np.empty(self.chunk_size, dtype=self.dtype)
+        self.fill = len(data) - full
+        self.current[:self.fill] = data[full:]
+
+        self.spill_file = None
+        self.spilled = 0
+        self.spilled_map = None
+
+class MovesView:
+    """
+    Lazy view of the moves of a run as (x, y, direction) tuples, the shape
+    meta_data["moves_made"] always had.
+    """
+    def __init__(self, x:SpillColumn, y:SpillColumn, direction:SpillColumn):
+        self.x = x
+        self.y = y
+        self.direction = direction
+
+    def __len__(self):
+        return len(self.direction)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(x, y, get_direction_name(d)) for x, y, d in zip(self.x[index].tolist(),
+                                                                      self.y[index].tolist(),
+                                                                      self.direction[index].tolist())]
+        return (self.x[index], self.y[index], get_direction_name(self.direction[index]))
+
+    def __iter__(self):
+        for x, y, d in zip(self.x, self.y, self.direction):
+            yield (x, y, get_direction_name(d))
+
+    def __repr__(self):
+        return repr(self[:])
+
+class PathView:
+    """
+    Lazy view of the path of a run as (steps + 1, 2) int32 rows of (x, y):
+    the start cell, then the cell of every step as recorded. Indexing gives
+    a row, slices and np.asarray() give arrays, read from the columns.
+    """
+    def __init__(self, start:tuple, x:SpillColumn, y:SpillColumn):
+        self.start = start
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return len(self.x) + 1
+
+    def __read__(self, start:int, stop:int)->np.ndarray:
+        rows = np.empty((max(stop - start, 0), 2), dtype=np.int32)
+        if len(rows) == 0:
+            return rows
+        offset = 0
+        if start == 0:
+            rows[0] = self.start
+            offset = 1
+        rows[offset:, 0] = self.x[max(start - 1, 0):stop - 1]
+        rows[offset:, 1] = self.y[max(start - 1, 0):stop - 1]
+        return rows
+
+    def __getitem__(self, index):
+        length = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step < 0:
+                return self.__read__(0, length)[index]
+            return self.__read__(start, max(start, stop))[::step]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("path index out of range")
+        return self.__read__(index, index + 1)[0]
+
+    def __iter__(self):
+        chunk_size = self.x.chunk_size
+        for start in range(0, len(self), chunk_size):
+            yield from self.__read__(start, min(start + chunk_size, len(self)))
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.__read__(0, len(self))
+        return data if dtype is None else data.astype(dtype)
+
+    def __repr__(self):
+        return repr(np.asarray(self))
+
+    def __str__(self):
+        return str(np.asarray(self))
+
+# every column of a StepRecorder
+RECORDER_COLUMNS = ("x", "y", "direction", "step_energy", "battery", "steps_to_clean", "dirt_left")
+
+class StepRecorder:
+    """
+    Columnar telemetry of one run: int16 coordinates (int32 on grids too
+    large for int16), an int8 direction code and float32 energies per step,
+    the steps taken to reach every cleaned spot, and the dirt left before
+    every termination check.
+    """
+    def __init__(self,
+                 grid_size:dict,
+                 chunk_size:int = CHUNK_SIZE,
+                 spill_threshold:int = SPILL_THRESHOLD,
+                 spill_dir:str = None):
+        coordinate_dtype = np.int16 if max(grid_size["x"], grid_size["y"]) <= np.iinfo(np.int16).max else np.int32
+
+        def column(dtype):
+            return SpillColumn(dtype, chunk_size=chunk_size, spill_threshold=spill_threshold, spill_dir=spill_dir)
+
+        self.x = column(coordinate_dtype)
+        self.y = column(coordinate_dtype)
+        self.direction = column(np.int8)
+        self.step_energy = column(np.float32)
+        self.battery = column(np.float32)
+        self.steps_to_clean = column(np.int32)
+        self.dirt_left = column(np.int32)
+
+    def __record_step__(self, x:int, y:int, direction:int, step_energy:float, battery:float):
+        self.x.__append__(x)
+        self.y.__append__(y)
+        self.direction.__append__(direction)
+        self.step_energy.__append__(step_energy)
+        self.battery.__append__(battery)
+
+    def __record_clean__(self, steps_to_clean:int):
+        self.steps_to_clean.__append__(steps_to_clean)
+
+    def __record_dirt_left__(self, dirt_left:int):
+        self.dirt_left.__append__(dirt_left)
+
+    def __moves__(self)->MovesView:
+        return MovesView(self.x, self.y, self.direction)
+
+    def __path__(self, start:tuple)->PathView:
+        return PathView(start, self.x, self.y)
+
+    def __checkpoint__(self, history = None)->dict:
+        # whole columns, or with a src.checkpoint.CheckpointHistory only the rows it has on disk
+        if history is None:
+            return {name: np.asarray(getattr(self, name)) for name in RECORDER_COLUMNS}
+        return {f"""{name}_rows""": history.__append__(name, getattr(self, name)) for name in RECORDER_COLUMNS}
+
+    def __restore__(self, state:dict, history = None):
+        for name in RECORDER_COLUMNS:
+            column = getattr(self, name)
+            if f"""{name}_rows""" in state:
+                column.__load__(history.__read__(name, int(state[f"""{name}_rows"""]), column.dtype))
+            else:
+                column.__load__(state[name])
+
+class SummaryRecorder:
+    """
+    Stand-in for StepRecorder that keeps running totals instead of columns,
+    so its memory does not grow with the number of steps. __reset__ makes
+    it ready for the next run.
+    """
+    __slots__ = ("steps", "energy_spent", "battery", "spots_cleaned", "steps_to_clean_total", "dirt_left")
+
+    def __init__(self):
+        self.__reset__()
+
+    def __reset__(self):
+        self.steps = 0
+        self.energy_spent = 0.0
+        self.battery = None
+        self.spots_cleaned = 0
+        self.steps_to_clean_total = 0
+        self.dirt_left = None
+
+    def __record_step__(self, x:int, y:int, direction:int, step_energy:float, battery:float):
+        self.steps += 1
+        self.energy_spent += step_energy
+        self.battery = battery
+
+    def __record_clean__(self, steps_to_clean:int):
+        self.spots_cleaned += 1
+        self.steps_to_clean_total += steps_to_clean
+
+    def __record_dirt_left__(self, dirt_left:int):
+        self.dirt_left = dirt_left
+
+    def __summary__(self)->dict:
+        return {"steps": self.steps,
+                "energy_spent": round(self.energy_spent, 2),
+                "final_battery": self.battery,
+                "spots_cleaned": self.spots_cleaned,
+                "mean_steps_to_clean": self.steps_to_clean_total / self.spots_cleaned if self.spots_cleaned > 0 else None,
+                "dirt_left": self.dirt_left}
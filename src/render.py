@@ -0,0 +1,98 @@
+"""
+Module for rendering a recorded simulation trace offline
+
+Usage: python -m src.render <trace.npz> <output.gif> [--start N] [--stop N] [--stride K] [--workers W]
+"""
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.trace import load_trace
+from src.visualization import GridRenderer, GifStreamWriter, PngFrameWriter
+
+def render_trace(trace_file:str,
+                 gif_file:str,
+                 start:int=1,
+                 stop:int=None,
+                 frame_stride:int=1,
+                 max_workers:int=None,
+                 chunk_size:int=50,
+                 png_folder:str=None)->int:
+    """
+    Rebuilds frames start..stop (iterations, inclusive) of a recorded run,
+    the initial state of a run that made no step.
+
+    Frames are rendered in chunks across a process pool and written to the
+    GIF in order. At most two chunks per worker are in flight, so memory
+    stays bounded however long the run is. Returns the number of frames.
+    """
+    trace = load_trace(trace_file)
+    last_iteration = len(trace["path"]) - 1
+    stop = last_iteration if stop is None else min(stop, last_iteration)
+    # iteration 0 is the initial state, shown only for a run without steps
+    iterations = list(range(max(start, 1) if last_iteration > 0 else 0, stop + 1, frame_stride))
+    if not iterations:
+        raise ValueError(f"""No iterations to render in {start}..{stop}, the run has {last_iteration}""")
+    if iterations[-1] != stop:
+        iterations.append(stop)
+    chunks = [iterations[i:i + chunk_size] for i in range(0, len(iterations), chunk_size)]
+
+    frame_writers = [GifStreamWriter(gif_file)]
+    if png_folder is not None:
+        frame_writers.append(PngFrameWriter(png_folder))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    window = max_workers * 2
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            next_chunk = 0
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) < window:
+                    pending.append(executor.submit(__render_chunk__, trace_file, chunks[next_chunk]))
+                    next_chunk += 1
+                # chunks are consumed in submission order, so frames stay in order
+                for iteration, frame in pending.popleft().result():
+                    for writer in frame_writers:
+                        writer.__write_frame__(frame, step=iteration)
+    finally:
+        for writer in frame_writers:
+            writer.__close__()
+    return len(iterations)
+
+def __render_chunk__(trace_file:str, iterations:list)->list:
+    trace = load_trace(trace_file)
+    renderer = GridRenderer(grid_shape=trace["grid"].shape,
+                            obstacles=trace["obstacles"],
+                            dirt=trace["dirt"])
+    frames = []
+    for iteration in iterations:
+        # frame of iteration k shows the path after k steps, the dirt stays as laid out
+        # (as in plot_grid), so the trace's clean events are not needed here
+        renderer.__update__(trace["path"][:iteration + 1])
+        frames.append((iteration, renderer.__get_frame__()))
+    return frames
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a recorded simulation trace to a GIF")
+    parser.add_argument("trace_file")
+    parser.add_argument("gif_file")
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--stop", type=int, default=None)
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--png-folder", default=None)
+    args = parser.parse_args()
+
+    frame_count = render_trace(trace_file=args.trace_file,
+                               gif_file=args.gif_file,
+                               start=args.start,
+                               stop=args.stop,
+                               frame_stride=args.stride,
+                               max_workers=args.workers,
+                               chunk_size=args.chunk_size,
+                               png_folder=args.png_folder)
+    print(f"""Rendered {frame_count} frames to {args.gif_file}""")
@@ -1,19 +1,38 @@
 """
 Module to Run multiple simulations and capture logs
 """
-import pandas as pd
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from src.simulation import run_simulation
-from src.visualization import (plot_energy_expenditure_per_step,
-                               plot_battery_usage,
-                               plot_steps_to_clean,
-                               plot_dirt_spots_left)
+from src.cache import ResultCache
+
+# pandas and src.visualization (matplotlib, PIL) are imported where they are used,
+# so headless runs never pay for them
 
 def exec_runner(verbose:bool=False,
-                export_gif:bool=False)->pd.DataFrame:
-    sim_name, performance, meta_data = run_simulation(verbose=verbose, export_gif = export_gif)
-    
+                export_gif:bool=False,
+                n_runs:int=1,
+                max_workers:int=None,
+                seed:int=None,
+                cache:ResultCache=None,
+                policy:str="reflex",
+                report_folder:str=None)->"pd.DataFrame":
+    if n_runs > 1:
+        return exec_parallel_runner(n_runs=n_runs,
+                                    max_workers=max_workers,
+                                    seed=seed,
+                                    export_gif=export_gif,
+                                    cache=cache,
+                                    policy=policy)
+
+    import pandas as pd
+
+    sim_name, performance, meta_data = run_simulation(verbose=verbose, export_gif = export_gif, seed=seed, cache=cache, policy=policy)
+
     print(f"""Simulation {sim_name} completed in {meta_data["time_elapsed"]}s""")
- 
+
     print("=================================")
 
     print(meta_data["moves_made"])
@@ -23,7 +42,108 @@ def exec_runner(verbose:bool=False,
     for elem in performance["performance_metrics"]:
         print(f"""{elem}:{performance["performance_metrics"][elem]}""")
 
-    plot_battery_usage(meta_data["battery_usage"])
-    plot_energy_expenditure_per_step(meta_data["step_energy_expenditure"])
-    plot_steps_to_clean(meta_data["steps_to_clean"])
-    plot_dirt_spots_left(meta_data["dirt_spots_left"])
\ No newline at end of file
+    plot_report(meta_data, report_folder=report_folder)
+
+    return pd.DataFrame([__to_record__(0, seed, sim_name, performance, meta_data)])
+
+def exec_parallel_runner(n_runs:int,
+                         max_workers:int=None,
+                         seed:int=None,
+                         export_gif:bool=False,
+                         cache:ResultCache=None,
+                         on_result=None,
+                         policy:str="reflex",
+                         as_frame:bool=True):
+    """
+    Spreads n_runs simulations over a process pool and gathers one row per run.
+
+    Every run gets its own seed spawned from `seed`, rows are reported as
+    soon as a run completes (through `on_result` if given), and a failing
+    run is recorded with its error instead of aborting the sweep. Rows come
+    back as a pd.DataFrame, or as a list of dicts with as_frame=False.
+    """
+    run_seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_runs)]
+
+    records = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(__run_worker__, run_index, run_seed, export_gif, cache, policy): (run_index, run_seed)
+                   for run_index, run_seed in enumerate(run_seeds)}
+
+        for future in as_completed(futures):
+            run_index, run_seed = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                # the worker process itself died, the pool reports it here
+                record = __to_failed_record__(run_index, run_seed, repr(e))
+
+            records.append(record)
+            print(f"""Run {len(records)}/{n_runs} [{record["run"]}] {record["status"]}""")
+            if on_result is not None:
+                on_result(record)
+
+    failed = [r for r in records if r["status"] != "ok"]
+    if failed:
+        print(f"""{len(failed)} of {n_runs} runs failed""")
+
+    records.sort(key=lambda record: record["run"])
+    if not as_frame:
+        return records
+
+    import pandas as pd
+    return pd.DataFrame(records)
+
+def plot_report(meta_data:dict, report_folder:str=None):
+    """
+    Battery, energy, steps-to-clean and dirt-left plots of one run.
+    Shown one after the other, or saved as PNGs into `report_folder`
+    without ever opening a window.
+    """
+    from src.visualization import (plot_energy_expenditure_per_step,
+                                   plot_battery_usage,
+                                   plot_steps_to_clean,
+                                   plot_dirt_spots_left)
+
+    def file_path(name):
+        return os.path.join(report_folder, f"""{name}.png""") if report_folder is not None else None
+
+    if report_folder is not None:
+        os.makedirs(report_folder, exist_ok=True)
+    plot_battery_usage(meta_data["battery_usage"], file_path=file_path("battery_usage"))
+    plot_energy_expenditure_per_step(meta_data["step_energy_expenditure"], file_path=file_path("energy_expenditure_per_step"))
+    plot_steps_to_clean(meta_data["steps_to_clean"], file_path=file_path("steps_to_clean"))
+    plot_dirt_spots_left(meta_data["dirt_spots_left"], file_path=file_path("dirt_spots_left"))
+
+def __run_worker__(run_index:int, run_seed:int, export_gif:bool=False, cache:ResultCache=None, policy:str="reflex")->dict:
+    try:
+        sim_name, performance, meta_data = run_simulation(simulation_name=f"""run_{run_index}_{run_seed}""",
+                                                          export_gif=export_gif,
+                                                          seed=run_seed,
+                                                          cache=cache,
+                                                          policy=policy)
+    except Exception:
+        return __to_failed_record__(run_index, run_seed, traceback.format_exc())
+    return __to_record__(run_index, run_seed, sim_name, performance, meta_data)
+
+def __to_record__(run_index:int, run_seed:int, sim_name:str, performance:dict, meta_data:dict)->dict:
+    record = {
+        "run": run_index,
+        "seed": run_seed,
+        "simulation_name": sim_name,
+        "status": "ok",
+        "error": None,
+        "termination_code": meta_data["termination_code"],
+        "time_elapsed": meta_data["time_elapsed"]
+    }
+    for section in performance.values():
+        record.update(section)
+    return record
+
+def __to_failed_record__(run_index:int, run_seed:int, error:str)->dict:
+    return {
+        "run": run_index,
+        "seed": run_seed,
+        "simulation_name": None,
+        "status": "failed",
+        "error": error
+    }
@@ -0,0 +1,213 @@
+"""
+Module for scheduling dynamic environment events (dirt respawn, bursts, moving obstacles)
+"""
+import heapq
+import numpy as np
+from src.environment import Environment
+from constants import LOCATION_MARKERS
+
+EVENT_TYPES = {
+    "DIRT_RESPAWN": 0,
+    "DIRT_BURST": 1,
+    "OBSTACLE_MOVE": 2
+}
+
+# an event is one int: (step << STEP_SHIFT) | (event_type << TARGET_BITS) | target
+TARGET_BITS = 32
+STEP_SHIFT = TARGET_BITS + 2
+TARGET_MASK = (1 << TARGET_BITS) - 1
+
+class EventScheduler:
+    """
+    Min-heap of pending events, ordered by step.
+
+    Every event is packed into a single int, so millions of pending respawns
+    stay cheap to hold and compare. Scheduling and popping cost O(log n)
+    each, and a step only touches the events that are due.
+    """
+    def __init__(self):
+        self.heap = []
+
+    def __schedule__(self, step:int, event_type:int, target:int = 0):
+        heapq.heappush(self.heap, (step << STEP_SHIFT) | (event_type << TARGET_BITS) | target)
+
+    def __schedule_many__(self, steps:np.ndarray, event_type:int, targets:np.ndarray):
+        keys = (np.asarray(steps, dtype=np.int64) << STEP_SHIFT) | (event_type << TARGET_BITS) | np.asarray(targets, dtype=np.int64)
+        if len(keys) > len(self.heap) // 8:
+            # a large batch is cheaper to merge with one O(n) heapify
+            self.heap.extend(keys.tolist())
+            heapq.heapify(self.heap)
+        else:
+            for key in keys.tolist():
+                heapq.heappush(self.heap, key)
+
+    def __pop_due__(self, step:int)->list:
+        # (event_type, target) of every event due at or before `step`, in order
+        due = []
+        limit = (step + 1) << STEP_SHIFT
+        while self.heap and self.heap[0] < limit:
+            key = heapq.heappop(self.heap)
+            due.append(((key >> TARGET_BITS) & 0b11, key & TARGET_MASK))
+        return due
+
+    def __next_step__(self):
+        return self.heap[0] >> STEP_SHIFT if self.heap else None
+
+    def __len__(self):
+        return len(self.heap)
+
+class DynamicEnvironment:
+    """
+    Keeps an Environment changing while the agent cleans.
+
+    - every cell with a respawn rate > 0 gets dirty again after an
+      exponentially distributed delay (mean 1/rate steps), if it is clean then.
+      Obstacle cells get no respawns until a moving obstacle leaves them
+    - every `burst_interval` steps up to `burst_size` clean cells around a
+      random centre (within `burst_radius`) get dirty at once
+    - `moving_obstacles` obstacles step to a random clean neighbour every
+      `obstacle_move_interval` steps
+
+    `respawn_rate` is a single rate or a (W, H) array of per-cell rates.
+    All writes go through Environment.__set_cell__, so the dirt index, the
+    grid layers and the cell listeners stay live.
+    """
+    def __init__(self,
+                 environment:Environment,
+                 rng = None,
+                 respawn_rate = 0.0,
+                 burst_interval:int = 0,
+                 burst_size:int = 0,
+                 burst_radius:int = 2,
+                 moving_obstacles:int = 0,
+                 obstacle_move_interval:int = 1):
+        self.environment = environment
+        # np.random.RandomState for seeded runs, the global np.random state otherwise
+        self.rng = rng if rng is not None else np.random
+        self.grid_size = dict(environment.grid_size)
+
+        rates = np.asarray(respawn_rate, dtype=np.float64)
+        self.respawn_rates = np.broadcast_to(rates, (self.grid_size["x"], self.grid_size["y"])).reshape(-1)
+
+        self.burst_interval = burst_interval
+        self.burst_size = burst_size
+        self.burst_radius = burst_radius
+        self.moving_obstacles = min(moving_obstacles, len(environment.obstacle_coords))
+        self.obstacle_move_interval = obstacle_move_interval
+
+        # obstacles move from here on, keep the initial layout intact
+        self.environment.obstacle_coords = self.environment.obstacle_coords.copy()
+
+        self.scheduler = EventScheduler()
+        self.dirt_spawned = 0
+        # cells with a respawn rate but no pending respawn because an obstacle stood on them,
+        # only ever the cells of moving obstacles since the others never leave
+        self.dormant_cells = set()
+
+    def __checkpoint__(self)->dict:
+        # pending events and counters, the moved obstacles are part of the environment's checkpoint
+        return {"events": np.array(self.scheduler.heap, dtype=np.int64),
+                "dirt_spawned": np.int64(self.dirt_spawned),
+                "dormant_cells": np.array(sorted(self.dormant_cells), dtype=np.int64)}
+
+    def __restore__(self, state:dict):
+        # instead of __start__, the events keep their heap order
+        self.scheduler.heap = state["events"].tolist()
+        self.dirt_spawned = int(state["dirt_spawned"])
+        self.dormant_cells = set(state["dormant_cells"].tolist())
+
+    def __respawn_delays__(self, rates:np.ndarray)->np.ndarray:
+        return np.maximum(1, np.ceil(self.rng.exponential(1 / rates))).astype(np.int64)
+
+    def __start__(self, step:int = 0):
+        # an obstacle cell can never get dirty, it is left out instead of churning through the heap
+        cells = np.flatnonzero((self.respawn_rates > 0) & (self.environment.flat_grid != LOCATION_MARKERS["OBSTACLE"]))
+        if len(cells):
+            self.scheduler.__schedule_many__(step + self.__respawn_delays__(self.respawn_rates[cells]),
+                                             EVENT_TYPES["DIRT_RESPAWN"],
+                                             cells)
+        if self.burst_interval > 0 and self.burst_size > 0:
+            self.scheduler.__schedule__(step + self.burst_interval, EVENT_TYPES["DIRT_BURST"])
+        if self.moving_obstacles > 0:
+            # drawn only when obstacles move, so the other events see the same random stream either way
+            for obstacle in self.rng.choice(len(self.environment.obstacle_coords), self.moving_obstacles, replace=False).tolist():
+                self.scheduler.__schedule__(step + self.obstacle_move_interval, EVENT_TYPES["OBSTACLE_MOVE"], obstacle)
+                x, y = self.environment.obstacle_coords[obstacle].tolist()
+                if self.respawn_rates[x * self.grid_size["y"] + y] > 0:
+                    self.dormant_cells.add(x * self.grid_size["y"] + y)
+
+    def __advance__(self, step:int)->int:
+        # apply every event due at `step`, returns the number of cells that got dirty
+        spawned = 0
+        respawn_cells = []
+        for event_type, target in self.scheduler.__pop_due__(step):
+            if event_type == EVENT_TYPES["DIRT_RESPAWN"]:
+                respawn_cells.append(target)
+            elif event_type == EVENT_TYPES["DIRT_BURST"]:
+                spawned += self.__burst__()
+                self.scheduler.__schedule__(step + self.burst_interval, EVENT_TYPES["DIRT_BURST"])
+            elif event_type == EVENT_TYPES["OBSTACLE_MOVE"]:
+                self.__move_obstacle__(target, step)
+                self.scheduler.__schedule__(step + self.obstacle_move_interval, EVENT_TYPES["OBSTACLE_MOVE"], target)
+
+        if respawn_cells:
+            # all respawns of the step at once, then every cell but the obstacle ones gets its next respawn
+            cells = np.array(respawn_cells, dtype=np.int64)
+            markers = self.environment.flat_grid[cells]
+            for cell in cells[markers == LOCATION_MARKERS["CLEAN"]].tolist():
+                x, y = divmod(cell, self.grid_size["y"])
+                self.environment.__set_cell__(x, y, LOCATION_MARKERS["DIRT"])
+                spawned += 1
+            obstacle = markers == LOCATION_MARKERS["OBSTACLE"]
+            if obstacle.any():
+                self.dormant_cells.update(cells[obstacle].tolist())
+                cells = cells[~obstacle]
+            self.scheduler.__schedule_many__(step + self.__respawn_delays__(self.respawn_rates[cells]),
+                                             EVENT_TYPES["DIRT_RESPAWN"],
+                                             cells)
+
+        self.dirt_spawned += spawned
+        return spawned
+
+    def __burst__(self)->int:
+        center_x = self.rng.randint(0, self.grid_size["x"])
+        center_y = self.rng.randint(0, self.grid_size["y"])
+        xs = np.arange(max(center_x - self.burst_radius, 0), min(center_x + self.burst_radius + 1, self.grid_size["x"]))
+        ys = np.arange(max(center_y - self.burst_radius, 0), min(center_y + self.burst_radius + 1, self.grid_size["y"]))
+        cells = (xs[:, None] * self.grid_size["y"] + ys).reshape(-1)
+        clean_cells = cells[self.environment.flat_grid[cells] == LOCATION_MARKERS["CLEAN"]]
+        if len(clean_cells) == 0:
+            return 0
+
+        chosen = self.rng.choice(clean_cells, min(self.burst_size, len(clean_cells)), replace=False)
+        for cell in chosen.tolist():
+            x, y = divmod(cell, self.grid_size["y"])
+            self.environment.__set_cell__(x, y, LOCATION_MARKERS["DIRT"])
+        return len(chosen)
+
+    def __move_obstacle__(self, obstacle:int, step:int):
+        x, y = self.environment.obstacle_coords[obstacle].tolist()
+        if self.environment.__get_cell__(x, y) != LOCATION_MARKERS["OBSTACLE"]:
+            # cleared by the agent (an obstacle under the start cell), nothing left to move
+            self.__wake_cell__(x, y, step)
+            return
+        neighbors = self.environment.__get_neighbors__(x, y)
+        free = neighbors[self.environment.flat_grid[neighbors] == LOCATION_MARKERS["CLEAN"]]
+        if len(free) == 0:
+            return
+
+        new_x, new_y = divmod(int(self.rng.choice(free)), self.grid_size["y"])
+        self.environment.__set_cell__(x, y, LOCATION_MARKERS["CLEAN"])
+        self.environment.__set_cell__(new_x, new_y, LOCATION_MARKERS["OBSTACLE"])
+        self.environment.obstacle_coords[obstacle] = (new_x, new_y)
+
+        self.__wake_cell__(x, y, step)
+
+    def __wake_cell__(self, x:int, y:int, step:int):
+        # a cell no obstacle stands on any more can get dirty again, it gets its next respawn
+        cell = x * self.grid_size["y"] + y
+        if cell in self.dormant_cells:
+            self.dormant_cells.discard(cell)
+            self.scheduler.__schedule__(step + int(self.__respawn_delays__(self.respawn_rates[cell:cell + 1])[0]),
+                                        EVENT_TYPES["DIRT_RESPAWN"],
+                                        cell)
@@ -2,152 +2,555 @@
 Module for running simulations
 """
 import os
+import json
 import time
+import asyncio
+import random
 from datetime import datetime
+import numpy as np
 from src.environment import Environment
-from src.agent import Agent
+from src.tiles import TiledEnvironment
+from src.maps import load_map
+from src.agent import Agent, GoalDirectedAgent
 from src.metrics import evaluate_simulation
-from src.visualization import plot_grid, create_gif
+from src.cache import ResultCache
+from src.trace import TraceRecorder
+from src.recorder import StepRecorder, SummaryRecorder
+from src.buffers import BufferPool, NULL_POOL
+from src.scheduler import DynamicEnvironment
+from src.profiling import PhaseTimer, NULL_TIMER
+from src.checkpoint import CheckpointHistory, load_checkpoint, get_rng_state, set_rng_state
+from src.events import MoveEvent, CleanEvent, EnergyEvent, TerminationEvent, STEP_EVENTS
+from src.subscribers import VerbosePrinter, FrameSubscriber, CheckpointWriter
 from constants import (BASE_PATH,
                        IDLE_LIMIT,
                        INITIAL_ENERGY,
+                       ENERGY_CONSUMPTION,
+                       POPULATION_DENSITY,
                        TERMINATION_CODE,
                        GRID_WIDTH,
                        GRID_HEIGHT)
 
+# agent classes run_simulation can drive, by policy name
+AGENT_POLICIES = {
+    "reflex": Agent,
+    "goal": GoalDirectedAgent
+}
+
+# grid, agent and planner arrays of finished lean runs, each live lean run checks out a pool of its own
+LEAN_BUFFERS = []
+
+def checkout_lean_buffers()->BufferPool:
+    # the pool of a finished lean run, a new one when every pool is in use
+    try:
+        return LEAN_BUFFERS.pop()
+    except IndexError:
+        return BufferPool()
+
+def get_simulation_config(grid_size:dict=None, population_density:dict=None, overrides:dict=None)->dict:
+    """
+    The settings of one run: the constants.py values, with `overrides` on
+    top. Dict settings (population_density, energy_consumption, grid_size)
+    can be overridden in part, e.g. {"energy_consumption": {"CLEAN": 3}}.
+    """
+    config = {
+        "grid_size": grid_size if grid_size is not None else {"x":GRID_WIDTH,"y":GRID_HEIGHT},
+        "population_density": population_density if population_density is not None else POPULATION_DENSITY,
+        "initial_energy": INITIAL_ENERGY,
+        "energy_consumption": ENERGY_CONSUMPTION,
+        "idle_limit": IDLE_LIMIT
+    }
+    for key, value in (overrides or {}).items():
+        if key not in config:
+            raise ValueError(f"""Unknown simulation setting '{key}', expected one of {tuple(config)}""")
+        if isinstance(config[key], dict):
+            value = {**config[key], **value}
+        config[key] = value
+    return config
+
+class SimulationStream:
+    """
+    One run as a stream of step events (see src.events).
+
+    The run is set up on construction and advanced as it is iterated, so
+    the consumer sets the pace: it can stop, sample or tee the run without
+    its history being buffered anywhere. Every event is yielded once the
+    step it describes is complete, and a TerminationEvent ends the stream.
+    Only the classes in `event_types` are built; the run itself is the same
+    whichever are asked for. `async for` works as well, handing control
+    back to the event loop after every event.
+
+    Every stream owns its run: streams alive at the same time (tee'd,
+    threaded or interleaved) share no state. __close__ releases the run
+    once it has been evaluated, `with SimulationStream(...) as stream`
+    does so on leaving the block.
+
+    `checkpoint` is a loaded checkpoint (src.checkpoint) to resume from.
+    `checkpoint_history` is the src.checkpoint.CheckpointHistory the step
+    columns are checkpointed to and resumed from, without one checkpoints
+    hold the whole columns.
+    `environment_map` is a map of src.maps.load_map to run on, the agent
+    starts on its start cell.
+    `tiled` runs on a TiledEnvironment instead, with these keyword
+    arguments (tile_size, max_tiles, directory).
+    `grid_layers` are the bit-packed planes the grid keeps next to its
+    markers, see src.environment.GRID_LAYERS.
+    """
+    def __init__(self,
+                 settings:dict,
+                 policy:str = "reflex",
+                 seed:int = None,
+                 dynamic:dict = None,
+                 max_steps:int = None,
+                 spill_dir:str = None,
+                 lean:bool = False,
+                 timer = NULL_TIMER,
+                 checkpoint:dict = None,
+                 checkpoint_history = None,
+                 event_types:tuple = STEP_EVENTS,
+                 tiled:dict = None,
+                 environment_map:dict = None,
+                 grid_layers:tuple = ()):
+        self.settings = settings
+        self.max_steps = max_steps
+        self.timer = timer
+        self.event_types = frozenset(event_types)
+        self.started = False
+        self.checkpoint_history = checkpoint_history
+
+        if seed is not None:
+            environment_rng = np.random.RandomState(seed)
+            agent_rng = random.Random(seed)
+        else:
+            environment_rng = None
+            agent_rng = None
+
+        # lean runs take their arrays from a finished lean run instead of allocating them,
+        # the pool is theirs until __close__ hands it back
+        self.lean_buffers = checkout_lean_buffers() if lean is True and tiled is None else None
+        buffers = self.lean_buffers if self.lean_buffers is not None else NULL_POOL
+
+        if tiled is not None:
+            # generated tile by tile as the agent gets there, the agent's maps are tiled too
+            self.environ = TiledEnvironment(settings["grid_size"], settings["population_density"], seed=seed, **tiled)
+            buffers = self.environ.buffers
+        else:
+            self.environ = Environment(rng=environment_rng, grid_layers=grid_layers, buffers=buffers)
+            if environment_map is not None and checkpoint is None:
+                self.environ.__static_environment__(environment_map["grid"])
+            else:
+                self.environ.__generate_environment__(grid_size=settings["grid_size"])
+                if checkpoint is not None:
+                    self.environ.__restore__(checkpoint["environment"])
+                else:
+                    self.environ.__populate_grid__(settings["population_density"])
+
+        initial_position = {"x":0,"y":0}
+        if environment_map is not None and environment_map["start"] is not None:
+            initial_position = dict(environment_map["start"])
+
+        # dirt respawn, bursts and moving obstacles, driven by an event scheduler
+        self.dynamic_environment = None
+        if dynamic is not None:
+            self.dynamic_environment = DynamicEnvironment(self.environ, rng=environment_rng, **dynamic)
+            if checkpoint is not None:
+                self.dynamic_environment.__restore__(checkpoint["dynamic"])
+            else:
+                self.dynamic_environment.__start__()
+
+        if lean is True:
+            # running totals only
+            self.recorder = SummaryRecorder()
+        else:
+            # per step telemetry in typed columns, spilled to disk on very long runs
+            self.recorder = StepRecorder(grid_size=self.environ.grid_size, spill_dir=spill_dir)
+
+        self.agent = AGENT_POLICIES[policy](environment=self.environ,
+                                            initial_position=initial_position,
+                                            initial_energy=settings["initial_energy"],
+                                            rng=agent_rng,
+                                            recorder=self.recorder,
+                                            timer=timer,
+                                            energy_consumption=settings["energy_consumption"],
+                                            track_path=not lean,
+                                            buffers=buffers)
+        if "visited" in grid_layers and checkpoint is None:
+            # the agent is not written into the grid where it starts, the visited plane still counts the cell
+            self.environ.grid_descriptor.__set_bit__("visited", self.agent.x * self.environ.grid_size["y"] + self.agent.y, True)
+
+        self.iteration = 0
+        self.idle_count = 0
+        self.termination_code = -1
+        if checkpoint is not None:
+            # the random streams and the loop pick up exactly where the checkpoint was written
+            self.agent.__restore__(checkpoint["agent"])
+            self.recorder.__restore__(checkpoint["recorder"], checkpoint_history)
+            set_rng_state(self.environ.rng, checkpoint["environment_rng"])
+            set_rng_state(self.agent.rng, checkpoint["agent_rng"])
+            self.iteration = int(checkpoint["loop"]["iteration"])
+            self.idle_count = int(checkpoint["loop"]["idle_count"])
+
+        self.loop_start_time = None
+        self.loop_time = None
+        timer.__lap__("setup")
+
+    def __iter__(self):
+        if self.started:
+            raise ValueError("""A SimulationStream can only be iterated once""")
+        self.started = True
+
+        environ = self.environ
+        agent = self.agent
+        recorder = self.recorder
+        timer = self.timer
+        dynamic_environment = self.dynamic_environment
+        idle_limit = self.settings["idle_limit"]
+        emit_move = MoveEvent in self.event_types
+        emit_clean = CleanEvent in self.event_types
+        emit_energy = EnergyEvent in self.event_types
+        emit_step = emit_move or emit_clean or emit_energy
+
+        self.loop_start_time = time.time()
+
+        while True:
+            recorder.__record_dirt_left__(environ.__get_dirt_count__())
+
+            if dynamic_environment is None and environ.__is_grid_clean__()==True:
+                self.termination_code = TERMINATION_CODE["GOAL_COMPLETE"]
+                break
+            elif self.idle_count >= idle_limit:
+                self.termination_code = TERMINATION_CODE["IDLE"]
+                break
+            elif agent.current_energy <= 0:
+                self.termination_code = TERMINATION_CODE["BATTERY_DEAD"]
+                break
+            elif self.max_steps is not None and self.iteration >= self.max_steps:
+                self.termination_code = TERMINATION_CODE["STEP_LIMIT"]
+                break
+
+            timer.__lap__("termination")
+
+            self.iteration += 1
+
+            if dynamic_environment is not None:
+                dynamic_environment.__advance__(self.iteration)
+                timer.__lap__("dynamic")
+
+            dirt_found = agent.__step__()
+
+            if dirt_found == True:
+                # if dirt was found, reset idle count
+                self.idle_count = 0
+            elif agent.__has_goal__():
+                # heading for dirt it knows about, the agent is not idle
+                self.idle_count = 0
+            else:
+                # increment idle counter
+                self.idle_count += 1
+
+            if emit_step:
+                if emit_move:
+                    yield MoveEvent(self.iteration, agent.x, agent.y, agent.last_direction, dirt_found)
+                if emit_clean and dirt_found:
+                    yield CleanEvent(self.iteration, agent.x, agent.y, agent.last_steps_to_clean)
+                if emit_energy:
+                    yield EnergyEvent(self.iteration, agent.last_step_energy, round(agent.current_energy, 2))
+                # whatever the consumer did with the events
+                timer.__lap__("consumer")
+
+        self.loop_time = time.time() - self.loop_start_time
+        timer.__lap__("termination")
+        yield TerminationEvent(self.iteration, self.termination_code)
+
+    async def __aiter__(self):
+        for event in self:
+            yield event
+            await asyncio.sleep(0)
+
+    def __checkpoint__(self)->dict:
+        # everything the run needs to resume, by checkpoint section
+        sections = {
+            "environment": self.environ.__checkpoint__(),
+            "agent": self.agent.__checkpoint__(),
+            "recorder": self.recorder.__checkpoint__(self.checkpoint_history),
+            "environment_rng": get_rng_state(self.environ.rng),
+            "agent_rng": get_rng_state(self.agent.rng),
+            "loop": {"iteration": np.int64(self.iteration),
+                     "idle_count": np.int64(self.idle_count)}
+        }
+        if self.dynamic_environment is not None:
+            sections["dynamic"] = self.dynamic_environment.__checkpoint__()
+        return sections
+
+    @property
+    def dirt_spawned(self)->int:
+        return self.dynamic_environment.dirt_spawned if self.dynamic_environment is not None else 0
+
+    def __evaluate__(self)->dict:
+        performance_evaluation = evaluate_simulation(environment=self.environ,
+                                                     agent=self.agent,
+                                                     dirt_spawned=self.dirt_spawned)
+        self.timer.__lap__("evaluate")
+        return performance_evaluation
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__close__()
+
+    def __close__(self):
+        # the distance field listens to the environment, dropping the cycle frees the run right away
+        self.environ.cell_listeners.clear()
+        if self.lean_buffers is not None:
+            # the run's arrays go to the next lean run, read everything needed from them before
+            LEAN_BUFFERS.append(self.lean_buffers)
+            self.lean_buffers = None
+
 def run_simulation(simulation_name:str=None,
                    verbose:bool=False,
-                   export_gif:bool=False):
+                   export_gif:bool=False,
+                   seed:int=None,
+                   cache:ResultCache=None,
+                   frame_stride:int=1,
+                   keep_png:bool=False,
+                   record_trace:bool=False,
+                   spill_dir:str=None,
+                   dynamic:dict=None,
+                   max_steps:int=None,
+                   policy:str="reflex",
+                   grid_size:dict=None,
+                   population_density:dict=None,
+                   profile:bool=False,
+                   profile_memory:bool=False,
+                   config:dict=None,
+                   checkpoint_file:str=None,
+                   checkpoint_every:int=None,
+                   checkpoint_interval:float=None,
+                   resume:bool=False,
+                   lean:bool=False,
+                   subscribers:list=None,
+                   tiled:dict=None,
+                   map_file:str=None,
+                   grid_layers:tuple=()):
 
     now = datetime.now()
     timestamp = now.strftime("%Y-%m-%d_%H-%M-%S") + f"""-{now.microsecond // 1000:03d}"""
 
+    # constants.py settings, overridden per run by `config`
+    settings = get_simulation_config(grid_size, population_density, config)
+
+    environment_map = None
+    if map_file is not None:
+        if tiled is not None:
+            raise ValueError("""A tiled run generates its own map, it cannot run on a map file""")
+        # parsed once, memory-mapped from the map cache afterwards
+        environment_map = load_map(map_file)
+        settings["grid_size"] = {"x": environment_map["grid"].shape[0], "y": environment_map["grid"].shape[1]}
+        # the map's content goes into the result cache and checkpoint keys
+        settings["map"] = environment_map["key"]
+
+    if lean is True and (verbose or export_gif or record_trace or checkpoint_file is not None):
+        raise ValueError("""A lean run keeps no per-step history, it cannot be verbose, export a GIF, record a trace or checkpoint""")
+
+    if tiled is not None and (policy != "reflex" or dynamic is not None or verbose or export_gif or record_trace
+                              or checkpoint_file is not None or grid_layers):
+        raise ValueError("""A tiled run supports the reflex policy only, without dynamic events, verbose output, a GIF, a trace, checkpoints or grid layers""")
+
+    checkpoint = None
+    checkpoint_history = None
+    if checkpoint_file is not None:
+        # the step columns go to files next to the checkpoint, a checkpoint only appends to them
+        checkpoint_history = CheckpointHistory(checkpoint_file)
+        if export_gif is True:
+            raise ValueError("""A GIF export cannot be checkpointed, run without export_gif or checkpoint_file""")
+        if resume is True and os.path.exists(checkpoint_file):
+            checkpoint = load_checkpoint(checkpoint_file)
+            loop_state = checkpoint["loop"]
+            if str(loop_state["settings"]) != __checkpoint_settings__(settings, policy, dynamic):
+                raise ValueError(f"""Checkpoint {checkpoint_file} was written by a run with other settings, policy or dynamic options""")
+            if not simulation_name:
+                simulation_name = str(loop_state["simulation_name"])
+
     if not simulation_name:
         simulation_name = f"""simulation_{timestamp}"""
 
+    # only seeded runs are reproducible, and a GIF export or a trace has to actually run
+    # (dynamic runs can carry per-cell rate arrays, they are not cached, a profile has to be measured,
+    # a checkpointed run is long enough that it is meant to run and subscribers want the events)
+    use_cache = (cache is not None and seed is not None and not export_gif and not record_trace and dynamic is None
+                 and max_steps is None and not profile and not profile_memory and checkpoint_file is None
+                 and not subscribers and tiled is None)
+
+    if use_cache:
+        cache_config = dict(settings)
+        cache_config["policy"] = policy
+        if lean is True:
+            # lean results carry no series, they must not answer a full run
+            cache_config["lean"] = True
+        if grid_layers:
+            # the planes are part of the result
+            cache_config["grid_layers"] = sorted(grid_layers)
+        cached = cache.__lookup__(cache_config, seed)
+        if cached is not None:
+            cached["meta_data"]["cache_hit"] = True
+            return simulation_name, cached["performance_evaluation"], cached["meta_data"]
+
     if export_gif is True:
+        # matplotlib and PIL are only loaded when there is something to render
+        from src.visualization import GridRenderer, GifStreamWriter, PngFrameWriter
+
         simulation_gif_name = f"""{simulation_name}.gif"""
         png_folder_name = f"""{BASE_PATH}/assets/png/{simulation_name}"""
         gif_folder_name = f"""{BASE_PATH}/assets/gif/{simulation_name}"""
-        os.makedirs(png_folder_name, exist_ok=True)
         os.makedirs(gif_folder_name, exist_ok=True)
 
     start_time = time.time()
 
-    environ = Environment()
-    environ.__generate_environment__(grid_size={"x":GRID_WIDTH,"y":GRID_HEIGHT})
-    environ.__populate_grid__()
+    # time (and with profile_memory, allocations) per phase; laps are no-ops when profiling is off
+    timer = PhaseTimer(trace_memory=profile_memory) if profile or profile_memory else NULL_TIMER
 
-    agent = Agent(environment=environ,
-                  initial_position={"x":0,"y":0},
-                  initial_energy=INITIAL_ENERGY)
+    # the stream is built first so subscribers can look at the run it set up,
+    # and only builds the events the subscribers ask for
+    run_subscribers = list(subscribers or [])
 
-    # List to track number of dirt spots left
-    total_dirt_spots = len(environ.dirty_locations)
-    dirt_spots_left = []
+    if record_trace is True:
+        trace_folder_name = f"""{BASE_PATH}/assets/trace"""
+        os.makedirs(trace_folder_name, exist_ok=True)
+        trace_file = f"""{trace_folder_name}/{simulation_name}.npz"""
 
+    event_types = {TerminationEvent}
+    event_types.update(event_type for subscriber in run_subscribers for event_type in subscriber.event_types)
     if verbose:
-        print("------------------------------------")
-        print("INITIAL SETUP")
-        print("Current Location:", agent.current_position)
-        print("Path Followed:", agent.path_followed)
-        print("------------------------------------")
-        environ.__print_grid__()
-
-    iteration = 0
-    idle_count = 0
-
-    termination_code = -1
-
-    while True:
-        cleaned_count = len(agent.cleaned_dirt_spots)
-        remaining_dirt_spots = total_dirt_spots - cleaned_count
-        dirt_spots_left.append(remaining_dirt_spots)
-
-        if environ.__is_grid_clean__()==True:
-            if verbose:
-                print("===================================")
-                print("Simulation Terminated: All Dirt Cleaned")
-                print("===================================")
-            termination_code = TERMINATION_CODE["GOAL_COMPLETE"]
-            break
-        elif idle_count >= IDLE_LIMIT:
-            if verbose:
-                print("===================================")
-                print("Simulation Terminated: Agent Idle")
-                print("===================================")
-            termination_code = TERMINATION_CODE["IDLE"]
-            break
-        elif agent.current_energy <= 0:
-            if verbose:
-                print("===================================")
-                print("Simulation Terminated: Battery Dead")
-                print("===================================")
-            termination_code = TERMINATION_CODE["BATTERY_DEAD"]
-            break
-
-        iteration += 1
-        
-        if verbose:
-            print("===================================")
-            print("Iteration:",iteration)
-            print("===================================")
-        dirt_found = agent.__step__(verbose)
+        event_types.update(VerbosePrinter.event_types)
+    if record_trace is True:
+        event_types.update(TraceRecorder.event_types)
+    if export_gif is True:
+        event_types.update(FrameSubscriber.event_types)
+    if checkpoint_file is not None:
+        event_types.update(CheckpointWriter.event_types)
+
+    stream = SimulationStream(settings=settings,
+                              policy=policy,
+                              seed=seed,
+                              dynamic=dynamic,
+                              max_steps=max_steps,
+                              spill_dir=spill_dir,
+                              lean=lean,
+                              timer=timer,
+                              checkpoint=checkpoint,
+                              checkpoint_history=checkpoint_history,
+                              event_types=tuple(event_types),
+                              tiled=tiled,
+                              environment_map=environment_map,
+                              grid_layers=tuple(grid_layers))
+    # the stream is released however the run ends, a lean run's pool goes back for the next run
+    with stream:
+        environ = stream.environ
+        agent = stream.agent
 
-        if dirt_found == True:
-            # if dirt was found, reset idle count
-            idle_count = 0
-        else:
-            # increment idle counter
-            idle_count += 1
-        
         if verbose:
-            environ.__print_grid__()
-            print("------------------------------------")
-            print("Current Location:\n", agent.current_position)
-            print("Path Followed:\n", agent.path_followed)
-            print("------------------------------------")
-        
+            run_subscribers.append(VerbosePrinter(stream))
+            timer.__lap__("print")
+
+        if record_trace is True:
+            trace = TraceRecorder(grid=environ.grid_descriptor.grid,
+                                  obstacles=environ.obstacle_coords,
+                                  dirt=environ.dirt_coords)
+            if checkpoint is not None and "trace" in checkpoint:
+                trace.__restore__(checkpoint["trace"])
+            run_subscribers.append(trace)
+
         if export_gif is True:
-            plot_grid(
-                environment=environ,
-                path_followed=agent.path_followed,
-                obstacles=environ.obstacles,
-                dirt=environ.dirty_locations,
-                file_path=png_folder_name,
-                fig_name=iteration
-            )
+            renderer = GridRenderer(grid_shape=environ.grid_descriptor.grid.shape,
+                                    obstacles=environ.obstacles,
+                                    dirt=environ.dirty_locations)
+            # frames go straight from the renderer to the writers, nothing is buffered
+            frame_writers = [GifStreamWriter(f"""{gif_folder_name}/{simulation_gif_name}""")]
+            if keep_png is True:
+                frame_writers.append(PngFrameWriter(png_folder_name))
+            run_subscribers.append(FrameSubscriber(renderer, frame_writers, agent.initial_position, frame_stride=frame_stride))
 
-    if export_gif is True:
-        create_gif(image_folder=png_folder_name,
-                gif_folder=gif_folder_name,
-                    gif_filename=simulation_gif_name)
+        if checkpoint_file is not None:
+            # after the trace, so a checkpoint includes the step's clean event
+            run_subscribers.append(CheckpointWriter(stream,
+                                                    checkpoint_file,
+                                                    every=checkpoint_every,
+                                                    interval=checkpoint_interval,
+                                                    components={"trace": trace} if record_trace is True else None,
+                                                    metadata={"simulation_name": np.array(simulation_name),
+                                                              "settings": np.array(__checkpoint_settings__(settings, policy, dynamic))}))
 
-    performance_evaluation = evaluate_simulation(environment=environ,
-                                                    agent=agent)
-    
-    # if verbose:
-    print("TERMINATION CODE:", termination_code)
+        # subscribers per event class, in the order they were added
+        dispatch = {event_type: [subscriber for subscriber in run_subscribers if event_type in subscriber.event_types]
+                    for event_type in event_types}
 
-    end_time = time.time()
-    time_elapsed = end_time - start_time
+        try:
+            for event in stream:
+                for subscriber in dispatch[type(event)]:
+                    subscriber.__on_event__(event)
+                    timer.__lap__(subscriber.phase)
+        finally:
+            # files the subscribers hold are closed even when the run fails
+            for subscriber in run_subscribers:
+                subscriber.__close__()
+                timer.__lap__(subscriber.phase)
 
-    if verbose:
-        print(f"""Executed in {round(time_elapsed,2)}s""")
-
-        print("===================================")
-        print("===================================")
-
-    meta_data = {
-        "termination_code": termination_code,
-        "start_time": start_time,
-        "end_time": end_time,
-        "time_elapsed": time_elapsed,
-        "moves_made": agent.moves_made,
-        "step_energy_expenditure": agent.step_energy_expense,
-        "battery_usage": agent.battery_left,
-        "steps_to_clean": agent.steps_to_clean,
-        "dirt_spots_left": dirt_spots_left
-    }
+        if record_trace is True:
+            trace.__save__(trace_file, agent.path_followed)
+            timer.__lap__("record")
+
+        performance_evaluation = stream.__evaluate__()
+        iteration = stream.iteration
+        termination_code = stream.termination_code
+
+        if lean is False:
+            print("TERMINATION CODE:", termination_code)
+
+        end_time = time.time()
+        time_elapsed = end_time - start_time
+
+        if verbose:
+            print(f"""Executed in {round(time_elapsed,2)}s""")
+
+            print("===================================")
+            print("===================================")
+        timer.__lap__("print")
+
+        recorder = stream.recorder
+        meta_data = {
+            "termination_code": termination_code,
+            "start_time": start_time,
+            "end_time": end_time,
+            "time_elapsed": time_elapsed,
+            "setup_time": stream.loop_start_time - start_time,
+            "loop_time": stream.loop_time,
+            "iterations": iteration,
+            # lean runs have no series, only the running totals of `summary`
+            "moves_made": agent.moves_made if lean is False else None,
+            "step_energy_expenditure": agent.step_energy_expense if lean is False else None,
+            "battery_usage": agent.battery_left if lean is False else None,
+            "steps_to_clean": agent.steps_to_clean if lean is False else None,
+            "dirt_spots_left": recorder.dirt_left if lean is False else None,
+            "summary": recorder.__summary__() if lean is True else None,
+            "dirt_spawned": stream.dirt_spawned,
+            "cache_hit": False,
+            "trace_file": trace_file if record_trace is True else None,
+            "profile": timer.__summary__(),
+            "tiles": environ.__tile_stats__() if tiled is not None else None,
+            # copied, a lean run's planes go back to the pool with the stream
+            "grid_layers": {layer: plane.copy() for layer, plane in environ.grid_descriptor.layers.items()} if grid_layers else None
+        }
+
+    if use_cache:
+        cache.__store__(cache_config, seed, {
+            "performance_evaluation": performance_evaluation,
+            "meta_data": meta_data
+        })
 
     return simulation_name, performance_evaluation, meta_data
+
+def __checkpoint_settings__(settings:dict, policy:str, dynamic:dict)->str:
+    # what a checkpoint has to agree with to be resumed, per-cell rate arrays are compared by value
+    dynamic = {key: np.asarray(value).tolist() for key, value in dynamic.items()} if dynamic is not None else None
+    return json.dumps({"settings": settings, "policy": policy, "dynamic": dynamic}, sort_keys=True)
@@ -0,0 +1,167 @@
+"""
+Module for spatial indexing of grid cells
+"""
+import numpy as np
+from src.common import euclidean_distance, manhatten_distance, chebyshev_distance
+
+# side of the square buckets cells are grouped in
+BUCKET_SIZE = 16
+
+# metrics a nearest query can rank by, all of them work on coordinate arrays
+DISTANCE_METRICS = {
+    "euclidean": lambda x1, y1, x2, y2: euclidean_distance(x1, y1, x2, y2, rounded=False),
+    "manhattan": manhatten_distance,
+    "chebyshev": chebyshev_distance
+}
+
+class BucketGrid:
+    """
+    Set of grid cells (flat x*H + y indices) bucketed by location.
+
+    The grid is cut into BUCKET_SIZE x BUCKET_SIZE buckets, each holding a
+    set of its cells next to a count per bucket. Insertion and deletion are
+    O(1); a nearest query scans rings of buckets outwards from the query
+    cell, skipping empty buckets by their count, and stops once no bucket
+    further out can hold anything closer.
+
+    It is a drop-in for a plain set of cells: len(), `cell in index` and
+    iteration all work.
+    """
+    def __init__(self, grid_size:dict, bucket_size:int = BUCKET_SIZE):
+        self.grid_height = grid_size["y"]
+        self.bucket_size = bucket_size
+        self.bucket_rows = max(-(-grid_size["x"] // bucket_size), 1)
+        self.bucket_columns = max(-(-grid_size["y"] // bucket_size), 1)
+
+        self.buckets = {}
+        self.counts = np.zeros((self.bucket_rows, self.bucket_columns), dtype=np.int64)
+        self.flat_counts = self.counts.reshape(-1)
+        self.count = 0
+
+    def __bucket__(self, cell:int)->int:
+        x, y = divmod(cell, self.grid_height)
+        return (x // self.bucket_size) * self.bucket_columns + y // self.bucket_size
+
+    def __build__(self, cells:np.ndarray):
+        # bulk load, replaces whatever the index held
+        cells = np.asarray(cells, dtype=np.int64)
+        xs, ys = np.divmod(cells, self.grid_height)
+        bucket_ids = (xs // self.bucket_size) * self.bucket_columns + ys // self.bucket_size
+        order = np.argsort(bucket_ids, kind="stable")
+        bucket_ids, cells = bucket_ids[order], cells[order]
+        starts = np.flatnonzero(np.diff(bucket_ids, prepend=-1))
+        ends = np.append(starts[1:], len(cells))
+
+        self.buckets = {bucket: set(cells[start:end].tolist())
+                        for bucket, start, end in zip(bucket_ids[starts].tolist(), starts.tolist(), ends.tolist())}
+        self.flat_counts[:] = 0
+        self.flat_counts[bucket_ids[starts]] = ends - starts
+        self.count = len(cells)
+
+    def __insert__(self, cell:int):
+        x, y = divmod(cell, self.grid_height)
+        bucket = (x // self.bucket_size) * self.bucket_columns + y // self.bucket_size
+        cells = self.buckets.get(bucket)
+        if cells is None:
+            cells = self.buckets[bucket] = set()
+        if cell not in cells:
+            cells.add(cell)
+            self.flat_counts[bucket] += 1
+            self.count += 1
+
+    def __remove__(self, cell:int):
+        x, y = divmod(cell, self.grid_height)
+        bucket = (x // self.bucket_size) * self.bucket_columns + y // self.bucket_size
+        cells = self.buckets.get(bucket)
+        if cells is not None and cell in cells:
+            cells.remove(cell)
+            self.flat_counts[bucket] -= 1
+            self.count -= 1
+
+    def __remove_many__(self, cells:np.ndarray):
+        # bulk __remove__, one set update per bucket touched
+        cells = np.asarray(cells, dtype=np.int64)
+        if len(cells) <= self.bucket_size:
+            # too few to be worth grouping
+            for cell in cells.tolist():
+                self.__remove__(cell)
+            return
+        xs, ys = np.divmod(cells, self.grid_height)
+        bucket_ids = (xs // self.bucket_size) * self.bucket_columns + ys // self.bucket_size
+        for bucket in np.unique(bucket_ids).tolist():
+            bucket_cells = self.buckets.get(bucket)
+            if bucket_cells is None:
+                continue
+            before = len(bucket_cells)
+            bucket_cells.difference_update(cells[bucket_ids == bucket].tolist())
+            self.flat_counts[bucket] -= before - len(bucket_cells)
+            self.count -= before - len(bucket_cells)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, cell):
+        cells = self.buckets.get(self.__bucket__(cell))
+        return cells is not None and cell in cells
+
+    def __iter__(self):
+        for cells in self.buckets.values():
+            yield from cells
+
+    def __ring__(self, row:int, column:int, radius:int)->list:
+        # ids of the non-empty buckets exactly `radius` buckets away (Chebyshev) from (row, column)
+        if radius == 0:
+            return [row * self.bucket_columns + column] if self.counts[row, column] else []
+        c0, c1 = max(column - radius, 0), min(column + radius, self.bucket_columns - 1)
+        r0, r1 = max(row - radius + 1, 0), min(row + radius - 1, self.bucket_rows - 1)
+        ring = []
+        for edge_row in (row - radius, row + radius):
+            if 0 <= edge_row < self.bucket_rows:
+                ring.extend((edge_row * self.bucket_columns + c0 + np.flatnonzero(self.counts[edge_row, c0:c1 + 1])).tolist())
+        for edge_column in (column - radius, column + radius):
+            if 0 <= edge_column < self.bucket_columns and r0 <= r1:
+                ring.extend(((r0 + np.flatnonzero(self.counts[r0:r1 + 1, edge_column])) * self.bucket_columns + edge_column).tolist())
+        return ring
+
+    def __nearest__(self, x:int, y:int, k:int = 1, metric:str = "euclidean")->list:
+        """
+        The k cells closest to (x, y) under `metric` (see DISTANCE_METRICS),
+        as (x, y, distance) tuples, closest first and ties in cell order.
+        """
+        distance_function = DISTANCE_METRICS[metric]
+        k = min(k, self.count)
+        if k <= 0:
+            return []
+
+        row, column = x // self.bucket_size, y // self.bucket_size
+        candidates = []
+        radius = 0
+        while True:
+            for bucket in self.__ring__(row, column, radius):
+                candidates.extend(self.buckets[bucket])
+
+            # every cell outside the scanned block is at least `bound` away, whatever the metric
+            r0, r1 = row - radius, row + radius
+            c0, c1 = column - radius, column + radius
+            gaps = []
+            if r0 > 0:
+                gaps.append(x - r0 * self.bucket_size + 1)
+            if r1 < self.bucket_rows - 1:
+                gaps.append((r1 + 1) * self.bucket_size - x)
+            if c0 > 0:
+                gaps.append(y - c0 * self.bucket_size + 1)
+            if c1 < self.bucket_columns - 1:
+                gaps.append((c1 + 1) * self.bucket_size - y)
+            bound = min(gaps) if gaps else float("inf")
+
+            if len(candidates) >= k:
+                cells = np.array(candidates, dtype=np.int64)
+                xs, ys = np.divmod(cells, self.grid_height)
+                distances = distance_function(x, y, xs, ys)
+                order = np.lexsort((cells, distances))[:k]
+                # nothing further out can beat or tie the k-th once it is closer than the bound
+                if distances[order[-1]] < bound or not gaps:
+                    return [(cx, cy, distance) for cx, cy, distance in zip(xs[order].tolist(),
+                                                                           ys[order].tolist(),
+                                                                           distances[order].tolist())]
+            radius += 1
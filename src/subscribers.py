@@ -0,0 +1,169 @@
+"""
+Module for subscribers to the step events of a simulation run
+
+A subscriber lists the event classes it wants in `event_types`, names the
+profiling phase its work is charged to in `phase`, and gets every such
+event in __on_event__ and a __close__ once the run has ended.
+"""
+import os
+import time
+import numpy as np
+from src.buffers import GrowableArray
+from src.checkpoint import save_checkpoint
+from src.environment import DIRECTION_NAMES
+from src.events import MoveEvent, CleanEvent, EnergyEvent, TerminationEvent
+from constants import TERMINATION_CODE
+
+TERMINATION_MESSAGES = {
+    TERMINATION_CODE["GOAL_COMPLETE"]: "All Dirt Cleaned",
+    TERMINATION_CODE["IDLE"]: "Agent Idle",
+    TERMINATION_CODE["BATTERY_DEAD"]: "Battery Dead",
+    TERMINATION_CODE["STEP_LIMIT"]: "Step Limit Reached"
+}
+
+class VerbosePrinter:
+    """
+    The step by step printout of a verbose run: the initial setup, then the
+    move, grid, location and path after every step, and why the run ended.
+    """
+    event_types = (MoveEvent, TerminationEvent)
+    phase = "print"
+
+    def __init__(self, stream):
+        self.environment = stream.environ
+        self.agent = stream.agent
+
+        print("------------------------------------")
+        print("INITIAL SETUP")
+        print("Current Location:", self.agent.current_position)
+        print("Path Followed:", self.agent.path_followed)
+        print("------------------------------------")
+        self.environment.__print_grid__()
+
+    def __on_event__(self, event):
+        if isinstance(event, TerminationEvent):
+            print("===================================")
+            print(f"""Simulation Terminated: {TERMINATION_MESSAGES[event.termination_code]}""")
+            print("===================================")
+            return
+
+        print("===================================")
+        print("Iteration:", event.step)
+        print("===================================")
+        if event.direction is None:
+            print("moving to:", (event.x, event.y))
+        else:
+            print("moving to:", (event.x, event.y, DIRECTION_NAMES[event.direction]))
+        self.environment.__print_grid__()
+        print("------------------------------------")
+        print("Current Location:\n", self.agent.current_position)
+        print("Path Followed:\n", self.agent.path_followed)
+        print("------------------------------------")
+
+    def __close__(self):
+        pass
+
+class FrameSubscriber:
+    """
+    Renders every `frame_stride`-th step of the run, and always the final
+    state (the initial one when the run made no step), to the frame writers
+    of src.visualization. The path is rebuilt from the MoveEvents, so it
+    does not need the agent's own.
+    """
+    event_types = (MoveEvent, TerminationEvent)
+    phase = "render"
+
+    def __init__(self, renderer, frame_writers:list, initial_position:dict, frame_stride:int = 1):
+        self.renderer = renderer
+        self.frame_writers = frame_writers
+        self.frame_stride = frame_stride
+        self.path = GrowableArray(np.int32, row_shape=(2,))
+        self.path.__append__((initial_position["x"], initial_position["y"]))
+        self.last_rendered_step = None
+
+    def __on_event__(self, event):
+        if isinstance(event, TerminationEvent):
+            # always end on the final state, even when the stride skipped it or there was no step
+            if self.last_rendered_step != event.step:
+                self.__render__(event.step)
+            return
+        self.path.__append__((event.x, event.y))
+        if event.step % self.frame_stride == 0:
+            self.__render__(event.step)
+
+    def __render__(self, step:int):
+        self.renderer.__update__(self.path.__view__())
+        frame = self.renderer.__get_frame__()
+        for writer in self.frame_writers:
+            writer.__write_frame__(frame, step=step)
+        self.last_rendered_step = step
+
+    def __close__(self):
+        for writer in self.frame_writers:
+            writer.__close__()
+
+class CheckpointWriter:
+    """
+    Writes a checkpoint of the run (see src.checkpoint) every `every` steps
+    and/or every `interval` seconds, once the step is complete.
+
+    `components` are further checkpointed objects by section name (e.g. a
+    TraceRecorder), `metadata` goes into the "loop" section. The file, and
+    the step columns the stream's CheckpointHistory keeps next to it, are
+    removed when the run ends, there is nothing left to resume then.
+    """
+    event_types = (EnergyEvent, TerminationEvent)
+    phase = "checkpoint"
+
+    def __init__(self, stream, file_name:str, every:int = None, interval:float = None,
+                 components:dict = None, metadata:dict = None):
+        self.stream = stream
+        self.file_name = file_name
+        self.every = every
+        self.interval = interval
+        self.components = components or {}
+        self.metadata = metadata or {}
+        self.last_checkpoint_time = time.time()
+
+    def __on_event__(self, event):
+        if isinstance(event, TerminationEvent):
+            if os.path.exists(self.file_name):
+                os.remove(self.file_name)
+            if self.stream.checkpoint_history is not None:
+                self.stream.checkpoint_history.__remove__()
+            return
+        if ((self.every is not None and event.step % self.every == 0)
+                or (self.interval is not None and time.time() - self.last_checkpoint_time >= self.interval)):
+            sections = self.stream.__checkpoint__()
+            sections["loop"].update(self.metadata)
+            for name, component in self.components.items():
+                sections[name] = component.__checkpoint__()
+            save_checkpoint(self.file_name, sections)
+            self.last_checkpoint_time = time.time()
+
+    def __close__(self):
+        pass
+
+class ProgressMonitor:
+    """
+    Live progress of a long run: every `every` steps `report` is called with
+    a one-line status (step, battery, spots cleaned so far).
+    """
+    event_types = (CleanEvent, EnergyEvent, TerminationEvent)
+    phase = "monitor"
+
+    def __init__(self, every:int = 1000, report = print):
+        self.every = every
+        self.report = report
+        self.spots_cleaned = 0
+
+    def __on_event__(self, event):
+        if isinstance(event, CleanEvent):
+            self.spots_cleaned += 1
+        elif isinstance(event, TerminationEvent):
+            self.report(f"""step {event.step}: terminated with code {event.termination_code}, {self.spots_cleaned} spots cleaned""")
+        elif event.step % self.every == 0:
+            self.report(f"""step {event.step}: battery {event.battery}, {self.spots_cleaned} spots cleaned""")
+
+    def __close__(self):
+        pass
@@ -0,0 +1,217 @@
+"""
+Module for tuning simulation settings with successive halving
+
+Usage: python -m src.sweep <search_space.json> [--metric M] [--minimize] [--eta N] [--min-seeds N] [--seed S] [--workers W] [--output result.json]
+"""
+import json
+import math
+import random
+import argparse
+import itertools
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from src.simulation import run_simulation, get_simulation_config
+from src.metrics import compute_metrics
+
+def expand_search_space(search_space:dict)->list:
+    """
+    Every combination of a search space as run_simulation `config` overrides.
+
+    Keys are settings of get_simulation_config, with a dot to reach into the
+    dict settings, and map to the values to try, e.g.
+    {"idle_limit": [10, 30], "energy_consumption.CLEAN": [3, 5]}.
+    """
+    keys = list(search_space)
+    candidates = []
+    for values in itertools.product(*(search_space[key] for key in keys)):
+        overrides = {}
+        for key, value in zip(keys, values):
+            setting, _, field = key.partition(".")
+            if field:
+                overrides.setdefault(setting, {})[field] = value
+            else:
+                overrides[setting] = value
+        # fails early on a misspelt setting
+        get_simulation_config(overrides=overrides)
+        candidates.append(overrides)
+    return candidates
+
+def successive_halving(search_space:dict,
+                       metric:str="percentage_dirt_cleaned",
+                       maximize:bool=True,
+                       eta:int=2,
+                       min_seeds:int=1,
+                       n_candidates:int=None,
+                       seed:int=0,
+                       max_workers:int=None,
+                       policy:str="reflex")->dict:
+    """
+    Finds the best settings in `search_space` by the mean of an
+    evaluate_simulation metric over seeded runs.
+
+    Every round runs the surviving candidates on eta times more seeds than
+    the round before (the seeds of earlier rounds are kept, and every
+    candidate sees the same seeds), then keeps the best 1/eta of them,
+    until one is left. `n_candidates` samples that many combinations
+    instead of trying all of them.
+
+    A candidate with a failed run (an exception in the run, or a worker
+    process that died) is eliminated in that round and reported with its
+    error, the other candidates carry on. "best" is None when every
+    candidate failed.
+    """
+    if metric not in get_metric_names():
+        raise ValueError(f"""Unknown metric '{metric}', expected one of {get_metric_names()}""")
+    if eta < 2:
+        raise ValueError(f"""eta has to be at least 2, got {eta}""")
+
+    candidates = expand_search_space(search_space)
+    if n_candidates is not None and n_candidates < len(candidates):
+        candidates = random.Random(seed).sample(candidates, n_candidates)
+
+    # rounds until one candidate is left: the smallest n with eta ** n >= candidates, in integers
+    n_rounds = 1
+    while eta ** n_rounds < len(candidates):
+        n_rounds += 1
+    max_seeds = min_seeds * eta ** (n_rounds - 1)
+    run_seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(max_seeds)]
+
+    # metric value of every (candidate, seed) run so far, and the error of every failed candidate
+    scores = {index: [] for index in range(len(candidates))}
+    errors = {}
+    alive = list(range(len(candidates)))
+    rounds = []
+    total_runs = 0
+
+    for round_index in range(n_rounds):
+        n_seeds = min_seeds * eta ** round_index
+        tasks = [(index, run_seed) for index in alive for run_seed in run_seeds[len(scores[index]):n_seeds]]
+        results = __run_tasks__([(candidates[index], run_seed, metric, policy) for index, run_seed in tasks], max_workers)
+        for (index, _), (value, error) in zip(tasks, results):
+            scores[index].append(value)
+            if error is not None:
+                errors.setdefault(index, error)
+        total_runs += len(tasks)
+
+        failed = [index for index in alive if index in errors]
+        ranked = sorted([index for index in alive if index not in errors],
+                        key=lambda index: __mean_score__(scores[index], maximize), reverse=maximize)
+        rounds.append({"round": round_index,
+                       "seeds": n_seeds,
+                       "candidates": [{"config": candidates[index], "score": __result_score__(scores[index], maximize)}
+                                      for index in ranked]
+                                     + [{"config": candidates[index], "score": None, "error": errors[index]}
+                                        for index in failed]})
+        best_score = __result_score__(scores[ranked[0]], maximize) if ranked else None
+        print(f"""Round {round_index}: {len(alive)} candidates x {n_seeds} seeds, {len(failed)} failed, best {metric}={best_score}""")
+
+        alive = ranked[:max(1, math.ceil(len(alive) / eta))]
+        if not alive:
+            break
+
+    best = alive[0] if alive else None
+    return {
+        "metric": metric,
+        "maximize": maximize,
+        "best": {"config": candidates[best],
+                 "score": __result_score__(scores[best], maximize),
+                 "seeds": len(scores[best])} if best is not None else None,
+        "rounds": rounds,
+        "runs": total_runs,
+        # what running every candidate on as many seeds as the winner would have cost
+        "grid_search_runs": len(candidates) * max_seeds
+    }
+
+def __run_tasks__(tasks:list, max_workers:int)->list:
+    """
+    (value, error) of every __sweep_worker__ argument tuple in `tasks`, in
+    order. A worker process that dies breaks the whole pool and every run
+    still in it, so those runs are run again in a pool of their own each:
+    only the run that kills its worker fails.
+    """
+    results = [None] * len(tasks)
+    broken = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(__sweep_worker__, *task) for task in tasks]
+        for position, future in enumerate(futures):
+            try:
+                results[position] = future.result()
+            except BrokenProcessPool:
+                broken.append(position)
+            except Exception as e:
+                results[position] = (None, repr(e))
+
+    for position in broken:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                results[position] = executor.submit(__sweep_worker__, *tasks[position]).result()
+            except Exception as e:
+                # the worker process itself died, the pool reports it here
+                results[position] = (None, repr(e))
+    return results
+
+def get_metric_names()->tuple:
+    # every metric compute_metrics reports, read off an evaluation of a made up run
+    performance = compute_metrics(initial_dirt_count=1, final_dirt_count=0, total_steps_taken=1,
+                                  unique_locations_visited=1, total_obstacles=1, total_obstacles_detected=1,
+                                  initial_energy=1, current_energy=0)
+    return tuple(metric for section in performance.values() for metric in section)
+
+def __mean_score__(values:list, maximize:bool)->float:
+    # undefined metrics count as the worst possible value
+    worst = -math.inf if maximize else math.inf
+    return float(np.mean([worst if value is None else value for value in values]))
+
+def __result_score__(values:list, maximize:bool)->float:
+    # the mean score as reported, None when it is infinite (JSON has no infinity)
+    score = __mean_score__(values, maximize)
+    return score if math.isfinite(score) else None
+
+def __sweep_worker__(overrides:dict, run_seed:int, metric:str, policy:str)->tuple:
+    # (metric value, None), or (None, traceback) when the run failed
+    try:
+        _, performance, _ = run_simulation(seed=run_seed, config=overrides, policy=policy, lean=True)
+    except Exception:
+        return None, traceback.format_exc()
+    # the metric name was checked before any run was submitted
+    for section in performance.values():
+        if metric in section:
+            return section[metric], None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune simulation settings with successive halving")
+    parser.add_argument("search_space_file", help="JSON object of setting -> list of values")
+    parser.add_argument("--metric", default="percentage_dirt_cleaned")
+    parser.add_argument("--minimize", action="store_true")
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--min-seeds", type=int, default=1)
+    parser.add_argument("--candidates", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--policy", default="reflex")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    with open(args.search_space_file) as f:
+        search_space = json.load(f)
+
+    result = successive_halving(search_space,
+                                metric=args.metric,
+                                maximize=not args.minimize,
+                                eta=args.eta,
+                                min_seeds=args.min_seeds,
+                                n_candidates=args.candidates,
+                                seed=args.seed,
+                                max_workers=args.workers,
+                                policy=args.policy)
+
+    if result["best"] is None:
+        print("""Every candidate failed, see the errors of the last round""")
+    else:
+        print(f"""Best {result["metric"]}={result["best"]["score"]} with {result["best"]["config"]}""")
+    print(f"""{result["runs"]} runs instead of {result["grid_search_runs"]} for a full grid search""")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, allow_nan=False)
@@ -0,0 +1,274 @@
+"""
+Module for grids too large to hold in memory, stored as tiles in a memory-mapped file
+"""
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from src.environment import DIRECTION_DX, DIRECTION_DY
+from constants import LOCATION_MARKERS, POPULATION_DENSITY
+
+# side of the square tiles, and how many tiles of every array stay in memory
+TILE_SIZE = 256
+MAX_HOT_TILES = 64
+
+class TiledArray:
+    """
+    (width, height) array cut into tile_size x tile_size tiles, stored in a
+    memory-mapped file and indexed by flat cell (x*H + y) like the grid.
+
+    The `max_tiles` most recently used tiles are held in memory, the least
+    recently used one is written back to the file when another is needed.
+    Tiles that were never written are holes of a sparse file, so memory and
+    disk both grow with the area that is used, not with the array.
+
+    Reads take a flat index or an array of them, writes a flat index.
+    """
+    def __init__(self, shape:tuple, dtype, tile_size:int = TILE_SIZE, max_tiles:int = MAX_HOT_TILES, directory:str = None):
+        self.width, self.height = shape
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tile_rows = -(-self.width // tile_size)
+        self.tile_columns = -(-self.height // tile_size)
+        self.n_tiles = self.tile_rows * self.tile_columns
+
+        fd, file_name = tempfile.mkstemp(suffix=".tiles", dir=directory)
+        os.close(fd)
+        self.store = np.memmap(file_name, dtype=self.dtype, mode="w+", shape=(self.n_tiles, tile_size, tile_size))
+        try:
+            # the mapping outlives the name, the space goes with the array
+            os.remove(file_name)
+        except OSError:
+            # Windows keeps mapped files
+            pass
+
+        self.hot = OrderedDict()
+        self.dirty = set()
+        # non-zero cells of every tile as last written back
+        self.nonzero = np.zeros(self.n_tiles, dtype=np.int64)
+        self.loads = 0
+        self.evictions = 0
+
+    def __tile_of__(self, x:int, y:int)->int:
+        return (x // self.tile_size) * self.tile_columns + y // self.tile_size
+
+    def __tile__(self, tile_id:int)->np.ndarray:
+        # the in-memory tile, paged in (and the coldest one out) when needed
+        tile = self.hot.get(tile_id)
+        if tile is not None:
+            self.hot.move_to_end(tile_id)
+            return tile
+        tile = self.__load__(tile_id)
+        self.loads += 1
+        self.hot[tile_id] = tile
+        if len(self.hot) > self.max_tiles:
+            self.__evict__()
+        return tile
+
+    def __load__(self, tile_id:int)->np.ndarray:
+        return np.array(self.store[tile_id])
+
+    def __evict__(self):
+        tile_id, tile = self.hot.popitem(last=False)
+        if tile_id in self.dirty:
+            self.store[tile_id] = tile
+            self.nonzero[tile_id] = np.count_nonzero(tile)
+            self.dirty.discard(tile_id)
+        self.evictions += 1
+
+    def __getitem__(self, index):
+        tile_size = self.tile_size
+        if isinstance(index, np.ndarray):
+            xs, ys = np.divmod(index, self.height)
+            tile_ids = (xs // tile_size) * self.tile_columns + ys // tile_size
+            first = int(tile_ids[0])
+            if (tile_ids == first).all():
+                # a neighbourhood almost always lies in one tile
+                return self.__tile__(first)[xs % tile_size, ys % tile_size]
+            values = np.empty(len(index), dtype=self.dtype)
+            for tile_id in np.unique(tile_ids).tolist():
+                in_tile = tile_ids == tile_id
+                values[in_tile] = self.__tile__(tile_id)[xs[in_tile] % tile_size, ys[in_tile] % tile_size]
+            return values
+        x, y = divmod(int(index), self.height)
+        return self.__tile__(self.__tile_of__(x, y))[x % tile_size, y % tile_size]
+
+    def __setitem__(self, index, value):
+        x, y = divmod(int(index), self.height)
+        tile_id = self.__tile_of__(x, y)
+        self.__tile__(tile_id)[x % self.tile_size, y % self.tile_size] = value
+        self.dirty.add(tile_id)
+
+    def __count_nonzero__(self)->int:
+        # written back tiles by their counts, hot tiles counted afresh
+        hot_ids = list(self.hot)
+        return int(self.nonzero.sum() - self.nonzero[hot_ids].sum()
+                   + sum(np.count_nonzero(tile) for tile in self.hot.values()))
+
+    def __hot_nbytes__(self)->int:
+        return len(self.hot) * self.tile_size * self.tile_size * self.dtype.itemsize
+
+class TiledGrid(TiledArray):
+    """
+    Location markers as a TiledArray, populated one tile at a time.
+
+    A tile is generated the first time it is paged in, from its own seeded
+    RandomState and the population density, so a run only pays for the
+    tiles it reaches and the same seed always gives the same map. Dirt and
+    obstacle counts are kept per tile.
+    """
+    def __init__(self, shape:tuple, population_density:dict, seed:int,
+                 tile_size:int = TILE_SIZE, max_tiles:int = MAX_HOT_TILES, directory:str = None):
+        super().__init__(shape, np.uint8, tile_size=tile_size, max_tiles=max_tiles, directory=directory)
+        self.population_density = population_density
+        self.seed = seed
+        self.generated = np.zeros(self.n_tiles, dtype=bool)
+        self.dirt_counts = np.zeros(self.n_tiles, dtype=np.int64)
+        self.obstacle_counts = np.zeros(self.n_tiles, dtype=np.int64)
+        self.initial_dirt_count = 0
+        self.initial_obstacle_count = 0
+        self.dirt_count = 0
+
+    def __load__(self, tile_id:int)->np.ndarray:
+        if self.generated[tile_id]:
+            return super().__load__(tile_id)
+        tile = self.__generate_tile__(tile_id)
+        self.generated[tile_id] = True
+        # only in memory so far
+        self.dirty.add(tile_id)
+        return tile
+
+    def __generate_tile__(self, tile_id:int)->np.ndarray:
+        # the same draw as Environment.__generate_random_obstacles_and_dirt__, within the tile
+        tile_x, tile_y = divmod(tile_id, self.tile_columns)
+        width = min(self.tile_size, self.width - tile_x * self.tile_size)
+        height = min(self.tile_size, self.height - tile_y * self.tile_size)
+        cells = width * height
+        max_obstacles = int(cells * self.population_density["OBSTACLES"])
+        max_dirt = int(cells * self.population_density["DIRT"])
+
+        rng = np.random.RandomState([self.seed, tile_id])
+        order = rng.permutation(cells)[:max_obstacles + max_dirt]
+        xs, ys = np.divmod(order, height)
+
+        tile = np.zeros((self.tile_size, self.tile_size), dtype=np.uint8)
+        tile[xs[:max_obstacles], ys[:max_obstacles]] = LOCATION_MARKERS["OBSTACLE"]
+        tile[xs[max_obstacles:], ys[max_obstacles:]] = LOCATION_MARKERS["DIRT"]
+
+        self.dirt_counts[tile_id] = max_dirt
+        self.obstacle_counts[tile_id] = max_obstacles
+        self.initial_dirt_count += max_dirt
+        self.initial_obstacle_count += max_obstacles
+        self.dirt_count += max_dirt
+        return tile
+
+    def __set_cell__(self, x:int, y:int, marker:int)->int:
+        # writes one marker, keeps the tile counts, returns the marker it replaced
+        tile_id = self.__tile_of__(x, y)
+        tile = self.__tile__(tile_id)
+        ox, oy = x % self.tile_size, y % self.tile_size
+        old_marker = int(tile[ox, oy])
+        tile[ox, oy] = marker
+        self.dirty.add(tile_id)
+
+        for counted, counts in ((LOCATION_MARKERS["DIRT"], self.dirt_counts), (LOCATION_MARKERS["OBSTACLE"], self.obstacle_counts)):
+            counts[tile_id] += (marker == counted) - (old_marker == counted)
+        self.dirt_count += (marker == LOCATION_MARKERS["DIRT"]) - (old_marker == LOCATION_MARKERS["DIRT"])
+        return old_marker
+
+class TiledPool:
+    """
+    BufferPool for runs on a TiledEnvironment: flat per-cell arrays of the
+    grid's size (the agent's maps) come back as TiledArrays, anything else
+    is allocated as usual.
+    """
+    def __init__(self, grid_size:dict, tile_size:int = TILE_SIZE, max_tiles:int = MAX_HOT_TILES, directory:str = None):
+        self.grid_size = dict(grid_size)
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.directory = directory
+        self.arrays = {}
+
+    def __take__(self, name:str, shape:tuple, dtype, fill=0):
+        if tuple(shape) != (self.grid_size["x"] * self.grid_size["y"],):
+            return np.full(shape, fill, dtype=dtype)
+        if fill != 0:
+            raise ValueError(f"""Tiled arrays start out zero, '{name}' asks for {fill}""")
+        array = TiledArray((self.grid_size["x"], self.grid_size["y"]), dtype,
+                           tile_size=self.tile_size, max_tiles=self.max_tiles, directory=self.directory)
+        self.arrays[name] = array
+        return array
+
+class TiledEnvironment:
+    """
+    Environment backed by a TiledGrid, for maps far larger than memory
+    (10^5 x 10^5 cells and beyond). It offers what the reflex Agent uses
+    (sensing, cell writes, dirt counts) and hands out a TiledPool for the
+    agent's own maps, so memory follows the tiles the agent works in.
+
+    Dirt counts cover the tiles generated so far: the grid only counts as
+    clean once every tile was generated and cleaned. There is no flat grid,
+    dirt index or nearest-dirt query.
+    """
+    def __init__(self,
+                 grid_size:dict,
+                 population_density:dict = None,
+                 seed:int = None,
+                 tile_size:int = TILE_SIZE,
+                 max_tiles:int = MAX_HOT_TILES,
+                 directory:str = None):
+        self.grid_size = {"x": grid_size["x"], "y": grid_size["y"]}
+        if seed is None:
+            seed = int(np.random.randint(0, 2**32, dtype=np.int64))
+        self.seed = seed
+        self.grid = TiledGrid((self.grid_size["x"], self.grid_size["y"]),
+                              population_density if population_density is not None else POPULATION_DENSITY,
+                              seed,
+                              tile_size=tile_size,
+                              max_tiles=max_tiles,
+                              directory=directory)
+        self.buffers = TiledPool(self.grid_size, tile_size=tile_size, max_tiles=max_tiles, directory=directory)
+
+        self.cell_listeners = []
+        self.neighbor_offsets = DIRECTION_DX * self.grid_size["y"] + DIRECTION_DY
+
+    def __get_neighbors__(self, x, y)->np.ndarray:
+        # as Environment.__get_neighbors__, without memoising border cells (there are too many)
+        if 0 < x < self.grid_size["x"] - 1 and 0 < y < self.grid_size["y"] - 1:
+            return self.neighbor_offsets + (x * self.grid_size["y"] + y)
+        return (np.clip(DIRECTION_DX + x, 0, self.grid_size["x"] - 1) * self.grid_size["y"]
+                + np.clip(DIRECTION_DY + y, 0, self.grid_size["y"] - 1))
+
+    def __sense__(self, x, y):
+        neighbors = self.__get_neighbors__(x, y)
+        return neighbors, self.grid[neighbors]
+
+    def __get_cell__(self, x, y):
+        return self.grid[x * self.grid_size["y"] + y]
+
+    def __set_cell__(self, x, y, marker):
+        old_marker = self.grid.__set_cell__(x, y, marker)
+        for listener in self.cell_listeners:
+            listener(x, y, old_marker, marker)
+
+    def __get_dirt_count__(self):
+        return self.grid.dirt_count
+
+    def __is_grid_clean__(self):
+        return self.grid.dirt_count == 0 and bool(self.grid.generated.all())
+
+    def __get_initial_dirt_count__(self)->int:
+        return self.grid.initial_dirt_count
+
+    def __get_initial_obstacle_count__(self)->int:
+        return self.grid.initial_obstacle_count
+
+    def __tile_stats__(self)->dict:
+        arrays = [self.grid] + list(self.buffers.arrays.values())
+        return {"tile_size": self.grid.tile_size,
+                "tiles": self.grid.n_tiles,
+                "tiles_generated": int(self.grid.generated.sum()),
+                "tile_loads": sum(array.loads for array in arrays),
+                "tile_evictions": sum(array.evictions for array in arrays),
+                "hot_bytes": sum(array.__hot_nbytes__() for array in arrays)}
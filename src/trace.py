@@ -0,0 +1,62 @@
+"""
+Module for recording a simulation trace that can be replayed later
+"""
+import numpy as np
+from src.events import CleanEvent
+
+class TraceRecorder:
+    """
+    Compact record of one run: the initial grid, the obstacle and dirt
+    layout, the path followed and every cleaning event (iteration, x, y).
+    Enough to rebuild any frame of the run without re-simulating it.
+    Subscribes to the CleanEvents of a run.
+
+    Frames are rebuilt from the grid, the layout and the path alone, since
+    plot_grid draws the initial dirt on every frame. The cleaning events
+    are kept for analysing a run from its trace (which spot was cleaned
+    when), load_trace returns them.
+    """
+    event_types = (CleanEvent,)
+    phase = "record"
+
+    def __init__(self, grid:np.ndarray, obstacles:np.ndarray, dirt:np.ndarray):
+        self.grid = np.array(grid, copy=True)
+        self.obstacles = np.array(obstacles, dtype=np.int32).reshape(-1, 2)
+        self.dirt = np.array(dirt, dtype=np.int32).reshape(-1, 2)
+        self.clean_events = []
+
+    def __on_event__(self, event:CleanEvent):
+        self.clean_events.append((event.step, event.x, event.y))
+
+    def __close__(self):
+        pass
+
+    def __checkpoint__(self)->dict:
+        return {"grid": self.grid,
+                "obstacles": self.obstacles,
+                "dirt": self.dirt,
+                "clean_events": np.array(self.clean_events, dtype=np.int64).reshape(-1, 3)}
+
+    def __restore__(self, state:dict):
+        self.grid = state["grid"]
+        self.obstacles = state["obstacles"]
+        self.dirt = state["dirt"]
+        self.clean_events = [tuple(event) for event in state["clean_events"].tolist()]
+
+    def __save__(self, file_name:str, path_followed:list):
+        np.savez_compressed(file_name,
+                            grid=self.grid,
+                            obstacles=self.obstacles,
+                            dirt=self.dirt,
+                            path=np.array(path_followed, dtype=np.int32).reshape(-1, 2),
+                            clean_events=np.array(self.clean_events, dtype=np.int32).reshape(-1, 3))
+
+def load_trace(file_name:str)->dict:
+    with np.load(file_name) as data:
+        return {
+            "grid": data["grid"],
+            "obstacles": [{"x": int(x), "y": int(y)} for x, y in data["obstacles"]],
+            "dirt": [{"x": int(x), "y": int(y)} for x, y in data["dirt"]],
+            "path": [(int(x), int(y)) for x, y in data["path"]],
+            "clean_events": [tuple(int(v) for v in event) for event in data["clean_events"]]
+        }
@@ -2,13 +2,19 @@
 Module for Data visualization
 """
 import os
-import seaborn as sns
+from collections import defaultdict
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from matplotlib import patches
-from PIL import Image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import Bbox
+from PIL import Image, GifImagePlugin
 import numpy as np
 
+GRID_COLORS = ['white', 'gray', 'blue', 'red', 'yellow', 'green']
+GRID_COLOR_INDEX = {color: index for index, color in enumerate(GRID_COLORS)}
+
 
 def plot_grid(environment, path_followed, obstacles, dirt, file_path, fig_name=""):
     grid = np.array(environment.grid_descriptor.__get_grid__())
@@ -39,7 +45,7 @@ def plot_grid(environment, path_followed, obstacles, dirt, file_path, fig_name="
         grid_color[obs["x"], obs["y"]] = color_map[gray]
 
     # Define start and end points
-    if path_followed:
+    if len(path_followed) > 0:
         start_point = path_followed[0]
         end_point = path_followed[-1]
         grid_color[start_point[0], start_point[1]] = color_map[yellow]
@@ -89,6 +95,256 @@ def plot_grid(environment, path_followed, obstacles, dirt, file_path, fig_name="
     plt.savefig(filename, bbox_inches='tight')
     plt.close()
 
+class GridRenderer:
+    """
+    Incremental version of plot_grid that keeps one canvas for the whole run.
+
+    The figure is laid out once, already cropped the way
+    savefig(bbox_inches='tight') crops it. Every frame then only redraws
+    the pixel region around the cells that changed since the previous
+    frame (the old and new agent cell), drawing every artist that touches
+    that region in plot_grid's z-order. Frames are pixel-identical to
+    plot_grid while each one costs O(changed cells) instead of O(steps).
+    """
+    def __init__(self, grid_shape:tuple, obstacles:list, dirt:list):
+        self.grid_shape = grid_shape
+
+        self.base_color = np.full(grid_shape, GRID_COLOR_INDEX['white'], dtype=int)
+        for obs in obstacles:
+            self.base_color[obs["x"], obs["y"]] = GRID_COLOR_INDEX['gray']
+        self.grid_color = self.base_color.copy()
+
+        self.dirt_cells = defaultdict(int)
+        for d in dirt:
+            self.dirt_cells[(d["x"], d["y"])] += 1
+
+        # path indices at which every cell was visited
+        self.visits = defaultdict(list)
+        self.path_length = 0
+        self.start_point = None
+        self.end_point = None
+
+        self.figure = Figure(figsize=(5, 5))  # 500x500 pixels
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.gca()
+
+        custom_cmap = mcolors.ListedColormap(GRID_COLORS)
+        norm = mcolors.BoundaryNorm([0, 1, 2, 3, 4, 5], custom_cmap.N)
+        self.image = self.axes.imshow(self.grid_color, cmap=custom_cmap, norm=norm, interpolation='nearest')
+        self.axes.set_xticks([])
+        self.axes.set_yticks([])
+
+        # static layer: dirt markers never change
+        self.dirt_patches = {}
+        for (x, y), count in self.dirt_cells.items():
+            self.dirt_patches[(x, y)] = [self.__attach__(plt.Circle((y, x), 0.3, color='red', zorder=2))
+                                         for _ in range(count)]
+            for circle in self.dirt_patches[(x, y)]:
+                self.axes.add_patch(circle)
+
+        self.axes.set_title('Agent Grid with Path and Dirt')
+        self.axes.invert_yaxis()  # To match typical grid orientation
+        self.axes.set_autoscale_on(False)
+
+        # crop the canvas the way savefig(bbox_inches='tight') does, once: the figure
+        # shrinks to the padded tight box, the axes keep the pixels they had, measured
+        # from the box's corner in savefig's own arithmetic, and the aspect is fixed
+        # from then on, since the position already honours it
+        self.canvas.draw()
+        renderer = self.canvas.get_renderer()
+        bbox_inches = self.figure.get_tightbbox(renderer).padded(plt.rcParams['savefig.pad_inches'])
+        dpi = self.figure.dpi
+        box = Bbox.from_bounds(-bbox_inches.x0 * dpi, -bbox_inches.y0 * dpi, self.figure.bbox.width, self.figure.bbox.height)
+        position = self.axes.get_position(original=False)
+        self.figure.set_size_inches(bbox_inches.width, bbox_inches.height)
+        width, height = self.figure.bbox.width, self.figure.bbox.height
+        self.axes.set_position(Bbox.from_extents((position.x0 * box.width + box.x0) / width,
+                                                 (position.y0 * box.height + box.y0) / height,
+                                                 (position.x1 * box.width + box.x0) / width,
+                                                 (position.y1 * box.height + box.y0) / height))
+        self.axes.set_aspect('auto')
+        self.canvas.draw()
+
+        # from here on the dirt markers are only drawn into redrawn regions
+        for circles in self.dirt_patches.values():
+            for circle in circles:
+                circle.remove()
+                self.__attach__(circle)
+
+    def __attach__(self, artist):
+        artist.axes = self.axes
+        artist.set_figure(self.figure)
+        artist.set_transform(self.axes.transData)
+        artist.set_clip_path(self.axes.patch)
+        return artist
+
+    def __update__(self, path_followed:list):
+        if len(path_followed) == 0:
+            return
+        changed = set()
+        for index in range(self.path_length, len(path_followed)):
+            cell = (int(path_followed[index][0]), int(path_followed[index][1]))
+            self.visits[cell].append(index)
+            changed.add(cell)
+        self.path_length = len(path_followed)
+
+        if self.start_point is None:
+            self.start_point = (int(path_followed[0][0]), int(path_followed[0][1]))
+        if self.end_point is not None:
+            changed.add(self.end_point)
+            self.grid_color[self.end_point] = self.base_color[self.end_point]
+        self.end_point = (int(path_followed[-1][0]), int(path_followed[-1][1]))
+
+        self.grid_color[self.start_point] = GRID_COLOR_INDEX['yellow']
+        self.grid_color[self.end_point] = GRID_COLOR_INDEX['green']
+        self.image.set_data(self.grid_color)
+
+        if changed:
+            self.__redraw_cells__(changed)
+
+    def __redraw_cells__(self, cells:set):
+        # redraw one cell of margin around the changed cells, so antialiasing that
+        # bleeds over cell borders is covered, and take the artists of one more
+        # ring of cells into account since they can bleed into that margin
+        x_min = min(x for x, _ in cells) - 1
+        x_max = max(x for x, _ in cells) + 1
+        y_min = min(y for _, y in cells) - 1
+        y_max = max(y for _, y in cells) + 1
+
+        corners = self.axes.transData.transform([(y_min - 0.5, x_min - 0.5), (y_max + 0.5, x_max + 0.5)])
+        region = Bbox.from_extents(np.floor(corners[:, 0].min()), np.floor(corners[:, 1].min()),
+                                   np.ceil(corners[:, 0].max()), np.ceil(corners[:, 1].max()))
+
+        x_min, x_max = max(x_min - 1, 0), min(x_max + 1, self.grid_shape[0] - 1)
+        y_min, y_max = max(y_min - 1, 0), min(y_max + 1, self.grid_shape[1] - 1)
+        region_cells = [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+        # yellow/green squares exist once per visit of the start/end cell, in path order
+        rects = []
+        for cell in {self.start_point, self.end_point}:
+            if x_min <= cell[0] <= x_max and y_min <= cell[1] <= y_max:
+                color = GRID_COLORS[self.grid_color[cell]]
+                for index in self.visits[cell]:
+                    rects.append((index, self.__attach__(patches.Rectangle((cell[1] - 0.5, cell[0] - 0.5), 1, 1,
+                                                                           linewidth=0, edgecolor='none',
+                                                                           facecolor=color, zorder=1))))
+        rects.sort(key=lambda entry: entry[0])
+
+        dirt = []
+        path = []
+        for cell in region_cells:
+            if cell in self.dirt_patches and self.grid_color[cell] != GRID_COLOR_INDEX['gray']:
+                dirt.extend(self.dirt_patches[cell])
+            for _ in self.visits.get(cell, ()):
+                path.append(self.__attach__(plt.Circle((cell[1], cell[0]), 0.15, color='blue', zorder=3)))
+
+        renderer = self.canvas.get_renderer()
+
+        # the image is resampled over its clip box, so it is always drawn whole
+        # and only its pixels inside the region are kept
+        saved = renderer.copy_from_bbox(self.figure.bbox)
+        for artist in (self.figure.patch, self.axes.patch, self.image):
+            artist.draw(renderer)
+        background = renderer.copy_from_bbox(region)
+        renderer.restore_region(saved)
+        renderer.restore_region(background)
+
+        artists = [rect for _, rect in rects]
+        artists += dirt
+        artists += list(self.axes.spines.values())
+        artists += path
+        artists += [self.axes.title]
+
+        for artist in artists:
+            clip_on, clip_box = artist.get_clip_on(), artist.get_clip_box()
+            artist.set_clip_on(True)
+            artist.set_clip_box(Bbox.intersection(region, clip_box) if clip_on and clip_box is not None else region)
+            artist.draw(renderer)
+            artist.set_clip_on(clip_on)
+            artist.set_clip_box(clip_box)
+
+    def __get_frame__(self)->np.ndarray:
+        return np.asarray(self.canvas.buffer_rgba()).copy()
+
+    def __save_frame__(self, file_path, fig_name=""):
+        filename = f"{file_path}/step_{fig_name:03d}.png"  # Step number with leading zeros
+        Image.fromarray(self.__get_frame__()).save(filename)
+
+class GifStreamWriter:
+    """
+    Writes an animated GIF one frame at a time.
+
+    Only the previous frame is kept in memory. Each new frame is cropped to
+    the bounding box of the pixels that changed and written as a sub-image
+    with its own palette, so memory stays bounded and the file small. A
+    writer closed without frames removes its file.
+    """
+    def __init__(self, file_name:str, duration:int = 500, loop:int = 0):
+        self.file_name = file_name
+        self.duration = duration
+        self.loop = loop
+        self.previous_frame = None
+        self.frame_count = 0
+        self.fp = open(file_name, "wb")
+
+    def __write_frame__(self, frame:np.ndarray, step:int = 0):
+        frame = frame[:, :, :3]
+        if self.previous_frame is None:
+            image = Image.fromarray(frame).quantize(256, method=Image.Quantize.FASTOCTREE)
+            header, _ = GifImagePlugin.getheader(image, info={"loop": self.loop, "duration": self.duration})
+            for block in header:
+                self.fp.write(block)
+            offset = (0, 0)
+        else:
+            changed_rows, changed_cols = np.nonzero((frame != self.previous_frame).any(axis=2))
+            if len(changed_rows) == 0:
+                # repeat the last frame, a single unchanged pixel keeps the timing
+                changed_rows, changed_cols = np.array([0]), np.array([0])
+            top, bottom = changed_rows.min(), changed_rows.max() + 1
+            left, right = changed_cols.min(), changed_cols.max() + 1
+            image = Image.fromarray(frame[top:bottom, left:right]).quantize(256, method=Image.Quantize.FASTOCTREE)
+            offset = (int(left), int(top))
+
+        # disposal 1 keeps the previous frame underneath the changed region
+        for block in GifImagePlugin.getdata(image, offset=offset, duration=self.duration,
+                                            disposal=1, include_color_table=True):
+            self.fp.write(block)
+
+        self.previous_frame = frame.copy()
+        self.frame_count += 1
+
+    def __close__(self):
+        if self.fp.closed:
+            return
+        if self.frame_count == 0:
+            # a trailer alone is not a GIF, leave no file rather than an unreadable one
+            self.fp.close()
+            os.remove(self.file_name)
+            return
+        self.fp.write(b";")  # GIF trailer
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__close__()
+
+class PngFrameWriter:
+    """
+    Keeps every frame as a PNG, named like the plot_grid output.
+    """
+    def __init__(self, file_path:str):
+        self.file_path = file_path
+        os.makedirs(file_path, exist_ok=True)
+
+    def __write_frame__(self, frame:np.ndarray, step:int = 0):
+        filename = f"{self.file_path}/step_{step:03d}.png"  # Step number with leading zeros
+        Image.fromarray(frame).save(filename)
+
+    def __close__(self):
+        pass
+
 def create_gif(image_folder, gif_folder,gif_filename):
     images = []
     for filename in sorted(os.listdir(image_folder)):
@@ -99,7 +355,7 @@ def create_gif(image_folder, gif_folder,gif_filename):
     if images:
         images[0].save(f"""{gif_folder}/{gif_filename}""", save_all=True, append_images=images[1:], duration=500, loop=0)
 
-def plot_energy_expenditure_per_step(energy_expenditure):
+def plot_energy_expenditure_per_step(energy_expenditure, file_path:str=None):
     time = list(range(len(energy_expenditure)))  # Generate time based on the array length
     avg_energy = sum(energy_expenditure) / len(energy_expenditure)  # Calculate average energy expenditure
     
@@ -115,9 +371,9 @@ def plot_energy_expenditure_per_step(energy_expenditure):
     plt.ylim(ymin=0)  # Set the minimum y value to 0
     plt.grid(True)
     plt.legend()  # Add legend for better clarity
-    plt.show()
+    __finish_plot__(file_path)
 
-def plot_battery_usage(battery_usage):
+def plot_battery_usage(battery_usage, file_path:str=None):
     time = list(range(len(battery_usage)))  # Generate time based on the array length
     plt.figure()
     plt.plot(time, battery_usage, 'b-', label='Battery Usage')
@@ -126,9 +382,9 @@ def plot_battery_usage(battery_usage):
     plt.ylim(ymin=0)
     plt.title('Battery Usage Over Time')
     plt.grid(True)
-    plt.show()
+    __finish_plot__(file_path)
 
-def plot_steps_to_clean(steps_to_clean):
+def plot_steps_to_clean(steps_to_clean, file_path:str=None):
     plt.figure()
     plt.plot(range(len(steps_to_clean)), steps_to_clean, linestyle='-', color='b')  # Removed 'marker'
     plt.xlabel('Dirt Spot Index')
@@ -142,9 +398,9 @@ def plot_steps_to_clean(steps_to_clean):
     plt.xticks(ticks=range(0, num_spots, tick_frequency))  # Adjust x-ticks
 
     plt.grid(True)
-    plt.show()
+    __finish_plot__(file_path)
 
-def plot_dirt_spots_left(dirt_spots_left):
+def plot_dirt_spots_left(dirt_spots_left, file_path:str=None):
     plt.figure()
     plt.plot(range(len(dirt_spots_left)), dirt_spots_left, linestyle='-', color='r')  # Line graph
     plt.xlabel('Time (Iteration)')
@@ -159,4 +415,12 @@ def plot_dirt_spots_left(dirt_spots_left):
     plt.xticks(ticks=range(0, num_iterations, tick_frequency))  # Adjust x-ticks
 
     plt.grid(True)
-    plt.show()
\ No newline at end of file
+    __finish_plot__(file_path)
+
+def __finish_plot__(file_path:str=None):
+    # shown for interactive runs, saved and closed when a file is given, so headless runs never block
+    if file_path is None:
+        plt.show()
+    else:
+        plt.savefig(file_path, bbox_inches='tight')
+        plt.close()